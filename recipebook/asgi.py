@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "recipebook.settings")
+# No persistent database connections under ASGI, see settings.DATABASES.
+os.environ.setdefault("RECIPEBOOK_SERVER", "asgi")
 
 application = get_asgi_application()
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from django.urls import reverse_lazy
 
@@ -35,8 +36,13 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "recipes.replicas.ReplicaStickinessMiddleware",
 ]
 
+if DEBUG:
+    # Logs SQL repeated within a request (N+1 loops), see recipes/querybudget.py.
+    MIDDLEWARE.append("recipes.querybudget.DuplicateQueryMiddleware")
+
 ROOT_URLCONF = "recipebook.urls"
 
 LOGIN_REDIRECT_URL = "recipes:recipe_list"  # or: reverse_lazy("recipes:recipe_list")
@@ -69,9 +75,39 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        # Reuse connections across requests instead of reconnecting (and
+        # re-running the pragmas) every time -- under WSGI only. Under ASGI
+        # each request's queries run in a thread of their own, out of reach
+        # of the end-of-request cleanup, so kept connections would pile up;
+        # recipebook/asgi.py sets RECIPEBOOK_SERVER to turn this off.
+        "CONN_MAX_AGE": 0 if os.environ.get("RECIPEBOOK_SERVER") == "asgi" else 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # Writers take the lock when their transaction starts, so a busy
+            # database makes them wait (busy_timeout) rather than fail.
+            "transaction_mode": "IMMEDIATE",
+        },
+    },
+}
+# A local stand-in for a read replica: a copy of db.sqlite3 refreshed with
+# `python manage.py sync_replica`.
+DATABASES["replica"] = {
+    **DATABASES["default"],
+    "NAME": BASE_DIR / "db.replica.sqlite3",
 }
 
+# Aliases the read-only views read from, see recipes/replicas.py. To try
+# the local replica, run sync_replica and list "replica" here. (Don't go by
+# the file existing: any command that opens the alias creates it empty.)
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ["recipes.replicas.ReplicaRouter"]
+# How long a visitor reads from the primary after a write.
+REPLICA_STICKY_SECONDS = 10
+
+# Changes to the PRAGMAs run on every new SQLite connection: values
+# replace those of recipes.sqlite.DEFAULT_PRAGMAS, None drops one.
+SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
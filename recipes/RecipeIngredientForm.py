@@ -5,25 +5,31 @@ from django.forms import ModelChoiceField, ChoiceField
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Div
 
+from .choices import CachedModelChoiceField
 from .models import RecipeIngredient
+from .widgets import AutocompleteSelect
 
 
 class RecipeIngredientForm(forms.ModelForm):
     class Meta:
         model = RecipeIngredient
         fields = ["ingredient", "quantity", "unit"]
+        # Labels for selected ingredients come from the shared snapshot
+        field_classes = {"ingredient": CachedModelChoiceField}
         labels = {
             "ingredient": "Ingredient",
             "quantity": "Quantity",
             "unit": "Unit",
         }
         widgets = {
-            # Select2 is initialized globally in base.html
-            "ingredient": forms.Select(
+            # Select2 is initialized globally in base.html; options are
+            # fetched from the autocomplete endpoint.
+            "ingredient": AutocompleteSelect(
+                "recipes:ingredient_autocomplete",
                 attrs={
                     "class": "form-control select2",
                     "data-placeholder": "— Select ingredient —",
-                }
+                },
             ),
             "quantity": forms.NumberInput(
                 attrs={"class": "form-control", "step": "any", "min": 0}
@@ -60,6 +66,11 @@ class RecipeIngredientForm(forms.ModelForm):
             )
         )
 
+    def _get_validation_exclusions(self):
+        # The ingredient field already checked the row exists; skip the
+        # model's second lookup per line.
+        return super()._get_validation_exclusions() | {"ingredient"}
+
     def clean_quantity(self):
         value = self.cleaned_data.get("quantity")
         if value in (None, ""):
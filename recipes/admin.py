@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
+from django.utils import timezone
 from django.utils.html import format_html
 
-from .models import Recipe, Category, Tag, Ingredient, RecipeIngredient
+from . import jobs
+from .models import ImageJob, Recipe, Category, Tag, Ingredient, RecipeIngredient
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -13,14 +16,22 @@ class RecipeIngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("title", "author", "category", "cooking_time", "cooking_time_unit")
+    list_display = (
+        "title",
+        "author",
+        "category",
+        "ingredient_count",
+        "cooking_time",
+        "cooking_time_unit",
+    )
     list_filter = ("category", "tags")
+    list_select_related = ("author", "category")
     search_fields = ("title", "story", "description", "instructions")
     autocomplete_fields = ("author", "category")
     filter_horizontal = ("tags",)
     inlines = [RecipeIngredientInline]
 
-    readonly_fields = ("image_preview",)
+    readonly_fields = ("image_preview", "image_status")
     fields = (
         "title",
         "author",
@@ -32,6 +43,7 @@ class RecipeAdmin(admin.ModelAdmin):
         "tags",
         "image",
         "image_preview",
+        "image_status",
     )
 
     def image_preview(self, obj):
@@ -46,6 +58,17 @@ class RecipeAdmin(admin.ModelAdmin):
 
     image_preview.short_description = "Image preview"
 
+    def image_status(self, obj):
+        job = obj.image_jobs.order_by("-pk").first() if obj and obj.pk else None
+        if job is None:
+            return "-"
+        status = f"{job.get_status_display()} (attempts: {job.attempts})"
+        if job.last_error:
+            status += f": {job.last_error}"
+        return status
+
+    image_status.short_description = "Thumbnails"
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -60,3 +83,21 @@ class TagAdmin(admin.ModelAdmin):
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     search_fields = ("name",)
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ("image", "recipe", "status", "attempts", "updated_at")
+    list_filter = ("status",)
+    list_select_related = ("recipe",)
+    search_fields = ("image", "recipe__title")
+    readonly_fields = [f.name for f in ImageJob._meta.fields]
+    actions = ["retry"]
+
+    @admin.action(description="Retry selected jobs")
+    def retry(self, request, queryset):
+        count = queryset.exclude(status=ImageJob.RUNNING).update(
+            status=ImageJob.PENDING, attempts=0, run_after=timezone.now()
+        )
+        transaction.on_commit(jobs.worker.wake)
+        self.message_user(request, f"{count} job(s) queued again.")
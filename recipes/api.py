@@ -0,0 +1,209 @@
+"""
+JSON API for recipes.
+
+Responses are built from single-table ``values()`` rows (author, category
+and tags come from the summary columns, see summaries.py) plus one batched
+query for ingredient lines (shared with exporting.py), never from model
+instances or templates. ``?fields=title,tags`` limits both the output and
+the columns read; ``id`` is always included. Every response carries a
+strong ETag over its body, so a client revalidating with If-None-Match
+gets an empty 304 when nothing changed.
+
+Writes go through write_batch(): many recipes per request, in the shape
+import_recipes reads, validated like an import and written by the same
+BulkImporter in one transaction. Programs authenticate with HTTP Basic
+(``Authorization: Basic base64(username:password)``) and need no CSRF
+token; browser sessions must send the CSRF token like any form POST.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+
+from django.contrib.auth import authenticate
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from .exporting import aingredient_lines
+from .importing import BulkImporter
+from .normalization import prepare_recipe_item
+from .pagination import KeysetPaginator
+from .storage import image_storage
+
+# Output field -> the values() column it is read from; None for the one
+# filled in by a batched lookup.
+FIELDS = {
+    "id": "id",
+    "title": "title",
+    "story": "story",
+    "description": "description",
+    "instructions": "instructions",
+    "cooking_time": "cooking_time",
+    "cooking_time_unit": "cooking_time_unit",
+    "category": "category_name",
+    "author": "author_name",
+    "image": "image",
+    "image_widths": "image_widths",
+    "tags": "tag_names",
+    "ingredients": None,
+}
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Recipes accepted per batch write request.
+MAX_BATCH = 1000
+
+
+def parse_fields(value):
+    """The requested output fields, in FIELDS order; ValueError on unknown ones."""
+    if not value:
+        return list(FIELDS)
+    wanted = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = wanted - FIELDS.keys()
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in FIELDS if name == "id" or name in wanted]
+
+
+def parse_limit(value):
+    try:
+        limit = int(value) if value else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("limit must be a number")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def recipe_values(queryset, fields):
+    """values() queryset reading just the columns behind these fields."""
+    columns = [FIELDS[name] for name in fields if FIELDS[name]]
+    if "search_rank" in queryset.query.annotations:
+        # The keyset cursor of a search result needs the rank.
+        columns.append("search_rank")
+    return queryset.values(*columns)
+
+
+async def aserialize(rows, fields, using="default"):
+    """Output dicts for values() rows, with ingredient lines batched in."""
+    ids = [row["id"] for row in rows]
+    lines = await aingredient_lines(ids, using) if "ingredients" in fields else {}
+    items = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            if name == "ingredients":
+                item[name] = lines[row["id"]]
+            elif name == "image":
+                item[name] = image_storage.url(row["image"]) if row["image"] else None
+            elif name == "description":
+                item[name] = row["description"] or ""
+            elif name == "category":
+                item[name] = row["category_name"] or None
+            else:
+                item[name] = row[FIELDS[name]]
+        items.append(item)
+    return items
+
+
+async def arecipe_page(queryset, fields, limit, after=None, before=None):
+    """{"results", "next", "previous"} for one keyset page of the queryset."""
+    page = await KeysetPaginator(recipe_values(queryset, fields), limit).aget_page(
+        after=after, before=before
+    )
+    return {
+        "results": await aserialize(page.object_list, fields, queryset.db),
+        "next": page.next_cursor,
+        "previous": page.previous_cursor,
+    }
+
+
+def json_response(request, data, status=200):
+    """JSON with a strong ETag; 304 when the client already has this body."""
+    body = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+    response = HttpResponse(body, content_type="application/json", status=status)
+    if status == 200:
+        response["ETag"] = quote_etag(hashlib.sha256(body).hexdigest())
+        # Cacheable, but always revalidated: the ETag makes that cheap.
+        patch_cache_control(response, no_cache=True)
+        response = get_conditional_response(
+            request, etag=response["ETag"], response=response
+        )
+    return response
+
+
+def basic_auth_user(request):
+    """
+    (credentials sent, user or None) from an ``Authorization: Basic``
+    header; wrong or malformed credentials give (True, None).
+    """
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "basic":
+        return False, None
+    try:
+        decoded = base64.b64decode(credentials.strip(), validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        return True, None
+    username, colon, password = decoded.partition(":")
+    if not colon:
+        return True, None
+    user = authenticate(request, username=username, password=password)
+    return True, user if user is not None and user.is_active else None
+
+
+def batch_items(payload):
+    """
+    The list of recipe objects of a batch body (a list, or {"recipes":
+    list}), or raise ValueError describing what is wrong with its shape.
+    """
+    if isinstance(payload, dict):
+        extra = sorted(set(payload) - {"recipes"})
+        if extra:
+            raise ValueError(f"unexpected keys: {', '.join(extra)}")
+        payload = payload.get("recipes")
+    if not isinstance(payload, list):
+        raise ValueError("expected a list of recipes")
+    if len(payload) > MAX_BATCH:
+        raise ValueError(f"at most {MAX_BATCH} recipes per request")
+    for index, item in enumerate(payload):
+        if not isinstance(item, dict):
+            raise ValueError(f"recipe {index} is not an object")
+    return payload
+
+
+def write_batch(raw_items, author, update=False):
+    """
+    Validate every item, then create (or with ``update``, update) the valid
+    ones as ``author`` in a single transaction. Invalid items are reported
+    by their index and don't stop the rest. Only the author's own recipes
+    are ever matched and updated.
+    """
+    items, errors = [], []
+    for index, raw in enumerate(raw_items):
+        item, item_errors = prepare_recipe_item(raw)
+        if item_errors:
+            errors.append(
+                {
+                    "index": index,
+                    "title": item.get("title"),
+                    "errors": [f"{field}: {message}" for field, message in item_errors],
+                }
+            )
+        else:
+            items.append(item)
+
+    importer = BulkImporter(author, update=update, own_only=True)
+    if items:
+        with transaction.atomic(using=importer.using):
+            importer.import_chunk(items)
+    return {
+        "created": importer.created,
+        "updated": importer.updated,
+        "unchanged": importer.unchanged,
+        "skipped": importer.skipped,
+        "invalid": len(errors),
+        "errors": errors,
+    }
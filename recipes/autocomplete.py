@@ -0,0 +1,57 @@
+import bisect
+
+from .choices import get_snapshot
+
+
+class PrefixIndex:
+    """
+    Sorted array of (casefolded key, name, pk) searched with bisect.
+
+    Every word of a name is indexed, so "flo" finds both "Flour" and
+    "Wheat flour".
+    """
+
+    def __init__(self, rows):
+        entries = []
+        for pk, name in rows:
+            words = name.casefold().split()
+            for i in range(len(words)):
+                entries.append((" ".join(words[i:]), name, pk))
+        entries.sort()
+        self._keys = [key for key, _, _ in entries]
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, prefix, limit=20):
+        prefix = " ".join(prefix.casefold().split())
+        if not prefix:
+            return []
+        results, seen = [], set()
+        start = bisect.bisect_left(self._keys, prefix)
+        for key, name, pk in self._entries[start:]:
+            if not key.startswith(prefix):
+                break
+            if pk in seen:
+                continue
+            seen.add(pk)
+            results.append((pk, name))
+            if len(results) >= limit * 3:
+                break
+        # Whole-name matches first, then alphabetical.
+        results.sort(key=lambda r: (not r[1].casefold().startswith(prefix), r[1]))
+        return results[:limit]
+
+
+_indexes = {}
+
+
+def get_index(model):
+    """Return the prefix index over model's current choice snapshot."""
+    snapshot = get_snapshot(model)
+    cached = _indexes.get(model)
+    if cached is None or cached[0] is not snapshot:
+        cached = (snapshot, PrefixIndex(snapshot.choices))
+        _indexes[model] = cached
+    return cached[1]
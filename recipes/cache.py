@@ -0,0 +1,46 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+# Generation counters: readers key their cached data on the current
+# generation, writers bump it, so stale entries are simply never read again.
+# Shared between processes when CACHES points at a shared backend
+# (memcached, redis, database); with the default LocMemCache each process
+# only sees its own bumps.
+GENERATION_KEY = "recipes:generation:{}"
+
+
+def get_generation(name):
+    key = GENERATION_KEY.format(name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_generation(name):
+    key = GENERATION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing (never read, or evicted): any fresh value invalidates.
+        cache.add(key, 1, timeout=None)
+        return cache.incr(key)
+
+
+async def acached(prefix, generations, parts, compute, timeout):
+    """
+    ``await compute()``, cached under prefix, a digest of parts and the
+    current values of the named generations: a bump of any of them (or
+    the timeout) makes the next call compute it again.
+    """
+    values = await sync_to_async(lambda: [get_generation(n) for n in generations])()
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()
+    key = f"{prefix}:{':'.join(map(str, values))}:{digest}"
+    value = await cache.aget(key)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    return value
@@ -0,0 +1,81 @@
+"""
+Rendered recipe cards for the list and profile pages, cached per recipe.
+
+A card's key holds the recipe id and its updated_at, which save() and the
+receivers in signals.py bump on every change a card shows (title, image,
+tags, category, author), so an edited recipe gets a new key and its old
+card simply ages out. Pages read just (id, updated_at, author_id) of
+their rows, fetch all cards with one get_many(), and load and render only
+the misses, from the recipe table alone (the summary columns, see
+summaries.py, stand in for author, category and tags).
+
+Cards hold nothing visitor-specific: Edit/Delete links stay in the pages.
+"""
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Recipe
+
+CARD_TEMPLATE = "recipes/_recipe_card.html"
+
+# Bump when _recipe_card.html changes, so old markup isn't served on deploy.
+CARD_VERSION = 2
+CARD_TIMEOUT = 60 * 60 * 24
+
+# The columns _recipe_card.html reads.
+CARD_FIELDS = (
+    "title",
+    "image",
+    "image_widths",
+    "cooking_time",
+    "cooking_time_unit",
+    "author_name",
+    "category_name",
+    "tag_names",
+    "updated_at",
+)
+
+# Page -> what its cards show.
+VARIANTS = {
+    "list": {"show_author": True, "show_tags": True},
+    "profile": {"show_author": False, "show_tags": False},
+}
+
+
+def card_key(variant, pk, updated_at):
+    return f"recipes:card:{CARD_VERSION}:{variant}:{pk}:{updated_at.timestamp()}"
+
+
+def card_rows(queryset):
+    """The queryset reduced to what a card page reads before the cache."""
+    # cooking_minutes: the cursors of the list sorted by time.
+    return (
+        queryset.select_related(None)
+        .prefetch_related(None)
+        .only("updated_at", "author_id", "cooking_minutes")
+    )
+
+
+def _render(recipe, variant):
+    return render_to_string(CARD_TEMPLATE, {"recipe": recipe, **VARIANTS[variant]})
+
+
+async def attach_cards(rows, variant):
+    """Set ``row.card`` to the rendered card of each card_rows() row."""
+    keys = {row.pk: card_key(variant, row.pk, row.updated_at) for row in rows}
+    cards = await cache.aget_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cards]
+    if missing:
+        recipes = Recipe.objects.filter(pk__in=missing).only(*CARD_FIELDS)
+        fresh = {}
+        async for recipe in recipes:
+            # Keyed by the version just read, which may be newer than the row's.
+            html = _render(recipe, variant)
+            fresh[card_key(variant, recipe.pk, recipe.updated_at)] = html
+            cards[keys[recipe.pk]] = html
+        await cache.aset_many(fresh, CARD_TIMEOUT)
+    for row in rows:
+        # A recipe deleted since the page query just renders no card.
+        row.card = mark_safe(cards.get(keys[row.pk], ""))
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from django.forms import ModelChoiceField, ModelMultipleChoiceField
+from django.forms.models import ModelChoiceIterator, ModelChoiceIteratorValue
+
+from .cache import get_generation
+
+# Rebuild at least this often even without a generation bump, so processes
+# that don't share a cache backend still converge.
+SNAPSHOT_MAX_AGE = 300
+
+
+def generation_name(model):
+    return model._meta.label_lower
+
+
+class ChoiceSnapshot:
+    """All (pk, label) pairs of a lookup table, loaded with one query."""
+
+    def __init__(self, model, generation):
+        self.model = model
+        self.generation = generation
+        self.built_at = time.monotonic()
+        self.choices = [(obj.pk, str(obj)) for obj in model._default_manager.all()]
+        self.labels = {str(pk): label for pk, label in self.choices}
+
+    def is_stale(self, generation):
+        return (
+            generation != self.generation
+            or time.monotonic() - self.built_at > SNAPSHOT_MAX_AGE
+        )
+
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def get_snapshot(model):
+    """Per-process snapshot of model's choices for the current generation."""
+    generation = get_generation(generation_name(model))
+    snapshot = _snapshots.get(model)
+    if snapshot is None or snapshot.is_stale(generation):
+        with _lock:
+            snapshot = ChoiceSnapshot(model, generation)
+            _snapshots[model] = snapshot
+    return snapshot
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """
+    Yields choices from the shared snapshot instead of running the
+    field's queryset, so every form in a formset reuses one list.
+    """
+
+    @property
+    def snapshot(self):
+        return get_snapshot(self.queryset.model)
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for pk, label in self.snapshot.choices:
+            yield (ModelChoiceIteratorValue(pk, None), label)
+
+    def __len__(self):
+        return len(self.snapshot.choices) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.snapshot.choices)
+
+
+class PrefetchedChoiceMixin:
+    """
+    Looks submitted pks up in ``prefetched`` (str(pk) -> object) before
+    querying for each one; a formset fills it for all its forms at once.
+    """
+
+    prefetched = None
+
+    def to_python(self, value):
+        if self.prefetched and isinstance(value, str) and value in self.prefetched:
+            return self.prefetched[value]
+        return super().to_python(value)
+
+
+class PrefetchedModelChoiceField(PrefetchedChoiceMixin, ModelChoiceField):
+    pass
+
+
+# Only for fields whose queryset is the model's whole table: rendering
+# ignores queryset filters (validation still uses the queryset).
+class CachedModelChoiceField(PrefetchedChoiceMixin, ModelChoiceField):
+    iterator = CachedModelChoiceIterator
+
+
+class CachedModelMultipleChoiceField(ModelMultipleChoiceField):
+    iterator = CachedModelChoiceIterator
@@ -0,0 +1,104 @@
+"""
+Conditional GET for the HTML pages.
+
+Validators come from Recipe.updated_at with at most one indexed query:
+the detail page reads its row by primary key; list and profile pages read
+the (id, updated_at) rows of the requested page, which they need anyway
+to look up the cached cards, so new, changed and deleted recipes on that
+page all change the ETag, as does a page gaining or losing its
+next/previous links.
+
+Pages differ per visitor (the header, Edit links, CSRF tokens), so the
+session and CSRF cookies are part of every ETag and responses are
+``Cache-Control: private, no-cache`` with ``Vary: Cookie``. A pending
+flash message (in the messages cookie or the session) disables the ETag:
+it must be rendered, and the page showing it must not be revalidated.
+"""
+
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from .cards import CARD_VERSION
+from .models import Recipe
+
+
+async def amessages_pending(request):
+    """Whether the request's message storage holds messages to show."""
+    if CookieStorage.cookie_name in request.COOKIES:
+        return True
+    storage = getattr(request, "_messages", None)
+    # Loading falls back to the session, which may need a query.
+    return storage is not None and await sync_to_async(len)(storage) > 0
+
+
+async def apage_etag(request, *parts):
+    """
+    Strong ETag over the page identity, the visitor's cookies and parts;
+    None while a flash message is pending.
+    """
+    if await amessages_pending(request):
+        return None
+    cookies = request.COOKIES
+    key = [
+        request.get_full_path(),
+        cookies.get(settings.SESSION_COOKIE_NAME, ""),
+        cookies.get(settings.CSRF_COOKIE_NAME, ""),
+        *map(str, parts),
+    ]
+    return quote_etag(hashlib.sha256("\0".join(key).encode()).hexdigest())
+
+
+async def detail_validators(request, pk):
+    """(etag, last_modified) of a recipe page; (None, None) if there's none."""
+    updated_at = await (
+        Recipe.objects.filter(pk=pk).values_list("updated_at", flat=True).afirst()
+    )
+    etag = await apage_etag(request, updated_at) if updated_at else None
+    return etag, etag and updated_at
+
+
+async def apage_etag_for(request, page, *parts):
+    """
+    ETag of a keyset page of card_rows() (see cards.py), its pager links
+    and whatever else the page shows (parts), or None when the page can't
+    be validated from its rows alone (offset ?page= links, which show a
+    count, and empty pages).
+    """
+    if not getattr(page, "is_keyset", False) or not page.object_list:
+        return None
+    pager = (page.has_previous(), page.has_next())
+    stamps = (f"{row.pk}@{row.updated_at}" for row in page)
+    return await apage_etag(request, CARD_VERSION, *parts, *pager, *stamps)
+
+
+def not_modified(request, etag, last_modified=None):
+    """The 304 response if the client's copy is current, else None."""
+    if etag is None:
+        return None
+    # Whole seconds, like the Last-Modified header the client echoes back.
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    """Add the validators (if any) and the caching headers that go with them."""
+    if etag is None:
+        return response
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ("Cookie",))
+    return response
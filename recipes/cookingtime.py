@@ -0,0 +1,97 @@
+"""
+Cooking time in minutes, for filtering and sorting the recipe list.
+
+Recipes keep the time as entered (cooking_time and cooking_time_unit);
+Recipe.cooking_minutes holds it in minutes, indexed together with id, so
+``?max_minutes=`` is an index range and ``?sort=time`` an index walk
+instead of converting units row by row. The column is set on every save
+(signals.py) and by BulkImporter; QuerySet.update() bypasses both, so
+updates of the time need a second update() setting
+``cooking_minutes=minutes_expression()`` (in the same one it would read
+the old values).
+
+The sidebar counts (recipes ready within each of BUCKETS) are one
+aggregate over that index, cached (and counted on the primary) like the
+facet counts, see facets.py.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db.models import Case, Count, F, PositiveIntegerField, Q, When
+
+from .cache import acached
+from .facets import COUNT_GENERATIONS
+from .replicas import PRIMARY
+from .search import search_recipes
+from .searchcache import normalize_query
+
+MINUTES_PER_UNIT = {"min": 1, "hr": 60}
+
+# Upper bounds (inclusive) of the sidebar's time filters.
+BUCKETS = (15, 30, 60, 120)
+
+# ?sort= values and their orderings; the last key must be unique (keysets).
+SORTS = {"new": ("-id",), "time": ("cooking_minutes", "id")}
+
+BUCKETS_KEY = "recipes:time-buckets"
+BUCKETS_TIMEOUT = 600
+
+
+def to_minutes(cooking_time, unit):
+    return (cooking_time or 0) * MINUTES_PER_UNIT.get(unit, 1)
+
+
+def minutes_expression():
+    """cooking_minutes computed by the database, for QuerySet.update()."""
+    return Case(
+        *(
+            When(cooking_time_unit=unit, then=F("cooking_time") * factor)
+            for unit, factor in MINUTES_PER_UNIT.items()
+            if factor != 1
+        ),
+        default=F("cooking_time"),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def parse_max_minutes(value):
+    """The ?max_minutes= limit, or None when missing or not a whole number."""
+    try:
+        minutes = int(value)
+    except (TypeError, ValueError):
+        return None
+    return minutes if minutes >= 0 else None
+
+
+def parse_sort(value):
+    return value if value in SORTS else "new"
+
+
+async def abucket_counts(queryset, q="", variant=()):
+    """
+    [(None, total), (minutes, count), ...] for BUCKETS, over ``queryset``
+    or its recipes matching ``q``: one query while no recipe changed, none
+    after. ``variant`` describes any filter on ``queryset``, for the cache
+    key.
+    """
+
+    async def compute():
+        recipes = queryset.using(PRIMARY)
+        if q:
+            # The matches' ids only: no ranking, no duplicates to collapse.
+            searched = await sync_to_async(search_recipes)(recipes, q)
+            recipes = recipes.filter(pk__in=searched.order_by().values("pk"))
+        totals = await recipes.order_by().aaggregate(
+            total=Count("pk"),
+            **{
+                f"within_{minutes}": Count("pk", filter=Q(cooking_minutes__lte=minutes))
+                for minutes in BUCKETS
+            },
+        )
+        counts = [(None, totals["total"])]
+        counts += [(minutes, totals[f"within_{minutes}"]) for minutes in BUCKETS]
+        return counts
+
+    parts = (normalize_query(q), variant)
+    return await acached(
+        BUCKETS_KEY, COUNT_GENERATIONS, parts, compute, BUCKETS_TIMEOUT
+    )
@@ -0,0 +1,166 @@
+"""
+Streaming export of recipes in the shape import_recipes reads back.
+
+Recipes are read with ``values()`` and ``.iterator()``; tags and ingredient
+lines are fetched with one query each per chunk of recipes. Nothing holds
+more than one chunk, so memory does not grow with the number of recipes.
+
+Items leave out the recipe ids unless asked: import_recipes reads ``id``
+as a feed id, and a database's own ids aren't one.
+"""
+
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from .importing import chunked
+from .models import Recipe, RecipeIngredient
+
+# Format -> content type.
+EXPORT_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+RECIPE_VALUES = (
+    "id",
+    "title",
+    "story",
+    "description",
+    "instructions",
+    "cooking_time",
+    "cooking_time_unit",
+    "category__name",
+)
+
+# Encoded output is handed out in pieces of about this size.
+BUFFER_SIZE = 64 * 1024
+
+
+def _tag_rows(recipe_ids, using):
+    return (
+        Recipe.tags.through.objects.using(using)
+        .filter(recipe_id__in=recipe_ids)
+        .order_by("tag__name")
+        .values_list("recipe_id", "tag__name")
+    )
+
+
+def _group_tags(recipe_ids, rows):
+    tags = {pk: [] for pk in recipe_ids}
+    for recipe_id, name in rows:
+        tags[recipe_id].append(name)
+    return tags
+
+
+def _line_rows(recipe_ids, using):
+    return (
+        RecipeIngredient.objects.using(using)
+        .filter(recipe_id__in=recipe_ids)
+        .order_by("pk")
+        .values_list("recipe_id", "ingredient__name", "quantity", "unit")
+    )
+
+
+def _group_lines(recipe_ids, rows):
+    lines = {pk: [] for pk in recipe_ids}
+    for recipe_id, name, quantity, unit in rows:
+        lines[recipe_id].append(
+            {"ingredient": name, "quantity": str(quantity), "unit": unit}
+        )
+    return lines
+
+
+def tag_names(recipe_ids, using="default"):
+    """Recipe id -> sorted tag names, in one query."""
+    return _group_tags(recipe_ids, _tag_rows(recipe_ids, using))
+
+
+def ingredient_lines(recipe_ids, using="default"):
+    """Recipe id -> import-shaped ingredient lines, in one query."""
+    return _group_lines(recipe_ids, _line_rows(recipe_ids, using))
+
+
+async def aingredient_lines(recipe_ids, using="default"):
+    rows = [row async for row in _line_rows(recipe_ids, using)]
+    return _group_lines(recipe_ids, rows)
+
+
+def iter_export_items(queryset=None, chunk_size=500, with_ids=False):
+    """Yield one import-shaped dict per recipe, in id order."""
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    rows = queryset.order_by("pk").values(*RECIPE_VALUES).iterator(chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        ids = [row["id"] for row in chunk]
+        tags = tag_names(ids, queryset.db)
+        lines = ingredient_lines(ids, queryset.db)
+        for row in chunk:
+            item = {"id": row["id"]} if with_ids else {}
+            yield item | {
+                "title": row["title"],
+                "story": row["story"],
+                "description": row["description"] or "",
+                "instructions": row["instructions"],
+                "cooking_time": row["cooking_time"],
+                "cooking_time_unit": row["cooking_time_unit"],
+                "category": row["category__name"],
+                "tags": tags[row["id"]],
+                "ingredients": lines[row["id"]],
+            }
+
+
+def iter_export_text(items, fmt="json"):
+    """
+    Serialize items as a JSON array or as NDJSON, yielding text in pieces
+    of roughly BUFFER_SIZE characters.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}")
+    buf, size = [], 0
+    if fmt == "json":
+        buf.append("[")
+    for i, item in enumerate(items):
+        text = json.dumps(item, ensure_ascii=False)
+        if fmt == "json":
+            text = ("\n" if i == 0 else ",\n") + text
+        else:
+            text += "\n"
+        buf.append(text)
+        size += len(text)
+        if size >= BUFFER_SIZE:
+            yield "".join(buf)
+            buf, size = [], 0
+    if fmt == "json":
+        buf.append("\n]\n")
+    yield "".join(buf)
+
+
+def gzip_stream(chunks):
+    """Gzip an iterable of bytes on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(queryset=None, fmt="json", compress=False, chunk_size=500):
+    """UTF-8 (optionally gzipped) bytes of the export, produced lazily."""
+    text = iter_export_text(iter_export_items(queryset, chunk_size), fmt)
+    data = (piece.encode("utf-8") for piece in text)
+    return gzip_stream(data) if compress else data
+
+
+async def aexport_stream(queryset=None, fmt="json", compress=False, chunk_size=500):
+    """
+    export_stream() as an async iterator, for ASGI servers (which would
+    otherwise read a sync one whole before sending it): each piece is
+    produced in the ORM's thread.
+    """
+    pieces = export_stream(queryset, fmt, compress, chunk_size)
+    next_piece = sync_to_async(next)
+    try:
+        while (piece := await next_piece(pieces, None)) is not None:
+            yield piece
+    finally:
+        await sync_to_async(pieces.close)()
@@ -0,0 +1,125 @@
+"""
+Category and tag facets of the recipe list.
+
+``?category=`` and ``?tag=`` take names and repeat for several: a recipe
+matches any of the selected categories and any of the selected tags
+(OR within a facet, AND between them, and with q= and the time filter).
+
+Counts come from one query, a UNION ALL of the recipes grouped by
+category and of their tag links grouped by tag, both walking the foreign
+key indexes from the (small) category and tag tables. Each facet counts
+the recipes the other filters leave, so picking a second category shows
+what it would add rather than zero. Results are cached per selection and
+dropped when a recipe, a category or a tag changes (their generations,
+see cache.py). They are always counted on the primary, also in
+@replica_reads views: a replica still behind the write that bumped a
+generation would have its stale counts cached under the new one.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db.models import CharField, Count, Value
+
+from .cache import acached
+from .choices import generation_name
+from .models import Category, Recipe, Tag
+from .replicas import PRIMARY
+from .search import SEARCH_GENERATION, search_recipes
+from .searchcache import normalize_query
+
+FACETS = ("category", "tag")
+
+# Values listed per facet, most recipes first; selected ones always are.
+MAX_VALUES = 20
+
+# Counts of recipes per filter value are stale after any of these bumps.
+COUNT_GENERATIONS = (
+    SEARCH_GENERATION,
+    generation_name(Category),
+    generation_name(Tag),
+)
+
+FACETS_KEY = "recipes:facets"
+FACETS_TIMEOUT = 600
+
+
+def parse_facets(query):
+    """{facet: sorted tuple of selected names} from a QueryDict."""
+    return {
+        facet: tuple(sorted({v.strip() for v in query.getlist(facet) if v.strip()}))
+        for facet in FACETS
+    }
+
+
+def narrow(queryset, selected, skip=None):
+    """The recipes of ``queryset`` matching the selection, ignoring facet skip."""
+    if selected["category"] and skip != "category":
+        categories = Category.objects.filter(name__in=selected["category"])
+        queryset = queryset.filter(category__in=categories)
+    if selected["tag"] and skip != "tag":
+        links = Recipe.tags.through.objects.filter(tag__name__in=selected["tag"])
+        queryset = queryset.filter(pk__in=links.values("recipe_id"))
+    return queryset
+
+
+def _grouped(queryset, selected):
+    """The UNION ALL of (facet, name, count) rows."""
+    categories = (
+        narrow(queryset, selected, skip="category")
+        .filter(category__isnull=False)
+        .order_by()
+        .values("category__name")
+        .annotate(facet=Value("category", output_field=CharField()), n=Count("pk"))
+        .values_list("facet", "category__name", "n")
+    )
+    tagged = narrow(queryset, selected, skip="tag")
+    links = Recipe.tags.through.objects.using(queryset.db)
+    if tagged.query.has_filters():
+        links = links.filter(recipe_id__in=tagged.values("pk"))
+    tags = (
+        links.order_by()
+        .values("tag__name")
+        .annotate(facet=Value("tag", output_field=CharField()), n=Count("pk"))
+        .values_list("facet", "tag__name", "n")
+    )
+    return categories.union(tags, all=True)
+
+
+async def afacet_counts(queryset, q, selected, variant=()):
+    """
+    {facet: [(name, count), ...]} over ``queryset`` (and its recipes
+    matching ``q``), most recipes first. ``variant`` describes any other
+    filter on ``queryset``, for the cache key.
+    """
+
+    async def compute():
+        recipes = queryset.using(PRIMARY)
+        if q:
+            searched = await sync_to_async(search_recipes)(recipes, q)
+            recipes = recipes.filter(pk__in=searched.order_by().values("pk"))
+        counts = {facet: [] for facet in FACETS}
+        async for facet, name, n in _grouped(recipes, selected):
+            counts[facet].append((name, n))
+        for values in counts.values():
+            values.sort(key=lambda value: (-value[1], value[0]))
+        return counts
+
+    parts = (normalize_query(q), selected, variant)
+    return await acached(FACETS_KEY, COUNT_GENERATIONS, parts, compute, FACETS_TIMEOUT)
+
+
+def facet_links(counts, selected):
+    """
+    {facet: [(name, count, is_selected, selection_if_toggled), ...]}: the
+    top MAX_VALUES values and every selected one, for the sidebar links.
+    """
+    links = {}
+    for facet in FACETS:
+        chosen = set(selected[facet])
+        values = counts[facet][:MAX_VALUES]
+        shown = {name for name, _ in values}
+        found = dict(counts[facet])
+        values += [(name, found.get(name, 0)) for name in sorted(chosen - shown)]
+        links[facet] = [
+            (name, n, name in chosen, sorted(chosen ^ {name})) for name, n in values
+        ]
+    return links
@@ -6,7 +6,14 @@ from django.forms import ModelChoiceField, BaseInlineFormSet
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Div
 
+from .choices import (
+    CachedModelChoiceField,
+    CachedModelMultipleChoiceField,
+    PrefetchedModelChoiceField,
+)
 from .models import Recipe, RecipeIngredient
+from .signals import batched_recipe_writes, recount_lines
+from .widgets import AutocompleteSelect, AutocompleteSelectMultiple
 
 
 class RecipeForm(forms.ModelForm):
@@ -23,6 +30,11 @@ class RecipeForm(forms.ModelForm):
             "category",
             "tags",
         ]
+        # Options come from a shared per-process snapshot, not one query per form
+        field_classes = {
+            "category": CachedModelChoiceField,
+            "tags": CachedModelMultipleChoiceField,
+        }
         labels = {
             "cooking_time": "Cooking time",
             "cooking_time_unit": "Unit",
@@ -56,11 +68,12 @@ class RecipeForm(forms.ModelForm):
                 attrs={"class": "form-control-file", "accept": "image/*"}
             ),
             "category": forms.Select(attrs={"class": "form-control"}),
-            "tags": forms.SelectMultiple(
+            "tags": AutocompleteSelectMultiple(
+                "recipes:tag_autocomplete",
                 attrs={
                     "class": "form-control select2",
                     "data-placeholder": "Select or type tags",
-                }
+                },
             ),
             "cooking_time": forms.NumberInput(
                 attrs={"min": 0, "class": "form-control"}
@@ -114,12 +127,14 @@ class RecipeIngredientForm(forms.ModelForm):
     class Meta:
         model = RecipeIngredient
         fields = ("ingredient", "quantity", "unit")
+        field_classes = {"ingredient": CachedModelChoiceField}
         widgets = {
-            "ingredient": forms.Select(
+            "ingredient": AutocompleteSelect(
+                "recipes:ingredient_autocomplete",
                 attrs={
                     "class": "form-control select2",
                     "data-placeholder": "— Select ingredient —",
-                }
+                },
             ),
             "quantity": forms.NumberInput(
                 attrs={"step": "any", "min": 0, "class": "form-control"}
@@ -131,6 +146,60 @@ class RecipeIngredientForm(forms.ModelForm):
 
 
 class RecipeIngredientInlineFormSet(BaseInlineFormSet):
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        field = form.fields[self._pk_field.name]
+        if type(field) is ModelChoiceField:
+            form.fields[self._pk_field.name] = PrefetchedModelChoiceField(
+                field.queryset,
+                initial=field.initial,
+                required=False,
+                widget=field.widget,
+            )
+
+    def full_clean(self):
+        if self.is_bound:
+            self.prefetch_choices()
+        super().full_clean()
+
+    def prefetch_choices(self):
+        """
+        Fetch the lines and ingredients of all submitted forms up front, one
+        query each, instead of one per form and field while cleaning.
+        """
+        if not self.forms:
+            return
+        lines = {str(line.pk): line for line in self.get_queryset()}
+        ids = {form.data.get(form.add_prefix("ingredient")) for form in self.forms}
+        queryset = self.forms[0].fields["ingredient"].queryset
+        found = queryset.in_bulk([i for i in ids if isinstance(i, str) and i.isdigit()])
+        ingredients = {str(pk): obj for pk, obj in found.items()}
+        for form in self.forms:
+            form.fields[self._pk_field.name].prefetched = lines
+            form.fields["ingredient"].prefetched = ingredients
+
+    def save(self, commit=True):
+        """
+        Write the lines with one query each for deletes, changes and new
+        ones, then touch and recount the recipe once, however many lines
+        the form had.
+        """
+        if not commit:
+            return super().save(commit)
+        lines = super().save(commit=False)
+        using = self.instance._state.db or "default"
+        manager = RecipeIngredient.objects.using(using)
+        with batched_recipe_writes():
+            if self.deleted_objects:
+                manager.filter(pk__in=[l.pk for l in self.deleted_objects]).delete()
+            if self.changed_objects:
+                changed = [line for line, _ in self.changed_objects]
+                manager.bulk_update(changed, self.form._meta.fields)
+            if self.new_objects:
+                manager.bulk_create(self.new_objects)
+            recount_lines([self.instance.pk], using)
+        return lines
+
     def clean(self):
         super().clean()
         has_one = False
@@ -0,0 +1,492 @@
+import hashlib
+import json
+import os
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import search
+from .cache import bump_generation
+from .cookingtime import to_minutes
+from .choices import generation_name
+from .models import Category, ImportRecord, Ingredient, Recipe, RecipeIngredient, Tag
+from .normalization import prepare_batch, source_key
+
+RECIPE_FIELDS = (
+    "title",
+    "story",
+    "description",
+    "instructions",
+    "cooking_time",
+    "cooking_time_unit",
+    "author",
+    "category",
+    # bulk_update() doesn't apply auto_now; build() sets it.
+    "updated_at",
+    # The summary columns (summaries.py), which the receivers would set.
+    "author_name",
+    "category_name",
+    "tag_names",
+    "ingredient_count",
+    # Recipe.cooking_minutes (cookingtime.py), set by a receiver too.
+    "cooking_minutes",
+)
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit.
+LOOKUP_SLICE = 500
+
+QUANTITY_PLACES = Decimal("0.01")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class StageTimes:
+    """Accumulated seconds per import stage (read, normalize, write)."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.seconds[stage] += seconds
+
+    @contextmanager
+    def measure(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def timed(self, stage, iterable):
+        """Iterate, charging the time spent producing each item to stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.measure(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        parts = [f"{stage} {secs:.2f}s" for stage, secs in self.seconds.items()]
+        return ", ".join(parts + [f"total {self.total:.2f}s"])
+
+
+def prepare_items(raw_items, workers=1, stats=None, batch_size=200):
+    """
+    Yield ``(item, errors)`` for every raw item, in input order.
+
+    With workers > 1 the normalization runs in a process pool fed with
+    batches; at most ``2 * workers`` batches are in flight so memory stays
+    bounded, and results are consumed in submission order so the single
+    writer sees exactly the sequence a serial run would.
+    """
+    stats = stats or StageTimes()
+    raw_items = stats.timed("read", raw_items)
+    if workers <= 1:
+        for batch in chunked(raw_items, batch_size):
+            prepared, cpu = prepare_batch(batch)
+            stats.add("normalize", cpu)
+            yield from prepared
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in chunked(raw_items, batch_size):
+            pending.append(pool.submit(prepare_batch, batch))
+            if len(pending) >= 2 * workers:
+                prepared, cpu = pending.popleft().result()
+                stats.add("normalize", cpu)
+                yield from prepared
+        while pending:
+            prepared, cpu = pending.popleft().result()
+            stats.add("normalize", cpu)
+            yield from prepared
+
+
+class Checkpoint:
+    """
+    How far a resumable import of one file got, kept in a small JSON file.
+
+    ``offset`` counts raw input items (valid or not) whose batch has been
+    committed. The file's size and mtime are stored with it so a checkpoint
+    is never applied to a different or modified input.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+
+    def _identity(self):
+        st = os.stat(self.source)
+        return {
+            "source": os.path.abspath(self.source),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+
+    def load(self):
+        """The saved offset, 0 without a checkpoint; ValueError on a mismatch."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        offset = state.pop("offset", None)
+        if state != self._identity() or not isinstance(offset, int) or offset < 0:
+            raise ValueError(f"{self.path} does not belong to {self.source}")
+        return offset
+
+    def save(self, offset):
+        # Write then rename, so a crash never leaves a half-written checkpoint.
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(self._identity(), offset=offset), f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class BulkImporter:
+    """
+    Write prepared recipe items (see normalization.prepare_recipe_item)
+    with a handful of queries per batch.
+
+    Categories, tags and ingredients are preloaded into name -> id dicts
+    and missing ones are created with bulk_create(ignore_conflicts=True).
+    Recipes, tag links and RecipeIngredient rows are bulk inserted, one
+    transaction per batch.
+
+    Items are matched to recipes by source key (the feed's id, else the
+    title; see ImportRecord), falling back to a not-yet-imported recipe
+    with the same title. A matched recipe is skipped, or with ``update``
+    brought in line with the item: fields replaced, tags set (cleared if
+    the item has none), ingredient lines diffed. Items whose content hash
+    equals the stored one are not touched at all, so re-importing an
+    unchanged feed costs a lookup per batch.
+
+    Source keys are kept apart per author (feed ids are only unique within
+    one author's feed), the same for the command and the batch API, so
+    either finds what the other imported. With ``own_only`` (the batch
+    API) items only ever match the author's own recipes.
+    """
+
+    def __init__(
+        self, author, update=False, batch_size=500, using="default", own_only=False
+    ):
+        self.author = author
+        self.update = update
+        self.batch_size = batch_size
+        self.using = using
+        self.own_only = own_only
+        self.created = self.updated = self.skipped = self.unchanged = 0
+        self._lookups = {Category: {}, Tag: {}, Ingredient: {}}
+        self._preloaded = False
+
+    def preload(self):
+        for model, ids in self._lookups.items():
+            ids.update(
+                model.objects.using(self.using).values_list("name", "pk").iterator()
+            )
+        self._preloaded = True
+
+    def run(self, items, stats=None, after_chunk=None):
+        """Import items in batches; ``after_chunk()`` runs after each commit."""
+        self.preload()
+        stats = stats or StageTimes()
+        for chunk in chunked(items, self.batch_size):
+            with stats.measure("write"), transaction.atomic(using=self.using):
+                self.import_chunk(chunk)
+            if after_chunk:
+                after_chunk()
+        return self
+
+    def _fetch_ids(self, model, names):
+        manager = model.objects.using(self.using)
+        for start in range(0, len(names), LOOKUP_SLICE):
+            names_slice = names[start : start + LOOKUP_SLICE]
+            self._lookups[model].update(
+                manager.filter(name__in=names_slice).values_list("name", "pk")
+            )
+
+    def _lookup_ids(self, model, names):
+        """name -> id for names, creating the missing rows first."""
+        ids = self._lookups[model]
+        missing = sorted({n for n in names if n not in ids})
+        if missing and not self._preloaded:
+            # Small batches look up just their own names.
+            self._fetch_ids(model, missing)
+            missing = [n for n in missing if n not in ids]
+        if missing:
+            model.objects.using(self.using).bulk_create(
+                [model(name=n) for n in missing],
+                ignore_conflicts=True,
+                batch_size=self.batch_size,
+            )
+            self._fetch_ids(model, missing)
+            bump_generation(generation_name(model))
+        return ids
+
+    def _existing_ids(self, titles):
+        """title -> id of the first (lowest id) unclaimed recipe with that title."""
+        existing = {}
+        titles = list(titles)
+        recipes = Recipe.objects.using(self.using)
+        if self.own_only:
+            recipes = recipes.filter(author=self.author)
+        for start in range(0, len(titles), LOOKUP_SLICE):
+            rows = (
+                recipes.filter(
+                    title__in=titles[start : start + LOOKUP_SLICE],
+                    import_record__isnull=True,
+                )
+                .order_by("-pk")
+                .values_list("title", "pk")
+            )
+            existing.update(rows)
+        return existing
+
+    def _records(self, keys):
+        """source_key -> (recipe id, content hash) of earlier imports."""
+        records = {}
+        keys = list(keys)
+        for start in range(0, len(keys), LOOKUP_SLICE):
+            records.update(
+                (key, (recipe_id, digest))
+                for key, recipe_id, digest in ImportRecord.objects.using(self.using)
+                .filter(source_key__in=keys[start : start + LOOKUP_SLICE])
+                .values_list("source_key", "recipe_id", "content_hash")
+            )
+        return records
+
+    def _source_key(self, item):
+        return f"user:{self.author.pk}:{source_key(item)}"
+
+    def _digest(self, item):
+        # The author is assigned by the importer, so it's part of the state.
+        return hashlib.sha256(
+            f"{item['content_hash']}:{self.author.pk}".encode()
+        ).hexdigest()
+
+    def import_chunk(self, items):
+        # Last item wins for a key repeated in the chunk when updating,
+        # the first one otherwise (later ones find it "existing").
+        by_key = {}
+        for item in items:
+            key = self._source_key(item)
+            if key in by_key:
+                if self.update:
+                    by_key[key] = item
+                    self.updated += 1
+                else:
+                    self.skipped += 1
+                continue
+            by_key[key] = item
+
+        if not by_key:
+            return
+
+        records = self._records(by_key)
+        existing = self._existing_ids(
+            item["title"] for key, item in by_key.items() if key not in records
+        )
+
+        # Sort items into new / changed; unchanged ones stop here.
+        new_items, changed_items, claimed = [], [], set()
+        for key, item in by_key.items():
+            digest = self._digest(item)
+            if key in records:
+                recipe_id, old_digest = records[key]
+            else:
+                recipe_id, old_digest = existing.get(item["title"]), None
+                if recipe_id in claimed:
+                    recipe_id = None
+            if recipe_id is None:
+                new_items.append((key, digest, item))
+            elif not self.update:
+                self.skipped += 1
+            elif digest == old_digest:
+                self.unchanged += 1
+            else:
+                claimed.add(recipe_id)
+                changed_items.append((key, digest, item, recipe_id))
+
+        written = [item for _, _, item in new_items] + [
+            item for _, _, item, _ in changed_items
+        ]
+        if not written:
+            return
+
+        category_ids = self._lookup_ids(
+            Category, [i["category"] for i in written if i.get("category")]
+        )
+        tag_ids = self._lookup_ids(Tag, [t for i in written for t in i["tags"]])
+        ingredient_ids = self._lookup_ids(
+            Ingredient,
+            [line["ingredient"] for i in written for line in i["ingredients"]],
+        )
+
+        now = timezone.now()
+
+        def build(item, pk=None):
+            cat_name = item.get("category")
+            return Recipe(
+                pk=pk,
+                title=item["title"],
+                story=item["story"],
+                description=item["description"],
+                instructions=item["instructions"],
+                cooking_time=item["cooking_time"],
+                cooking_time_unit=item["cooking_time_unit"],
+                cooking_minutes=to_minutes(
+                    item["cooking_time"], item["cooking_time_unit"]
+                ),
+                author=self.author,
+                category_id=category_ids[cat_name] if cat_name else None,
+                updated_at=now,
+                author_name=self.author.username,
+                category_name=cat_name or "",
+                tag_names=sorted(set(item["tags"])),
+                ingredient_count=len(item["ingredients"]),
+            )
+
+        manager = Recipe.objects.using(self.using)
+        new_recipes = [build(item) for _, _, item in new_items]
+        manager.bulk_create(new_recipes, batch_size=self.batch_size)
+        if new_recipes and new_recipes[0].pk is None:
+            # Backends that can't return ids from a bulk insert.
+            created_ids = dict(
+                manager.filter(title__in=[r.title for r in new_recipes])
+                .order_by("pk")
+                .values_list("title", "pk")
+            )
+            for recipe in new_recipes:
+                recipe.pk = created_ids[recipe.title]
+        changed_recipes = [build(item, pk) for _, _, item, pk in changed_items]
+
+        wanted_tags, wanted_lines = {}, {}
+        for recipe, item in zip(new_recipes + changed_recipes, written):
+            wanted_tags[recipe.pk] = {tag_ids[t] for t in item["tags"]}
+            wanted_lines[recipe.pk] = [
+                (
+                    ingredient_ids[line["ingredient"]],
+                    line["quantity"],
+                    line["unit"],
+                )
+                for line in item["ingredients"]
+            ]
+        self._sync_tags(wanted_tags, [r.pk for r in changed_recipes])
+        self._sync_lines(wanted_lines, [r.pk for r in changed_recipes])
+        # After the lines: deleting stale ones recounts ingredient_count.
+        manager.bulk_update(changed_recipes, RECIPE_FIELDS, batch_size=self.batch_size)
+
+        ImportRecord.objects.using(self.using).bulk_create(
+            [
+                ImportRecord(source_key=key, recipe_id=recipe.pk, content_hash=digest)
+                for (key, digest, *_), recipe in zip(
+                    new_items + changed_items, new_recipes + changed_recipes
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["source_key"],
+            update_fields=["recipe", "content_hash", "imported_at"],
+            batch_size=self.batch_size,
+        )
+
+        # bulk_create skips the post_save/m2m_changed receivers.
+        search.index_recipes(list(wanted_tags), using=self.using)
+
+        self.created += len(new_recipes)
+        self.updated += len(changed_recipes)
+
+    def _sync_tags(self, wanted, changed_ids):
+        """Add/remove tag links so each recipe has exactly its wanted tags."""
+        TagLink = Recipe.tags.through
+        links = TagLink.objects.using(self.using)
+        current = defaultdict(dict)
+        for start in range(0, len(changed_ids), LOOKUP_SLICE):
+            for link_id, recipe_id, tag_id in links.filter(
+                recipe_id__in=changed_ids[start : start + LOOKUP_SLICE]
+            ).values_list("id", "recipe_id", "tag_id"):
+                current[recipe_id][tag_id] = link_id
+
+        stale, missing = [], []
+        for recipe_id, tag_ids in wanted.items():
+            have = current.get(recipe_id, {})
+            stale += [
+                link_id for tag_id, link_id in have.items() if tag_id not in tag_ids
+            ]
+            missing += [
+                TagLink(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in tag_ids
+                if tag_id not in have
+            ]
+        for start in range(0, len(stale), LOOKUP_SLICE):
+            links.filter(id__in=stale[start : start + LOOKUP_SLICE]).delete()
+        links.bulk_create(missing, batch_size=self.batch_size)
+
+    def _sync_lines(self, wanted, changed_ids):
+        """
+        Diff ingredient lines: rows whose (ingredient, quantity, unit) still
+        appear are kept, the rest deleted, and only new lines inserted.
+        """
+        rows = RecipeIngredient.objects.using(self.using)
+        current = defaultdict(list)
+        for start in range(0, len(changed_ids), LOOKUP_SLICE):
+            for line_id, recipe_id, *line in rows.filter(
+                recipe_id__in=changed_ids[start : start + LOOKUP_SLICE]
+            ).values_list("id", "recipe_id", "ingredient_id", "quantity", "unit"):
+                current[recipe_id].append((line_id, _line_key(*line)))
+
+        stale, missing = [], []
+        for recipe_id, lines in wanted.items():
+            remaining = Counter(_line_key(*line) for line in lines)
+            for line_id, key in current.get(recipe_id, []):
+                if remaining[key] > 0:
+                    remaining[key] -= 1
+                else:
+                    stale.append(line_id)
+            for ingredient_id, quantity, unit in lines:
+                key = _line_key(ingredient_id, quantity, unit)
+                if remaining[key] > 0:
+                    remaining[key] -= 1
+                    missing.append(
+                        RecipeIngredient(
+                            recipe_id=recipe_id,
+                            ingredient_id=ingredient_id,
+                            quantity=quantity,
+                            unit=unit,
+                        )
+                    )
+        for start in range(0, len(stale), LOOKUP_SLICE):
+            rows.filter(id__in=stale[start : start + LOOKUP_SLICE]).delete()
+        rows.bulk_create(missing, batch_size=self.batch_size)
+
+
+def _line_key(ingredient_id, quantity, unit):
+    # Stored quantities come back quantized to the column's 2 places.
+    try:
+        quantity = quantity.quantize(QUANTITY_PLACES)
+    except InvalidOperation:
+        pass
+    return (ingredient_id, quantity, unit)
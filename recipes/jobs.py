@@ -0,0 +1,181 @@
+"""
+A small database-backed job queue for image post-processing.
+
+Saving a recipe with a new image only inserts an ImageJob row. Once the
+transaction commits, a thread pool in the same process picks the job up,
+so the request doesn't wait for Pillow. Until a job is done the recipe has
+no image_widths and pages serve the original upload.
+
+Jobs are claimed with a conditional UPDATE, so several processes (or
+``manage.py process_image_jobs`` running next to the web server) can
+share the queue without running a job twice. Failures are retried with
+exponential backoff, up to MAX_ATTEMPTS.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from . import thumbnails
+from .models import ImageJob, Recipe
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+# Seconds before the first retry; doubled for every further attempt.
+RETRY_DELAY = 30
+
+# A job "running" for longer than this was lost with its process.
+STALE_AFTER = timedelta(minutes=10)
+
+# Not worth retrying: the upload isn't an image Pillow can read.
+PERMANENT_ERRORS = (Image.UnidentifiedImageError, Image.DecompressionBombError)
+
+
+def enqueue_thumbnails(recipe, using="default"):
+    """Queue thumbnail generation for the recipe's current image."""
+    jobs = ImageJob.objects.using(using)
+    # An older upload still waiting in the queue is pointless now.
+    jobs.filter(recipe=recipe, status=ImageJob.PENDING).delete()
+    job = jobs.create(recipe=recipe, image=recipe.image.name)
+    transaction.on_commit(lambda: worker.wake(using), using=using)
+    return job
+
+
+def requeue_stale(using="default"):
+    return (
+        ImageJob.objects.using(using)
+        .filter(status=ImageJob.RUNNING, updated_at__lt=timezone.now() - STALE_AFTER)
+        .update(status=ImageJob.PENDING, updated_at=timezone.now())
+    )
+
+
+def claim_next(using="default"):
+    """Mark the next due job as running and return it, or None."""
+    jobs = ImageJob.objects.using(using)
+    now = timezone.now()
+    due = jobs.filter(status=ImageJob.PENDING, run_after__lte=now)
+    for pk in due.order_by("run_after", "pk").values_list("pk", flat=True)[:10]:
+        claimed = jobs.filter(pk=pk, status=ImageJob.PENDING).update(
+            status=ImageJob.RUNNING, attempts=F("attempts") + 1, updated_at=now
+        )
+        if claimed:
+            # Its recipe (and so the job) may have been deleted since.
+            job = jobs.select_related("recipe").filter(pk=pk).first()
+            if job is not None:
+                return job
+    return None
+
+
+def run_job(job, using="default"):
+    recipe = job.recipe
+    if recipe.image.name != job.image:
+        # Replaced or cleared since; its own job (if any) takes over.
+        _finish(job, ImageJob.DONE, "superseded by a newer image")
+        return
+    try:
+        widths = thumbnails.generate_derivatives(recipe.image)
+    except PERMANENT_ERRORS as e:
+        _finish(job, ImageJob.FAILED, repr(e))
+    except Exception as e:
+        logger.warning("Image job %s failed", job.pk, exc_info=True)
+        if job.attempts >= MAX_ATTEMPTS:
+            _finish(job, ImageJob.FAILED, repr(e))
+        else:
+            job.run_after = timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** (job.attempts - 1)
+            )
+            _finish(job, ImageJob.PENDING, repr(e))
+    else:
+        # Only if the image is still the one the copies were made from.
+        Recipe.objects.using(using).filter(pk=recipe.pk, image=job.image).update(
+            image_widths=widths, updated_at=timezone.now()
+        )
+        _finish(job, ImageJob.DONE, "")
+
+
+def _finish(job, status, error):
+    job.status = status
+    job.last_error = error
+    job.save(update_fields=["status", "last_error", "run_after", "updated_at"])
+
+
+def run_pending(using="default", limit=None):
+    """Run due jobs in this thread until none are left; returns how many ran."""
+    requeue_stale(using)
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next(using)
+        if job is None:
+            break
+        run_job(job, using)
+        count += 1
+    return count
+
+
+def next_due(using="default"):
+    """Seconds until the earliest pending job is due, or None."""
+    run_after = (
+        ImageJob.objects.using(using)
+        .filter(status=ImageJob.PENDING)
+        .order_by("run_after")
+        .values_list("run_after", flat=True)
+        .first()
+    )
+    if run_after is None:
+        return None
+    return max(0.0, (run_after - timezone.now()).total_seconds())
+
+
+class Worker:
+    """
+    Runs run_pending() on a few background threads. Pillow releases the
+    GIL while resizing and encoding, so threads are enough here.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._pool = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def wake(self, using="default"):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    self.max_workers or getattr(settings, "IMAGE_JOB_WORKERS", 2),
+                    thread_name_prefix="image-jobs",
+                )
+        self._pool.submit(self._drain, using)
+
+    def _drain(self, using):
+        try:
+            run_pending(using)
+            delay = next_due(using)
+            if delay is not None:
+                self._schedule(delay, using)
+        except Exception:
+            logger.exception("Image job worker crashed")
+        finally:
+            # Each pool thread has its own connection; don't leak them.
+            connections[using].close()
+
+    def _schedule(self, delay, using):
+        """Wake up again when the next retry is due."""
+        with self._lock:
+            if self._timer is not None and self._timer.is_alive():
+                return
+            self._timer = threading.Timer(delay, self.wake, (using,))
+            self._timer.daemon = True
+            self._timer.start()
+
+
+worker = Worker()
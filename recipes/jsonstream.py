@@ -0,0 +1,165 @@
+"""
+Incremental JSON reading for recipe imports.
+
+Accepted inputs, detected from the data itself:
+
+- a top-level array of recipe objects;
+- an object with a "recipes" (or Hungarian "receptek") array;
+- newline-delimited JSON (one recipe object per line), down to a single
+  recipe object, whatever the file is called.
+
+Array elements are decoded one at a time from a small sliding buffer, so
+memory stays bounded by the largest single recipe, not by the file.
+"""
+
+import json
+import re
+
+RECIPE_LIST_KEYS = ("recipes", "receptek")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# A single recipe larger than this is treated as corrupt input rather than
+# buffering the rest of the file while looking for its end.
+MAX_VALUE_SIZE = 64 * 1024 * 1024
+
+
+class UnsupportedStructure(ValueError):
+    pass
+
+
+class JSONStreamReader:
+    def __init__(self, fp, chunk_size=64 * 1024):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Append the next chunk to the buffer; False at end of input."""
+        if self.eof:
+            return False
+        # Read at least as much as is buffered so one huge value doesn't
+        # get re-decoded once per small chunk.
+        data = self.fp.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or "" at end of input."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(
+                f"Expecting {char!r}, found {found or 'end of input'!r}",
+                self.buf,
+                self.pos,
+            )
+        self.pos += 1
+
+    def value(self):
+        """Decode one complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if len(self.buf) - self.pos < MAX_VALUE_SIZE and self._fill():
+                    continue
+                raise
+            # A number at the buffer's edge may continue in the next chunk.
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def iter_array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+    def iter_object_recipes(self, rest):
+        """
+        Stream the recipe list out of a top-level object; every other
+        key/value pair is decoded into ``rest``. The generator's return
+        value tells whether a recipe list was found.
+        """
+        found = False
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return found
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key in RECIPE_LIST_KEYS and not found and self.peek() == "[":
+                found = True
+                yield from self.iter_array()
+            else:
+                rest[key] = self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return found
+
+
+def iter_recipe_items(fp, fmt="auto", chunk_size=64 * 1024, raw_lines=False):
+    """
+    Yield raw recipe dicts from a text file object, lazily.
+
+    With ``raw_lines`` NDJSON lines are yielded undecoded, leaving the
+    decoding to the (possibly parallel) normalization stage.
+    """
+    if fmt == "ndjson":
+        for line in fp:
+            if line.strip():
+                yield line if raw_lines else json.loads(line)
+        return
+
+    reader = JSONStreamReader(fp, chunk_size)
+    first = reader.peek()
+    if first == "[":
+        yield from reader.iter_array()
+    elif first == "{":
+        rest = {}
+        found = yield from reader.iter_object_recipes(rest)
+        if not found:
+            # A wrapper whose list is missing or isn't one is no recipe.
+            if fmt != "auto" or not rest or rest.keys() & RECIPE_LIST_KEYS:
+                raise UnsupportedStructure(
+                    "JSON must be a list or an object with 'recipes' or 'receptek'."
+                )
+            # One or more top-level objects: newline-delimited JSON.
+            yield rest
+            while reader.peek():
+                yield reader.value()
+            return
+    elif first == "":
+        raise json.JSONDecodeError("Expecting value", reader.buf, reader.pos)
+    else:
+        raise UnsupportedStructure("Unsupported JSON structure.")
+
+    if reader.peek():
+        raise json.JSONDecodeError("Extra data", reader.buf, reader.pos)
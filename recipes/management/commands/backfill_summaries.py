@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import summaries
+from recipes.importing import chunked
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in the summary columns of recipes (author and category names, "
+        "tag names, ingredient count) from their relations"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Recipes per transaction"
+        )
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        ids = Recipe.objects.using(using).order_by("pk").values_list("pk", flat=True)
+        done = 0
+        for chunk in chunked(ids.iterator(), max(1, options["batch_size"])):
+            with transaction.atomic(using=using):
+                summaries.refresh_summaries(chunk, using=using)
+            done += len(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated the summaries of {done} recipes.")
+        )
@@ -0,0 +1,153 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and latency of a page served by the WSGI handler "
+        "(thread pool) and the ASGI handler (event loop), in this process"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="*", default=["/"], help="Paths to request (default: /)"
+        )
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Requests per path and handler"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=50, help="Requests in flight at once"
+        )
+        parser.add_argument(
+            "--handler", choices=("both", "wsgi", "asgi"), default="both"
+        )
+        parser.add_argument(
+            "--host", default="localhost", help="Host header (must be allowed)"
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1")
+        handlers = (
+            ("wsgi", "asgi") if options["handler"] == "both" else (options["handler"],)
+        )
+        for path in options["paths"]:
+            for name in handlers:
+                bench = getattr(self, f"bench_{name}")
+                # A few untimed requests first: caches, connections, imports.
+                bench(path, options["host"], 5, 1)
+                wall, latencies, errors = bench(
+                    path, options["host"], options["requests"], options["concurrency"]
+                )
+                self.report(name, path, options["concurrency"], wall, latencies, errors)
+
+    def report(self, name, path, concurrency, wall, latencies, errors):
+        latencies.sort()
+        count = len(latencies)
+
+        def ms(fraction):
+            return latencies[int(fraction * (count - 1))] * 1000
+
+        line = (
+            f"{name} {path} (concurrency {concurrency}): {count / wall:.1f} req/s, "
+            f"p50 {ms(0.5):.1f} ms, p99 {ms(0.99):.1f} ms"
+        )
+        if errors:
+            line += f", {errors} non-200 responses"
+        self.stdout.write(line)
+
+    def bench_wsgi(self, path, host, requests, concurrency):
+        app = WSGIHandler()
+        url = urlsplit(path)
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status)
+
+        def one(_):
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": url.path,
+                "QUERY_STRING": url.query,
+                "SERVER_NAME": host,
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": host,
+                "wsgi.version": (1, 0),
+                "wsgi.url_scheme": "http",
+                "wsgi.input": BytesIO(),
+                "wsgi.errors": sys.stderr,
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+            }
+            started = time.perf_counter()
+            response = app(environ, start_response)
+            try:
+                b"".join(response)
+            finally:
+                response.close()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - started
+        errors = sum(1 for status in statuses if not status.startswith("200"))
+        return wall, latencies, errors
+
+    def bench_asgi(self, path, host, requests, concurrency):
+        app = ASGIHandler()
+        url = urlsplit(path)
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": url.path,
+            "raw_path": url.path.encode(),
+            "query_string": url.query.encode(),
+            "headers": [(b"host", host.encode())],
+            "server": (host, 80),
+            "client": ("127.0.0.1", 50000),
+        }
+        errors = 0
+
+        async def one(limit):
+            received = False
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                # The client never disconnects; Django cancels this wait.
+                await asyncio.Future()
+
+            async def send(message):
+                nonlocal errors
+                if message["type"] == "http.response.start":
+                    errors += message["status"] != 200
+
+            async with limit:
+                started = time.perf_counter()
+                await app(dict(scope), receive, send)
+                return time.perf_counter() - started
+
+        async def run():
+            limit = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(one(limit) for _ in range(requests)))
+
+        started = time.perf_counter()
+        latencies = list(asyncio.run(run()))
+        wall = time.perf_counter() - started
+        return wall, latencies, errors
@@ -0,0 +1,184 @@
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.sqlite import configured_pragmas, pragma
+
+# SQLite's own defaults, spelled out: a fresh file already has them.
+ROLLBACK_PRAGMAS = {"journal_mode": "delete", "synchronous": "full"}
+
+# Python's sqlite3 (and Django's) default wait for a lock, in seconds.
+DEFAULT_TIMEOUT = 5.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare read and write throughput of a SQLite file under concurrent "
+        "readers and writers, with SQLite's default rollback journal and a new "
+        "connection per request, and with SQLITE_PRAGMAS and reused connections"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--readers", type=int, default=8, help="Reading threads (list pages)"
+        )
+        parser.add_argument(
+            "--writers", type=int, default=2, help="Writing threads (recipe saves)"
+        )
+        parser.add_argument(
+            "--seconds", type=float, default=5.0, help="Duration of each run"
+        )
+        parser.add_argument(
+            "--rows", type=int, default=5000, help="Rows in the benchmark table"
+        )
+
+    def handle(self, *args, **options):
+        if options["readers"] < 0 or options["writers"] < 0:
+            raise CommandError("--readers and --writers can't be negative")
+        if options["readers"] + options["writers"] < 1 or options["rows"] < 1:
+            raise CommandError("Needs at least one thread and one row")
+        runs = [
+            ("rollback journal, new connections", ROLLBACK_PRAGMAS, False),
+            ("SQLITE_PRAGMAS, reused connections", configured_pragmas(), True),
+        ]
+        results = []
+        for name, pragmas, reuse in runs:
+            # A fresh file per run: journal_mode=wal sticks to the file.
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "bench.sqlite3"
+                self.seed(path, options["rows"])
+                result = self.run(path, pragmas, reuse, options)
+            results.append(result)
+            self.report(name, result)
+        base, tuned = results
+        self.stdout.write(
+            f"reads/s x{self.ratio(tuned['reads'], base['reads'])}, "
+            f"writes/s x{self.ratio(tuned['writes'], base['writes'])}"
+        )
+
+    def seed(self, path, rows):
+        with sqlite3.connect(path) as db:
+            db.execute(
+                "CREATE TABLE recipe (id INTEGER PRIMARY KEY, title TEXT NOT NULL, "
+                "instructions TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            db.executemany(
+                "INSERT INTO recipe VALUES (?, ?, ?, ?)",
+                (
+                    (i, f"Recipe {i}", "Mix and bake. " * 40, time.time())
+                    for i in range(1, rows + 1)
+                ),
+            )
+        db.close()
+
+    def run(self, path, pragmas, reuse, options):
+        rows = options["rows"]
+        deadline = time.perf_counter() + options["seconds"]
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        latencies = {"reads": [], "writes": []}
+        lock = threading.Lock()
+
+        def connect():
+            # isolation_level=None: transactions are spelled out below.
+            db = sqlite3.connect(
+                path,
+                timeout=DEFAULT_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            for name, value in pragmas.items():
+                db.execute(pragma(name, value))
+            return db
+
+        def read(db):
+            offset = random.randrange(max(rows - 12, 1))
+            db.execute(
+                "SELECT id, title, updated_at FROM recipe "
+                "ORDER BY id DESC LIMIT 12 OFFSET ?",
+                (offset,),
+            ).fetchall()
+
+        def write(db):
+            pk = random.randint(1, rows)
+            # What Django sends with transaction_mode=IMMEDIATE (settings).
+            db.execute("BEGIN IMMEDIATE" if reuse else "BEGIN")
+            try:
+                db.execute(
+                    "UPDATE recipe SET title = ?, updated_at = ? WHERE id = ?",
+                    (f"Recipe {pk}*", time.time(), pk),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+        def worker(kind, operation):
+            db = connect() if reuse else None
+            done, errors, spent = 0, 0, []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    if reuse:
+                        operation(db)
+                    else:
+                        fresh = connect()
+                        try:
+                            operation(fresh)
+                        finally:
+                            fresh.close()
+                except sqlite3.OperationalError:
+                    # "database is locked" once the timeout ran out.
+                    errors += 1
+                    continue
+                spent.append(time.perf_counter() - started)
+                done += 1
+            if db is not None:
+                db.close()
+            with lock:
+                counts[kind] += done
+                counts["errors"] += errors
+                latencies[kind].extend(spent)
+
+        threads = [
+            threading.Thread(target=worker, args=("reads", read))
+            for _ in range(options["readers"])
+        ] + [
+            threading.Thread(target=worker, args=("writes", write))
+            for _ in range(options["writers"])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        return {
+            "reads": counts["reads"] / wall,
+            "writes": counts["writes"] / wall,
+            "errors": counts["errors"],
+            "read_p99": self.p99(latencies["reads"]),
+            "write_p99": self.p99(latencies["writes"]),
+        }
+
+    def p99(self, latencies):
+        if not latencies:
+            return 0.0
+        latencies.sort()
+        return latencies[int(0.99 * (len(latencies) - 1))] * 1000
+
+    def ratio(self, new, old):
+        return f"{new / old:.2f}" if old else "n/a"
+
+    def report(self, name, result):
+        line = (
+            f"{name}: {result['reads']:.1f} reads/s (p99 {result['read_p99']:.1f} ms), "
+            f"{result['writes']:.1f} writes/s (p99 {result['write_p99']:.1f} ms)"
+        )
+        if result["errors"]:
+            line += f", {result['errors']} locked errors"
+        self.stdout.write(line)
@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes import thumbnails
+from recipes.models import Recipe, StoredImage
+from recipes.storage import image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete recipe images (and their resized copies) that no recipe uses "
+        "any more, after deletes and image replacements"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60,
+            help="Minutes an image must have been unused before it is deleted",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["min_age"])
+        orphans = StoredImage.objects.filter(refs=0, updated_at__lt=cutoff)
+        deleted = repaired = files = 0
+        for image in orphans.order_by("pk").iterator():
+            # Counts miss writes that bypass signals (QuerySet.update);
+            # the recipes table has the final say.
+            refs = Recipe.objects.filter(image=image.name).count()
+            if refs:
+                StoredImage.objects.filter(pk=image.pk).update(refs=refs)
+                repaired += 1
+                continue
+            names = [image.name] + thumbnails.derivative_names(
+                image.name, thumbnails.THUMBNAIL_WIDTHS
+            )
+            names = [name for name in names if image_storage.exists(name)]
+            if options["dry_run"]:
+                for name in names:
+                    self.stdout.write(name)
+            # Conditional, so an upload that just reused the file keeps it.
+            elif StoredImage.objects.filter(pk=image.pk, refs=0).delete()[0]:
+                for name in names:
+                    image_storage.delete(name)
+            else:
+                continue
+            deleted += 1
+            files += len(names)
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {deleted} unused images ({files} files); "
+                f"{repaired} still in use."
+            )
+        )
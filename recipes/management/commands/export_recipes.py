@@ -0,0 +1,91 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.exporting import (
+    EXPORT_FORMATS,
+    gzip_stream,
+    iter_export_items,
+    iter_export_text,
+)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Export recipes as JSON or NDJSON that import_recipes can read back"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output",
+            nargs="?",
+            default="-",
+            help="Output file (default: stdout)",
+        )
+        parser.add_argument(
+            "--format",
+            choices=EXPORT_FORMATS,
+            help="Output format (default: from the file extension, else json)",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the output (implied by a .gz output file)",
+        )
+        parser.add_argument("--username", help="Only export this author's recipes")
+        parser.add_argument(
+            "--with-ids",
+            action="store_true",
+            help="Include recipe ids (import_recipes reads them as feed ids)",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=500, help="Recipes fetched per query"
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        compress = options["gzip"] or output.endswith(".gz")
+        fmt = options["format"]
+        if not fmt:
+            name = output.removesuffix(".gz").lower()
+            fmt = "ndjson" if name.endswith((".ndjson", ".jsonl")) else "json"
+
+        queryset = Recipe.objects.all()
+        if options["username"]:
+            User = get_user_model()
+            try:
+                author = User.objects.get(username=options["username"])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['username']}' not found")
+            queryset = queryset.filter(author=author)
+
+        self.count = 0
+        items = self.counted(
+            iter_export_items(queryset, options["chunk_size"], options["with_ids"])
+        )
+        text = iter_export_text(items, fmt)
+
+        if output == "-" and not compress:
+            for piece in text:
+                self.stdout.write(piece, ending="")
+        else:
+            data = (piece.encode("utf-8") for piece in text)
+            if compress:
+                data = gzip_stream(data)
+            if output == "-":
+                sys.stdout.buffer.writelines(data)
+            else:
+                try:
+                    with open(output, "wb") as f:
+                        f.writelines(data)
+                except OSError as e:
+                    raise CommandError(f"Cannot write {output}: {e}")
+
+        self.stderr.write(self.style.SUCCESS(f"Exported {self.count} recipes."))
+
+    def counted(self, items):
+        for item in items:
+            self.count += 1
+            yield item
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from recipes import thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Generate resized/WebP copies for recipe images that don't have them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate images that already have thumbnails",
+        )
+
+    def handle(self, *args, **options):
+        recipes = (
+            Recipe.objects.exclude(image="")
+            .exclude(image__isnull=True)
+            .only("pk", "image", "image_widths")
+            .order_by("pk")
+        )
+        done = without = 0
+        for recipe in recipes.iterator():
+            if recipe.image_widths and not options["force"]:
+                continue
+            if thumbnails.refresh_recipe_image(recipe, using=recipes.db):
+                done += 1
+            else:
+                # Already small enough, or not an image Pillow can read.
+                without += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated thumbnails for {done} images ({without} left as is)."
+            )
+        )
@@ -1,138 +1,190 @@
+import os
+from collections import Counter
+from itertools import islice
+
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
-from decimal import Decimal
-import json
+from django.db import transaction
 
+from recipes.importing import BulkImporter, Checkpoint, StageTimes, chunked, prepare_items
+from recipes.jsonstream import UnsupportedStructure, iter_recipe_items
 from recipes.models import Recipe, Category, Tag, Ingredient, RecipeIngredient
 
-# --- New: Hungarian → English mappings ---
-KEYS_HU_TO_EN = {
-    # recipe fields
-    "cím": "title",
-    "title": "title",
-    "történet": "story",
-    "leírás": "description",
-    "utasítások": "instructions",
-    "elkészítési_idő": "cooking_time",
-    "főzési_idő": "cooking_time",
-    "elkészítési_idő_egység": "cooking_time_unit",
-    "főzési_idő_egység": "cooking_time_unit",
-    "kategória": "category",
-    "címkék": "tags",
-    "hozzávalók": "ingredients",
-
-    # ingredient item fields
-    "összetevő": "ingredient",
-    "alapanyag": "ingredient",
-    "hozzávaló": "ingredient",
-    "mennyiség": "quantity",
-    "egység": "unit",
-
-    # top-level
-    "receptek": "recipes",
-}
-
-UNITS_HU_TO_EN = {
-    "perc": "min",
-    "percek": "min",
-    "p": "min",
-    "óra": "hr",
-    "órák": "hr",
-    "h": "hr",
-}
-
-def translate_key(k: str) -> str:
-    return KEYS_HU_TO_EN.get(k, k)
-
-def normalize_unit(u: str) -> str:
-    if not u:
-        return ""
-    u_norm = u.strip().lower()
-    return UNITS_HU_TO_EN.get(u_norm, u.strip())
-
-def normalize_recipe_item(item: dict) -> dict:
-    """Return a new dict with English keys and normalized ingredient entries."""
-    out = {}
-    # First pass: translate top-level keys
-    for k, v in item.items():
-        out_key = translate_key(k)
-        out[out_key] = v
-
-    # Normalize ingredients list (translate keys inside each ingredient)
-    ingredients = out.get("ingredients") or []
-    norm_ingredients = []
-    for ing in ingredients:
-        if not isinstance(ing, dict):
-            continue
-        ing_norm = {}
-        for k, v in ing.items():
-            k_en = translate_key(k)
-            ing_norm[k_en] = v
-        # Normalize unit text
-        ing_norm["unit"] = normalize_unit(str(ing_norm.get("unit", "")))
-        norm_ingredients.append(ing_norm)
-    out["ingredients"] = norm_ingredients
-
-    # Normalize cooking_time_unit if present
-    if "cooking_time_unit" in out:
-        out["cooking_time_unit"] = normalize_unit(str(out["cooking_time_unit"]))
-
-    return out
-# --- end new ---
+# Re-exported: the normalization helpers used to live in this module.
+from recipes.normalization import (  # noqa: F401
+    KEYS_HU_TO_EN,
+    UNITS_HU_TO_EN,
+    normalize_recipe_item,
+    normalize_unit,
+    translate_key,
+)
 
 User = get_user_model()
 
 class Command(BaseCommand):
-    help = "Import recipes from a JSON file"
+    help = "Import recipes from a JSON or NDJSON file"
 
     def add_arguments(self, parser):
-        parser.add_argument("json_path", type=str, help="Path to JSON file")
-        parser.add_argument("--username", type=str, required=True, help="Author username to assign")
-        parser.add_argument("--update", action="store_true", help="Update if recipe with same title exists")
+        parser.add_argument("json_path", type=str, help="Path to JSON/NDJSON file")
+        parser.add_argument("--username", type=str, help="Author username to assign (required unless --dry-run)")
+        parser.add_argument("--update", action="store_true", help="Update if recipe with same title (or feed id) exists; unchanged ones are skipped by content hash (implies --bulk)")
+        parser.add_argument("--bulk", action="store_true", help="Batched bulk inserts with cached lookups (much faster for large files)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Recipes per batch/transaction")
+        parser.add_argument("--format", choices=("auto", "json", "ndjson"), default="auto", help="Input format (auto: detect from extension and content)")
+        parser.add_argument("--workers", type=int, default=1, help="Processes for parsing/normalization/validation (the database writer stays single)")
+        parser.add_argument("--resume", action="store_true", help="Continue after the last batch committed by an interrupted run of the same file")
+        parser.add_argument("--checkpoint", type=str, help="Checkpoint file (default: <json_path>.checkpoint)")
+        parser.add_argument("--dry-run", action="store_true", help="Parse, normalize and validate only; write nothing")
+        parser.add_argument("--stats", action="store_true", help="Report throughput and validation errors per field")
 
     def handle(self, *args, **options):
         path = options["json_path"]
         username = options["username"]
         do_update = options["update"]
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+        dry_run = options["dry_run"]
+        if dry_run and options["resume"]:
+            raise CommandError("--resume cannot be combined with --dry-run")
+
+        author = None
+        if not dry_run:
+            if not username:
+                raise CommandError("--username is required")
+            try:
+                author = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User '{username}' not found")
+
+        fmt = options["format"]
+        if fmt == "auto" and path.lower().endswith((".ndjson", ".jsonl")):
+            fmt = "ndjson"
 
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception as e:
+            f = open(path, "r", encoding="utf-8")
+        except OSError as e:
             raise CommandError(f"Cannot read JSON: {e}")
 
-        # Accept list or dict with "recipes" or Hungarian "receptek"
-        if isinstance(data, list):
-            raw_items = data
-        elif isinstance(data, dict):
-            raw_items = data.get("recipes") or data.get("receptek")
-            if raw_items is None:
-                raise CommandError("JSON must be a list or an object with 'recipes' or 'receptek'.")
-        else:
-            raise CommandError("Unsupported JSON structure.")
-
-        # Normalize each recipe item (keys and units)
-        items = [normalize_recipe_item(it) for it in raw_items]
+        checkpoint = Checkpoint(options["checkpoint"] or f"{path}.checkpoint", path)
+        offset = 0
+        if options["resume"]:
+            try:
+                offset = checkpoint.load()
+            except ValueError as e:
+                raise CommandError(f"Cannot resume: {e}")
+            if offset:
+                self.stdout.write(f"Resuming after item {offset}")
+
+        stats = StageTimes()
+        self.invalid = 0
+        self.position = offset
+        self.errors = Counter()
+        with f:
+            # Lazy pipeline: read -> normalize/validate (optionally in worker
+            # processes, order preserved) -> single writer, one chunk at a time.
+            raw_items = islice(self.read_items(f, fmt), offset, None)
+            prepared = prepare_items(raw_items, workers=options["workers"], stats=stats)
+            items = self.valid_items(prepared, start=offset + 1)
+
+            # Each chunk commits on its own; the checkpoint only moves once it has.
+            def save_checkpoint():
+                checkpoint.save(self.position)
+
+            if dry_run:
+                valid = sum(1 for _ in items)
+                summary = f"Dry run, nothing written. Valid: {valid}"
+            elif options["bulk"] or do_update:
+                # Only BulkImporter keeps content hashes (ImportRecord) and
+                # diffs lines, so updates always go through it.
+                importer = BulkImporter(
+                    author, update=do_update, batch_size=batch_size
+                ).run(items, stats=stats, after_chunk=save_checkpoint)
+                summary = (
+                    f"Imported. Created: {importer.created}, Updated: {importer.updated}, "
+                    f"Unchanged: {importer.unchanged}, Skipped existing: {importer.skipped}"
+                )
+            else:
+                created = skipped = 0
+                for chunk in chunked(items, batch_size):
+                    with stats.measure("write"), transaction.atomic():
+                        c, s = self.import_items(chunk, author)
+                    save_checkpoint()
+                    created += c
+                    skipped += s
+                summary = (
+                    f"Imported. Created: {created}, Updated: 0, "
+                    f"Skipped existing: {skipped}"
+                )
 
+        if not dry_run:
+            checkpoint.clear()
+        if self.invalid:
+            summary += f", Invalid: {self.invalid}"
+        self.stdout.write(self.style.SUCCESS(summary))
+        self.stdout.write(f"Stage times: {stats.summary()}")
+        if options["stats"]:
+            self.write_stats(self.position - offset, os.path.getsize(path), stats.total)
+
+    def write_stats(self, count, size, seconds):
+        seconds = max(seconds, 1e-9)
+        self.stdout.write(
+            f"Items: {count} in {seconds:.2f}s ({count / seconds:.0f} items/s, "
+            f"{size / seconds / 1024 / 1024:.2f} MB/s over {size} bytes)"
+        )
+        if not self.errors:
+            self.stdout.write("Validation errors: none")
+            return
+        self.stdout.write("Validation errors by field:")
+        for field, n in self.errors.most_common():
+            self.stdout.write(f"  {field}: {n}")
+
+    def read_items(self, f, fmt):
         try:
-            author = User.objects.get(username=username)
-        except User.DoesNotExist:
-            raise CommandError(f"User '{username}' not found")
+            yield from iter_recipe_items(f, fmt, raw_lines=True)
+        except UnsupportedStructure as e:
+            raise CommandError(str(e))
+        except ValueError as e:
+            raise CommandError(f"Cannot read JSON: {e}")
 
-        created = updated = 0
+    def valid_items(self, prepared, start=1):
+        """Report and drop items that failed validation."""
+        for position, (item, errors) in enumerate(prepared, start=start):
+            # Paused at a yield, position is the last item of the chunk being written.
+            self.position = position
+            self.errors.update(field for field, _ in errors)
+            if not errors:
+                yield item
+                continue
+            if errors == [("title", "missing")]:
+                self.stderr.write("Skipping item without title")
+                continue
+            self.invalid += 1
+            details = "; ".join(f"{field}: {message}" for field, message in errors)
+            self.stderr.write(f"Skipping item {position} ({item.get('title')!r}): {details}")
+
+    def import_items(self, items, author):
+        """
+        The original one-query-per-row import of new recipes; returns
+        (created, skipped). Existing ones are left alone (--update goes
+        through BulkImporter).
+        """
+        created = skipped = 0
 
         for item in items:
-            title = item.get("title")
-            if not title:
-                self.stderr.write("Skipping item without title")
+            title = item["title"]
+            if Recipe.objects.filter(title=title).exists():
+                skipped += 1
                 continue
 
             defaults = {
-                "story": item.get("story", ""),
-                "description": item.get("description", ""),
-                "instructions": item.get("instructions", ""),
-                "cooking_time": item.get("cooking_time", 0) or 0,
-                "cooking_time_unit": item.get("cooking_time_unit", "min"),
+                "story": item["story"],
+                "description": item["description"],
+                "instructions": item["instructions"],
+                "cooking_time": item["cooking_time"],
+                "cooking_time_unit": item["cooking_time_unit"],
                 "author": author,
                 "category": None,
             }
@@ -141,43 +193,23 @@ class Command(BaseCommand):
             if cat_name:
                 defaults["category"], _ = Category.objects.get_or_create(name=cat_name)
 
-            recipe, was_created = Recipe.objects.get_or_create(title=title, defaults=defaults)
-            if not was_created and do_update:
-                for k, v in defaults.items():
-                    setattr(recipe, k, v)
-                recipe.save()
-                updated += 1
-            elif was_created:
-                created += 1
+            recipe = Recipe.objects.create(title=title, **defaults)
+            created += 1
 
-            # Tags
             tag_objs = []
-            for t in (item.get("tags") or []):
+            for t in item["tags"]:
                 tag, _ = Tag.objects.get_or_create(name=t)
                 tag_objs.append(tag)
-            if do_update:
-                recipe.tags.set(tag_objs)  # clears if empty; sets if provided
-            elif tag_objs:
+            if tag_objs:
                 recipe.tags.set(tag_objs)
 
-            # Ingredients
-            if do_update:
-                RecipeIngredient.objects.filter(recipe=recipe).delete()
-
-            for ing in (item.get("ingredients") or []):
-                name = ing.get("ingredient") or ing.get("name")
-                if not name:
-                    continue
-                ingredient_obj, _ = Ingredient.objects.get_or_create(name=name)
-
-                try:
-                    qty = Decimal(str(ing.get("quantity", "0")))
-                except Exception:
-                    qty = Decimal("0")
-
-                unit = (ing.get("unit") or "").strip()
+            for line in item["ingredients"]:
+                ingredient_obj, _ = Ingredient.objects.get_or_create(name=line["ingredient"])
                 RecipeIngredient.objects.create(
-                    recipe=recipe, ingredient=ingredient_obj, quantity=qty, unit=unit
+                    recipe=recipe,
+                    ingredient=ingredient_obj,
+                    quantity=line["quantity"],
+                    unit=line["unit"],
                 )
 
-        self.stdout.write(self.style.SUCCESS(f"Imported. Created: {created}, Updated: {updated}"))
+        return created, skipped
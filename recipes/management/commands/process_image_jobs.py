@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import jobs
+from recipes.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = "Run queued image jobs (thumbnails) outside the web process"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new jobs instead of exiting when idle",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5.0, help="Seconds between polls"
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Queue failed jobs again before running",
+        )
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            requeued = ImageJob.objects.filter(status=ImageJob.FAILED).update(
+                status=ImageJob.PENDING, attempts=0
+            )
+            self.stdout.write(f"Re-queued {requeued} failed jobs.")
+        while True:
+            count = jobs.run_pending()
+            if count or not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"Ran {count} image jobs."))
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
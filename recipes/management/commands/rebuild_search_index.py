@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the recipe full-text search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", default="default", help="Database alias to rebuild"
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if connections[using].vendor != "sqlite":
+            raise CommandError(
+                "The full-text index is SQLite FTS5 only; other backends use "
+                "the plain icontains search."
+            )
+        with transaction.atomic(using=using):
+            count = search.rebuild_index(using=using)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} recipes."))
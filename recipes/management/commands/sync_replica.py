@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into a replica's file (online backup), "
+        "the local stand-in for replication"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "replica",
+            nargs="?",
+            default="replica",
+            help="Replica alias (default: replica)",
+        )
+        parser.add_argument(
+            "--database", default="default", help="Primary alias (default: default)"
+        )
+
+    def handle(self, *args, **options):
+        primary, replica = options["database"], options["replica"]
+        for alias in (primary, replica):
+            if alias not in connections.settings:
+                raise CommandError(f"Unknown database: {alias}")
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(f"{alias} isn't a SQLite database")
+        if primary == replica:
+            raise CommandError("The primary and the replica must differ")
+
+        source, target = connections[primary], connections[replica]
+        source.ensure_connection()
+        target.ensure_connection()
+        # Consistent even while the primary is being written to.
+        source.connection.backup(target.connection)
+        self.stdout.write(f"Copied {primary} to {replica}")
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# The statements as of this migration, not recipes.search's current ones.
+CREATE_FTS_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5("
+    "title, description, story, instructions, tags, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+FILL_FTS_SQL = """
+    INSERT INTO recipes_recipe_fts (rowid, title, description, story, instructions, tags)
+    SELECT r.id, r.title, COALESCE(r.description, ''), r.story, r.instructions,
+           COALESCE((SELECT group_concat(t.name, ' ')
+                     FROM recipes_recipe_tags rt
+                     JOIN recipes_tag t ON t.id = rt.tag_id
+                     WHERE rt.recipe_id = r.id), '')
+    FROM recipes_recipe r
+"""
+
+OPTIMIZE_FTS_SQL = (
+    "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) VALUES ('optimize')"
+)
+
+DROP_FTS_SQL = "DROP TABLE IF EXISTS recipes_recipe_fts"
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(DROP_FTS_SQL)
+    schema_editor.execute(CREATE_FTS_SQL)
+    schema_editor.execute(FILL_FTS_SQL)
+    schema_editor.execute(OPTIMIZE_FTS_SQL)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(DROP_FTS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0003_recipe_cooking_time_unit_alter_recipe_cooking_time"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-16 20:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0005_importrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_widths",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
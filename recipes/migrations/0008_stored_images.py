@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:16
+
+import recipes.storage
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    """Existing (flat, un-hashed) uploads start out with their real counts."""
+    Recipe = apps.get_model("recipes", "Recipe")
+    StoredImage = apps.get_model("recipes", "StoredImage")
+    db = schema_editor.connection.alias
+    counts = (
+        Recipe.objects.using(db)
+        .exclude(image="")
+        .exclude(image__isnull=True)
+        .values("image")
+        .annotate(refs=models.Count("pk"))
+        .order_by()
+    )
+    StoredImage.objects.using(db).bulk_create(
+        StoredImage(name=row["image"], refs=row["refs"]) for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0007_imagejob"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=recipes.storage.HashedImageField(
+                blank=True,
+                null=True,
+                storage=recipes.storage.ContentAddressedStorage(),
+                upload_to="recipes/",
+            ),
+        ),
+        migrations.CreateModel(
+            name="StoredImage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("refs", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["refs", "updated_at"],
+                        name="recipes_sto_refs_d3e5f5_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
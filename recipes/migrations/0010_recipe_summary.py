@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0009_recipe_timestamps"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="author_name",
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="category_name",
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="ingredient_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="tag_names",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:24
+
+from django.db import migrations, models
+
+
+def fill_cooking_minutes(apps, schema_editor):
+    """One UPDATE converting hours, like cookingtime.minutes_expression()."""
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.using(schema_editor.connection.alias).update(
+        cooking_minutes=models.Case(
+            models.When(cooking_time_unit="hr", then=models.F("cooking_time") * 60),
+            default=models.F("cooking_time"),
+            output_field=models.PositiveIntegerField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0010_recipe_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="cooking_minutes",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_cooking_minutes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["cooking_minutes", "id"], name="recipes_rec_cooking_9e25f0_idx"
+            ),
+        ),
+    ]
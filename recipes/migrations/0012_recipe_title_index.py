@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0011_recipe_cooking_minutes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["title", "id"], name="recipes_rec_title_3771db_idx"
+            ),
+        ),
+    ]
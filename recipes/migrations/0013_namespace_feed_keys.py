@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:52
+
+from django.db import migrations
+
+
+def namespace_feed_keys(apps, schema_editor):
+    """Feed id keys become per author, like BulkImporter._source_key()."""
+    ImportRecord = apps.get_model("recipes", "ImportRecord")
+    records = ImportRecord.objects.using(schema_editor.connection.alias)
+    changed = []
+    for record in records.filter(source_key__startswith="id:").select_related("recipe"):
+        record.source_key = f"user:{record.recipe.author_id}:{record.source_key}"
+        changed.append(record)
+    records.bulk_update(changed, ["source_key"], batch_size=500)
+
+
+def unnamespace_feed_keys(apps, schema_editor):
+    ImportRecord = apps.get_model("recipes", "ImportRecord")
+    records = ImportRecord.objects.using(schema_editor.connection.alias)
+    changed = []
+    for record in records.filter(source_key__regex=r"^user:[0-9]+:id:"):
+        record.source_key = record.source_key.split(":", 2)[2]
+        changed.append(record)
+    records.bulk_update(changed, ["source_key"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0012_recipe_title_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(namespace_feed_keys, unnamespace_feed_keys),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:40
+
+from django.db import migrations
+
+
+def namespace_title_keys(apps, schema_editor):
+    """Title keys become per author too, like BulkImporter._source_key()."""
+    ImportRecord = apps.get_model("recipes", "ImportRecord")
+    records = ImportRecord.objects.using(schema_editor.connection.alias)
+    # Keys the batch API already wrote win over the command's.
+    taken = set(
+        records.filter(source_key__startswith="user:").values_list(
+            "source_key", flat=True
+        )
+    )
+    changed = []
+    for record in records.filter(source_key__startswith="title:").select_related(
+        "recipe"
+    ):
+        key = f"user:{record.recipe.author_id}:{record.source_key}"
+        if key not in taken:
+            record.source_key = key
+            changed.append(record)
+    records.bulk_update(changed, ["source_key"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0013_namespace_feed_keys"),
+    ]
+
+    operations = [
+        migrations.RunPython(namespace_title_keys, migrations.RunPython.noop),
+    ]
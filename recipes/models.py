@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .storage import HashedImageField, image_storage
+
 
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -34,7 +37,14 @@ class Recipe(models.Model):
     cooking_time_unit = models.CharField(
         max_length=3, choices=COOKING_TIME_UNITS, default="min"
     )
-    image = models.ImageField(upload_to="recipes/", null=True, blank=True)
+    # cooking_time in minutes, for filtering and sorting (cookingtime.py).
+    cooking_minutes = models.PositiveIntegerField(default=0, editable=False)
+    # Named by content and sharded, e.g. recipes/3a/7f/3a7f...c1.jpg (see storage.py).
+    image = HashedImageField(
+        upload_to="recipes/", storage=image_storage, null=True, blank=True
+    )
+    # Widths of the resized copies next to the image (see thumbnails.py).
+    image_widths = models.JSONField(default=list, blank=True, editable=False)
 
     description = models.TextField(blank=True, null=True)
     instructions = models.TextField()
@@ -44,6 +54,25 @@ class Recipe(models.Model):
 
     ingredients = models.ManyToManyField(Ingredient, blank=True)
 
+    # Copies of what list pages show, so they read the recipe table alone
+    # (summaries.py). Kept current by signals.py and the importer.
+    author_name = models.CharField(max_length=150, blank=True, editable=False)
+    category_name = models.CharField(max_length=50, blank=True, editable=False)
+    tag_names = models.JSONField(default=list, blank=True, editable=False)
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when tags, ingredient lines or names shown with the recipe
+    # change (signals.py); pages use it for conditional GETs.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["cooking_minutes", "id"]),
+            # Importers match recipes by title, oldest first.
+            models.Index(fields=["title", "id"]),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -73,3 +102,64 @@ class RecipeIngredient(models.Model):
 
     def __str__(self):
         return f"{self.quantity} {self.unit} {self.ingredient.name}"
+
+
+class ImportRecord(models.Model):
+    """What import_recipes last wrote for one feed item, to skip unchanged ones."""
+
+    source_key = models.CharField(max_length=255, unique=True)
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, related_name="import_record"
+    )
+    content_hash = models.CharField(max_length=64)
+    imported_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source_key
+
+
+class ImageJob(models.Model):
+    """Queued post-processing (thumbnails) of one uploaded Recipe.image."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="image_jobs"
+    )
+    # The file the job was queued for; a newer upload makes it stale.
+    image = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.image} ({self.status})"
+
+
+class StoredImage(models.Model):
+    """A file in image_storage and how many recipes use it."""
+
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["refs", "updated_at"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.refs})"
@@ -0,0 +1,249 @@
+"""
+Pure (Django-free) parsing, normalization and validation of import items.
+
+Nothing here touches the ORM, so these functions can run in worker
+processes (``import_recipes --workers N``) without setting Django up.
+"""
+
+import hashlib
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+# Hungarian → English mappings
+KEYS_HU_TO_EN = {
+    # recipe fields
+    "cím": "title",
+    "title": "title",
+    "történet": "story",
+    "leírás": "description",
+    "utasítások": "instructions",
+    "elkészítési_idő": "cooking_time",
+    "főzési_idő": "cooking_time",
+    "elkészítési_idő_egység": "cooking_time_unit",
+    "főzési_idő_egység": "cooking_time_unit",
+    "kategória": "category",
+    "címkék": "tags",
+    "hozzávalók": "ingredients",
+    # ingredient item fields
+    "összetevő": "ingredient",
+    "alapanyag": "ingredient",
+    "hozzávaló": "ingredient",
+    "mennyiség": "quantity",
+    "egység": "unit",
+    # the feed's own identifier for a recipe
+    "id": "source_id",
+    "azonosító": "source_id",
+    # top-level
+    "receptek": "recipes",
+}
+
+UNITS_HU_TO_EN = {
+    "perc": "min",
+    "percek": "min",
+    "p": "min",
+    "óra": "hr",
+    "órák": "hr",
+    "h": "hr",
+}
+
+
+def translate_key(k: str) -> str:
+    return KEYS_HU_TO_EN.get(k, k)
+
+
+def normalize_unit(u: str) -> str:
+    if not u:
+        return ""
+    u_norm = u.strip().lower()
+    return UNITS_HU_TO_EN.get(u_norm, u.strip())
+
+
+def normalize_recipe_item(item: dict) -> dict:
+    """Return a new dict with English keys and normalized ingredient entries."""
+    out = {}
+    # First pass: translate top-level keys
+    for k, v in item.items():
+        out_key = translate_key(k)
+        out[out_key] = v
+
+    # Normalize ingredients list (translate keys inside each ingredient)
+    ingredients = out.get("ingredients") or []
+    norm_ingredients = []
+    for ing in ingredients:
+        if not isinstance(ing, dict):
+            continue
+        ing_norm = {}
+        for k, v in ing.items():
+            k_en = translate_key(k)
+            ing_norm[k_en] = v
+        # Normalize unit text
+        ing_norm["unit"] = normalize_unit(str(ing_norm.get("unit", "")))
+        norm_ingredients.append(ing_norm)
+    out["ingredients"] = norm_ingredients
+
+    # Normalize cooking_time_unit if present
+    if "cooking_time_unit" in out:
+        out["cooking_time_unit"] = normalize_unit(str(out["cooking_time_unit"]))
+
+    return out
+
+
+# Model limits the importer checks before anything reaches the database.
+COOKING_TIME_UNITS = ("min", "hr")
+MAX_LENGTHS = {"title": 100, "category": 50, "tag": 30, "ingredient": 100}
+# Recipe.cooking_minutes is a PositiveIntegerField (32 bits on most
+# backends); this keeps it in range whichever the unit.
+MAX_COOKING_TIME = (2**31 - 1) // 60
+# RecipeIngredient.quantity: max_digits and decimal_places.
+QUANTITY_DIGITS, QUANTITY_PLACES = 5, 2
+
+
+def parse_quantity(value) -> Decimal:
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return Decimal("0")
+
+
+def quantity_fits(quantity: Decimal) -> bool:
+    """Whether a finite quantity is stored exactly by RecipeIngredient.quantity."""
+    limit = 10 ** (QUANTITY_DIGITS - QUANTITY_PLACES)
+    places = Decimal(1).scaleb(-QUANTITY_PLACES)
+    return abs(quantity) < limit and quantity == quantity.quantize(places)
+
+
+def _parse_cooking_time(value):
+    if value in (None, ""):
+        return 0
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    if number < 0 or number != number.to_integral_value():
+        return None
+    return int(number)
+
+
+def prepare_recipe_item(raw) -> tuple:
+    """
+    Normalize one raw item (a dict, or an NDJSON line still to be decoded)
+    and coerce it to the types the writer needs.
+
+    Returns ``(item, errors)``; errors is a list of ``(field, message)``
+    pairs and a non-empty list means the item must not be written.
+    """
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            return {}, [("json", str(e))]
+    if not isinstance(raw, dict):
+        return {}, [("item", "not an object")]
+
+    item = normalize_recipe_item(raw)
+    errors = []
+
+    title = item.get("title")
+    if not title:
+        errors.append(("title", "missing"))
+    else:
+        title = item["title"] = str(title)
+        if len(title) > MAX_LENGTHS["title"]:
+            errors.append(("title", "too long"))
+
+    for field in ("story", "description", "instructions"):
+        item[field] = str(item.get(field) or "")
+
+    cooking_time = _parse_cooking_time(item.get("cooking_time"))
+    if cooking_time is None:
+        errors.append(("cooking_time", "not a non-negative integer"))
+    elif cooking_time > MAX_COOKING_TIME:
+        errors.append(("cooking_time", "too large"))
+        cooking_time = None
+    item["cooking_time"] = cooking_time or 0
+
+    unit = item.get("cooking_time_unit") or "min"
+    if unit not in COOKING_TIME_UNITS:
+        errors.append(("cooking_time_unit", f"unknown unit {unit!r}"))
+    item["cooking_time_unit"] = unit
+
+    category = item.get("category")
+    if category:
+        category = item["category"] = str(category)
+        if len(category) > MAX_LENGTHS["category"]:
+            errors.append(("category", "too long"))
+
+    tags = item.get("tags") or []
+    if not isinstance(tags, list):
+        errors.append(("tags", "not a list"))
+        tags = []
+    item["tags"] = [str(t) for t in tags if t]
+    if any(len(t) > MAX_LENGTHS["tag"] for t in item["tags"]):
+        errors.append(("tags", "name too long"))
+
+    lines = []
+    for ing in item["ingredients"]:
+        name = ing.get("ingredient") or ing.get("name")
+        if not name:
+            continue
+        name = str(name)
+        if len(name) > MAX_LENGTHS["ingredient"]:
+            errors.append(("ingredients", "name too long"))
+        quantity = parse_quantity(ing.get("quantity", "0"))
+        if not quantity.is_finite():
+            errors.append(("ingredients", "quantity not a finite number"))
+            quantity = Decimal("0")
+        elif not quantity_fits(quantity):
+            errors.append(("ingredients", "quantity out of range"))
+        lines.append(
+            {
+                "ingredient": name,
+                "quantity": quantity,
+                "unit": (ing.get("unit") or "").strip(),
+            }
+        )
+    item["ingredients"] = lines
+
+    if item.get("source_id") not in (None, ""):
+        item["source_id"] = str(item["source_id"])
+    item["content_hash"] = content_hash(item)
+
+    return item, errors
+
+
+HASHED_FIELDS = (
+    "title",
+    "story",
+    "description",
+    "instructions",
+    "cooking_time",
+    "cooking_time_unit",
+    "category",
+)
+
+
+def content_hash(item) -> str:
+    """Stable digest of everything the importer writes for a prepared item."""
+    payload = {field: item.get(field) for field in HASHED_FIELDS}
+    payload["tags"] = sorted(set(item["tags"]))
+    payload["ingredients"] = sorted(
+        [line["ingredient"], str(line["quantity"].normalize()), line["unit"]]
+        for line in item["ingredients"]
+    )
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def source_key(item) -> str:
+    """What identifies an item across imports: its feed id, else its title."""
+    if item.get("source_id"):
+        return f"id:{item['source_id']}"
+    return f"title:{item['title']}"
+
+
+def prepare_batch(raw_items) -> tuple:
+    """Worker entry point: prepare a list of items, return them with CPU time."""
+    started = time.process_time()
+    prepared = [prepare_recipe_item(raw) for raw in raw_items]
+    return prepared, time.process_time() - started
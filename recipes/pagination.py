@@ -0,0 +1,220 @@
+import base64
+import binascii
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import models
+from django.db.models import Q
+
+# What SQLite (and a PostgreSQL bigint) can store.
+MIN_INTEGER, MAX_INTEGER = -(2**63), 2**63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list) or not all(
+        isinstance(v, (int, float, str)) and not isinstance(v, bool) for v in values
+    ):
+        raise InvalidCursor(token)
+    return values
+
+
+def valid_cursor_value(field, value):
+    """
+    Whether a decoded cursor value fits the column it is compared with: a
+    64-bit integer, a finite number or a string, per field type. Values
+    for other columns (or none known) only need to be finite.
+    """
+    if isinstance(value, bool):
+        return False
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return isinstance(value, int) and MIN_INTEGER <= value <= MAX_INTEGER
+    if isinstance(field, (models.FloatField, models.DecimalField)):
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    if isinstance(field, (models.CharField, models.TextField)):
+        return isinstance(value, str)
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return isinstance(value, (int, str))
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator; iterates like a Paginator page."""
+
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[0])
+
+
+class KeysetPaginator:
+    """
+    Cursor ("seek") pagination: pages are found with a WHERE on the sort
+    keys of the last row seen instead of OFFSET, and nothing is counted,
+    so page 1000 costs the same as page 1.
+
+    The ordering defaults to the queryset's own ``order_by()`` and must
+    end in a unique column (``id``) so every row has a distinct position.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering or queryset.query.order_by or ("-pk",))
+        self.keys = [
+            (field.lstrip("-"), field.startswith("-")) for field in self.ordering
+        ]
+        self.key_fields = [self._field(name) for name, _ in self.keys]
+
+    def _field(self, name):
+        """The model field or annotation behind a sort key, if known."""
+        query = self.queryset.query
+        if name in query.annotations:
+            return query.annotations[name].output_field
+        opts = self.queryset.model._meta
+        try:
+            return opts.pk if name == "pk" else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def cursor_for(self, obj):
+        if isinstance(obj, dict):
+            return encode_cursor(obj[name] for name, _ in self.keys)
+        return encode_cursor(getattr(obj, name) for name, _ in self.keys)
+
+    def _seek(self, values, forward):
+        # (a, b) "after" (x, y) == a > x OR (a = x AND b > y), per direction.
+        condition = Q()
+        for i, (name, descending) in enumerate(self.keys):
+            lookup = "lt" if descending == forward else "gt"
+            term = Q(**{f"{name}__{lookup}": values[i]})
+            for j in range(i):
+                term &= Q(**{self.keys[j][0]: values[j]})
+            condition |= term
+        return condition
+
+    def _reversed_ordering(self):
+        return [name if descending else f"-{name}" for name, descending in self.keys]
+
+    def parse_cursor(self, after, before):
+        """(cursor values or None, forward); bad cursors mean the first page."""
+        try:
+            if before:
+                values = decode_cursor(before)
+                forward = False
+            elif after:
+                values = decode_cursor(after)
+                forward = True
+            else:
+                values, forward = None, True
+            if values is not None and (
+                len(values) != len(self.keys)
+                or not all(map(valid_cursor_value, self.key_fields, values))
+            ):
+                raise InvalidCursor(before or after)
+        except InvalidCursor:
+            values, forward = None, True
+        return values, forward
+
+    def _page_query(self, after, before):
+        """(queryset of up to per_page + 1 rows, cursor values, forward)."""
+        values, forward = self.parse_cursor(after, before)
+        qs = self.queryset.order_by(*self.ordering)
+        if values is not None:
+            qs = qs.filter(self._seek(values, forward))
+        if not forward:
+            qs = qs.order_by(*self._reversed_ordering())
+        return qs[: self.per_page + 1], values, forward
+
+    def _make_page(self, rows, values, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+
+        if forward:
+            return KeysetPage(
+                rows, self, has_next=has_more, has_previous=values is not None
+            )
+        rows.reverse()
+        return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+
+    def get_page(self, after=None, before=None):
+        """Return the page after/before the given cursor; bad cursors give page 1."""
+        qs, values, forward = self._page_query(after, before)
+        return self._make_page(list(qs), values, forward)
+
+    async def aget_page(self, after=None, before=None):
+        qs, values, forward = self._page_query(after, before)
+        return self._make_page([row async for row in qs], values, forward)
+
+
+def paginate(request, queryset, per_page=12):
+    """
+    Cursor pagination (?after= / ?before=) by default; old ?page=N links
+    still get the offset Paginator as a fallback.
+    """
+    if request.GET.get("page"):
+        return Paginator(queryset, per_page).get_page(request.GET.get("page"))
+    return KeysetPaginator(queryset, per_page).get_page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
+
+
+async def apaginate(request, queryset, per_page=12):
+    """paginate() for async views: the page's rows are already fetched."""
+    if request.GET.get("page"):
+        paginator = Paginator(queryset, per_page)
+        paginator.count = await queryset.acount()
+        page = paginator.get_page(request.GET.get("page"))
+        page.object_list = [obj async for obj in page.object_list]
+        return page
+    return await KeysetPaginator(queryset, per_page).aget_page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
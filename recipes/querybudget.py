@@ -0,0 +1,156 @@
+"""
+Query budgets: how many SQL statements a view may run, whatever the data.
+
+    @query_budget(4)
+    def view(request): ...
+
+    with query_budget(2, name="card misses"):
+        ...
+
+Going over budget raises QueryBudgetExceeded when the QUERY_BUDGET_RAISE
+setting is true (default: DEBUG) and logs a warning otherwise, so a
+regression (a lost select_related, a template walking a relation) fails
+in development and the test suite but never takes a page down. Views
+that write pass ``raises=False``: the budget is checked once the writes
+have committed, and raising then would answer a successful save with a
+500.
+
+DuplicateQueryMiddleware (DEBUG only, see settings) reports the other
+side of the same bug: a SELECT that runs again and again with only the
+parameters changing within one request, the signature of an N+1 loop.
+Repeated writes (one INSERT per saved form line) are left alone.
+"""
+
+import functools
+import logging
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class record_queries:
+    """
+    Collects the SQL of every statement run on ``using`` inside it, or on
+    any database when ``using`` is None (views may read from replicas).
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+
+    def _record(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.queries = []
+        targets = connections.all() if self.using is None else [connections[self.using]]
+        self._wrappers = ExitStack()
+        for connection in targets:
+            self._wrappers.enter_context(connection.execute_wrapper(self._record))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._wrappers.__exit__(exc_type, exc, tb)
+
+
+class query_budget(record_queries):
+    """Context manager and (sync or async) view decorator; see module docs."""
+
+    def __init__(self, max_queries, name=None, using=None, raises=None):
+        super().__init__(using)
+        self.max_queries = max_queries
+        self.name = name
+        self.raises = raises
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        if exc_type is None and len(self.queries) > self.max_queries:
+            message = (
+                f"{self.name or 'block'} ran {len(self.queries)} queries, "
+                f"budget {self.max_queries}"
+            )
+            raises = self.raises
+            if raises is None:
+                raises = getattr(settings, "QUERY_BUDGET_RAISE", settings.DEBUG)
+            if raises:
+                raise QueryBudgetExceeded(
+                    "\n".join([message, *(f"  {sql}" for sql in self.queries)])
+                )
+            logger.warning(message)
+
+    def _budget(self, func):
+        # A fresh instance per call: views run concurrently.
+        return query_budget(
+            self.max_queries, self.name or func.__qualname__, self.using, self.raises
+        )
+
+    def __call__(self, func):
+        if iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self._budget(func):
+                    return await func(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self._budget(func):
+                    return func(*args, **kwargs)
+
+        return wrapper
+
+
+def repeated_queries(queries, threshold):
+    """(sql, count) of SELECTs run at least ``threshold`` times."""
+    counts = Counter(
+        sql for sql in queries if sql.lstrip().upper().startswith("SELECT")
+    )
+    return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+
+@sync_and_async_middleware
+def DuplicateQueryMiddleware(get_response):
+    """
+    Log SELECTs a request ran DUPLICATE_QUERY_THRESHOLD (default 3) or
+    more times with different parameters, and count them in an
+    X-Duplicate-Queries response header.
+    """
+    threshold = getattr(settings, "DUPLICATE_QUERY_THRESHOLD", 3)
+
+    def report(request, response, queries):
+        repeated = repeated_queries(queries, threshold)
+        for sql, count in repeated:
+            logger.warning(
+                "%s %s ran %d times: %s", request.method, request.path, count, sql
+            )
+        if repeated:
+            response["X-Duplicate-Queries"] = str(len(repeated))
+        return response
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            with record_queries() as recorded:
+                response = await get_response(request)
+            return report(request, response, recorded.queries)
+
+    else:
+
+        def middleware(request):
+            with record_queries() as recorded:
+                response = get_response(request)
+            return report(request, response, recorded.queries)
+
+    return middleware
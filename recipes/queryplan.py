@@ -0,0 +1,93 @@
+"""
+EXPLAIN for the SELECTs a block of code runs, to catch full table scans.
+
+    with PlanCapture() as capture:
+        client.get(url)
+    capture.full_scans(min_rows=50)  # [(table, sql, plan), ...]
+
+A scan is a problem only on a table big enough to matter (min_rows), and
+only when the database can't stop early: a scan that walks a table in
+its stored order (``ORDER BY id`` with a LIMIT, no WHERE) reads just one
+page of rows and is allowed. Plans are read for SQLite ("SCAN t" without
+an index) and PostgreSQL ("Seq Scan on t").
+"""
+
+import re
+
+from django.db import connections
+
+from .querybudget import record_queries
+
+_SQLITE_SCAN = re.compile(r"\bSCAN (\w+)(.*)")
+_POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+_ALIAS = r'(?:FROM|JOIN)\s+"?(\w+)"?\s+(?:AS\s+)?"?{}"?(?:\s|$)'
+
+
+class PlanCapture(record_queries):
+    """record_queries() that also keeps the parameters of every SELECT."""
+
+    def __init__(self, using="default"):
+        super().__init__(using)
+
+    def _record(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith("SELECT"):
+            self.selects.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.selects = []
+        return super().__enter__()
+
+    def explain(self, sql, params):
+        """The plan of one statement, one line per step."""
+        connection = connections[self.using]
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f"{prefix} {sql}", params)
+            rows = cursor.fetchall()
+        # SQLite rows are (id, parent, notused, detail); PostgreSQL's (line,).
+        return [str(row[-1]) for row in rows]
+
+    def full_scans(self, min_rows=1000):
+        """(table, sql, plan) of the unbounded scans of tables of min_rows+."""
+        sizes = {}
+        found = []
+        for sql, params in self.selects:
+            plan = self.explain(sql, params)
+            bounded = (
+                " LIMIT " in sql.upper()
+                and " WHERE " not in sql.upper()
+                and not any("TEMP B-TREE" in line for line in plan)
+            )
+            for table in scanned_tables(plan):
+                table = resolve_alias(sql, table)
+                if table not in sizes:
+                    sizes[table] = self._count(table)
+                if sizes[table] >= min_rows and not bounded:
+                    found.append((table, sql, plan))
+        return found
+
+    def _count(self, table):
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+            return cursor.fetchone()[0]
+
+
+def scanned_tables(plan):
+    """Names (or aliases) of tables a plan reads without an index."""
+    tables = []
+    for line in plan:
+        if match := _SQLITE_SCAN.search(line):
+            name, rest = match.groups()
+            if "USING" not in rest and "VIRTUAL TABLE" not in rest:
+                tables.append(name)
+        elif match := _POSTGRES_SCAN.search(line):
+            tables.append(match.group(1))
+    return tables
+
+
+def resolve_alias(sql, name):
+    """The table behind an alias such as Django's U0 in subqueries."""
+    match = re.search(_ALIAS.format(re.escape(name)), sql, re.IGNORECASE)
+    return match.group(1) if match else name
@@ -0,0 +1,131 @@
+"""
+Read replicas for the read-only views.
+
+Views decorated with @replica_reads read this app's models from one of
+settings.DATABASE_REPLICAS (picked at random per request); everything
+else, and every write, goes to the primary ("default"). Sessions and
+users stay on the primary too, so logins never depend on replication.
+
+Replicas lag behind. After any POST (or other unsafe request) the
+visitor gets a short-lived cookie (REPLICA_STICKY_SECONDS, default 10)
+and reads from the primary until it expires, so they see their own
+writes: the recipe they just saved, the page without the one they just
+deleted.
+
+Locally, `manage.py sync_replica` copies db.sqlite3 into a second file
+that stands in for a replica (see settings).
+"""
+
+import functools
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+PRIMARY = "default"
+STICKY_COOKIE = "recipes_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+_read_alias = ContextVar("recipes_read_alias", default=None)
+
+
+def replicas():
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+def sticky_seconds():
+    return getattr(settings, "REPLICA_STICKY_SECONDS", 10)
+
+
+def read_alias_for(request):
+    """The replica a request may read from, or None for the primary."""
+    aliases = replicas()
+    if (
+        not aliases
+        or request.method not in SAFE_METHODS
+        or STICKY_COOKIE in request.COOKIES
+    ):
+        return None
+    return random.choice(aliases)
+
+
+@contextmanager
+def reading_from(alias):
+    """Route this app's reads inside the block to ``alias`` (None: primary)."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def replica_reads(view):
+    """View decorator: read from a replica unless the visitor just wrote."""
+    if iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            with reading_from(read_alias_for(request)):
+                return await view(request, *args, **kwargs)
+
+    else:
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with reading_from(read_alias_for(request)):
+                return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """Reads per reading_from(), writes always to the primary."""
+
+    app_label = "recipes"
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return _read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Even for objects read from a replica.
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+@sync_and_async_middleware
+def ReplicaStickinessMiddleware(get_response):
+    """Set the read-your-writes cookie on responses to unsafe requests."""
+
+    def stick(request, response):
+        if request.method not in SAFE_METHODS and replicas():
+            response.set_cookie(
+                STICKY_COOKIE,
+                "1",
+                max_age=sticky_seconds(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            return stick(request, await get_response(request))
+
+    else:
+
+        def middleware(request):
+            return stick(request, get_response(request))
+
+    return middleware
@@ -0,0 +1,167 @@
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .cache import bump_generation
+
+FTS_TABLE = "recipes_recipe_fts"
+
+# Generation of search results (searchcache.py); bumped by every change to
+# what is indexed, with or without the FTS table. A search racing an
+# uncommitted write can still cache what it saw, for up to MAX_AGE.
+SEARCH_GENERATION = "recipes.search"
+
+# Columns mirrored into the full-text index, in index column order.
+FTS_COLUMNS = ("title", "description", "story", "instructions", "tags")
+
+# Per-column bm25 weights: a hit in the title outranks one in the story.
+FTS_WEIGHTS = (10.0, 4.0, 1.0, 1.0, 6.0)
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    + ", ".join(FTS_COLUMNS)
+    + ", tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+DROP_FTS_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+# One row per recipe; tags are flattened into a space separated column.
+_SELECT_DOCUMENTS_SQL = """
+    SELECT r.id, r.title, COALESCE(r.description, ''), r.story, r.instructions,
+           COALESCE((SELECT group_concat(t.name, ' ')
+                     FROM recipes_recipe_tags rt
+                     JOIN recipes_tag t ON t.id = rt.tag_id
+                     WHERE rt.recipe_id = r.id), '')
+    FROM recipes_recipe r
+"""
+
+_INSERT_SQL = f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)})"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Alias -> bool, filled lazily so the introspection query runs once per process.
+_fts_available = {}
+
+
+def fts_available(using="default"):
+    """Return True if the FTS5 index exists on the given connection."""
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return False
+    if conn.alias not in _fts_available:
+        with conn.cursor() as cursor:
+            tables = conn.introspection.table_names(cursor)
+        _fts_available[conn.alias] = FTS_TABLE in tables
+    return _fts_available[conn.alias]
+
+
+def forget_fts_available(using="default"):
+    """Look for the index again on next use (migrations create and drop it)."""
+    _fts_available.pop(using, None)
+
+
+def build_match_query(q):
+    """Turn free text into an FTS5 MATCH expression (AND of prefix terms)."""
+    tokens = _TOKEN_RE.findall(q)
+    # Quote every token so FTS5 operators typed by users are taken literally.
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def icontains_filter(q):
+    """The substring search used when no full-text index is available."""
+    return (
+        Q(title__icontains=q)
+        | Q(description__icontains=q)
+        | Q(story__icontains=q)
+        | Q(instructions__icontains=q)
+        | Q(tags__name__icontains=q)
+    )
+
+
+def search_recipes(qs, q):
+    """
+    Filter a Recipe queryset by free text, best matches first.
+
+    With the FTS5 index the queryset gets a ``search_rank`` annotation
+    (lower is better) and is ordered by it, ties broken by newest first.
+    Other backends fall back to the unranked ``icontains`` scan.
+    """
+    match = build_match_query(q)
+    if not match or not fts_available(qs.db):
+        return qs.filter(icontains_filter(q)).distinct().order_by("-id")
+
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    rank = RawSQL(
+        f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = recipes_recipe.id",
+        (match,),
+        output_field=FloatField(),
+    )
+    matches = RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)
+    )
+    return (
+        qs.filter(id__in=matches)
+        .annotate(search_rank=rank)
+        .order_by("search_rank", "-id")
+    )
+
+
+def index_recipes(recipe_ids, using="default"):
+    """(Re)index the given recipes; ids that no longer exist are dropped."""
+    recipe_ids = [int(pk) for pk in recipe_ids]
+    if not recipe_ids:
+        return
+    bump_generation(SEARCH_GENERATION)
+    if not fts_available(using):
+        return
+    conn = connections[using]
+    with conn.cursor() as cursor:
+        # SQLite caps bound parameters per statement, so go in slices.
+        for start in range(0, len(recipe_ids), 500):
+            chunk = recipe_ids[start : start + 500]
+            marks = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", chunk
+            )
+            cursor.execute(
+                f"{_INSERT_SQL} {_SELECT_DOCUMENTS_SQL} WHERE r.id IN ({marks})",
+                chunk,
+            )
+
+
+def unindex_recipes(recipe_ids, using="default"):
+    recipe_ids = [int(pk) for pk in recipe_ids]
+    if not recipe_ids:
+        return
+    bump_generation(SEARCH_GENERATION)
+    if not fts_available(using):
+        return
+    conn = connections[using]
+    with conn.cursor() as cursor:
+        for start in range(0, len(recipe_ids), 500):
+            chunk = recipe_ids[start : start + 500]
+            marks = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", chunk
+            )
+
+
+def rebuild_index(using="default"):
+    """Drop and repopulate the whole index. Returns the number of documents."""
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(DROP_FTS_SQL)
+        cursor.execute(CREATE_FTS_SQL)
+        cursor.execute(f"{_INSERT_SQL} {_SELECT_DOCUMENTS_SQL}")
+        # Merge the freshly written segments for faster queries.
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        (count,) = cursor.fetchone()
+    _fts_available[conn.alias] = True
+    bump_generation(SEARCH_GENERATION)
+    return count
@@ -0,0 +1,207 @@
+"""
+Per-process cache of search results for the recipe list.
+
+The whole ranking of a search (the keyset sort values of its first
+MAX_RESULTS matches) is cached under the normalized search text, the
+filters and the ordering (relevance unless given), so every page of a
+popular query is served by slicing that list and loading just the page's
+rows by primary key: no full-text or ``icontains`` query, and cursors
+identical to the uncached ones.
+
+Entries are dropped least-recently-used beyond MAX_ENTRIES and after
+MAX_AGE seconds. The cache is tied to the search generation, which
+search.py bumps on every change to indexed recipes (saves, deletes,
+retagging, bulk imports), so any such write empties it at the next
+lookup, in every process when CACHES is shared. Ingredient lines aren't
+searched and don't invalidate it.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+
+from .cache import get_generation
+from .pagination import KeysetPage, KeysetPaginator, apaginate
+from .search import SEARCH_GENERATION, search_recipes
+
+MAX_ENTRIES = 256
+MAX_AGE = 300
+
+# Matches kept per search; pages past them are read from the database.
+MAX_RESULTS = 1000
+
+
+def normalize_query(q):
+    return " ".join(q.casefold().split())
+
+
+class Ranking:
+    """The ordered keyset values of a search's matches."""
+
+    def __init__(self, rows, keys, complete):
+        self.rows = rows
+        self.complete = complete
+        self._sort_keys = [_sort_key(row, keys) for row in rows]
+
+    def window(self, values, forward, per_page, keys):
+        """
+        (rows, has_next, has_previous) of the page next to the cursor
+        values, like KeysetPaginator.get_page(); None when that page isn't
+        entirely within the cached rows.
+        """
+        rows, count = self.rows, len(self.rows)
+        if forward:
+            start = (
+                bisect_right(self._sort_keys, _sort_key(values, keys)) if values else 0
+            )
+            end = start + per_page
+            if end >= count and not self.complete:
+                return None
+            return rows[start:end], end < count, values is not None
+        end = bisect_left(self._sort_keys, _sort_key(values, keys))
+        if end >= count and not self.complete:
+            return None
+        start = max(0, end - per_page)
+        return rows[start:end], True, start > 0
+
+
+def _sort_key(values, keys):
+    # Keyset values of a search are numbers (rank or minutes, id), so
+    # negating gives the descending ones.
+    return tuple(
+        -value if descending else value for value, (_, descending) in zip(values, keys)
+    )
+
+
+class ResultCache:
+    """Bounded LRU of Rankings with a max age and hit/miss counters."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_age=MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def get(self, key, generation):
+        with self._lock:
+            if generation != self.generation:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.generation = generation
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.max_age:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, generation, value):
+        with self._lock:
+            if generation != self.generation:
+                # A write happened while this was being computed.
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def reset(self):
+        """Drop all entries and zero the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.generation = None
+            self.hits = self.misses = self.evictions = self.expired = 0
+            self.invalidations = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pid": os.getpid(),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+            }
+
+
+results = ResultCache()
+
+
+async def _ranking(queryset, paginator):
+    names = [name for name, _ in paginator.keys]
+    ranked = queryset.order_by(*paginator.ordering).values_list(*names)
+    rows = [row async for row in ranked[: MAX_RESULTS + 1]]
+    return Ranking(rows[:MAX_RESULTS], paginator.keys, len(rows) <= MAX_RESULTS)
+
+
+async def apaginate_search(
+    request, queryset, q, per_page=12, ordering=None, variant=()
+):
+    """
+    apaginate() over search_recipes(queryset, q), sorted by ``ordering``
+    instead of relevance if given, reading the ranking from the cache.
+    ``variant`` describes the filters of ``queryset`` for the cache key
+    (so () for all recipes). Rows are loaded from ``queryset`` by primary
+    key, with the sort keys (``search_rank``) set on them as the search
+    would.
+    """
+    # The first search per process checks the schema, synchronously.
+    searched = await sync_to_async(search_recipes)(queryset, q)
+    if ordering:
+        searched = searched.order_by(*ordering)
+    if request.GET.get("page"):
+        return await apaginate(request, searched, per_page)
+
+    paginator = KeysetPaginator(searched, per_page)
+    generation = await sync_to_async(get_generation)(SEARCH_GENERATION)
+    key = (
+        searched.db,
+        normalize_query(q),
+        variant,
+        tuple(paginator.ordering),
+    )
+    ranking = results.get(key, generation)
+    if ranking is None:
+        ranking = await _ranking(searched, paginator)
+        results.set(key, generation, ranking)
+
+    # Cursor values that don't fit the sort keys (finite numbers here) are
+    # rejected as bad cursors, which mean the first page.
+    values, forward = paginator.parse_cursor(
+        request.GET.get("after"), request.GET.get("before")
+    )
+    window = ranking.window(values, forward, per_page, paginator.keys)
+    if window is None:
+        return await paginator.aget_page(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+
+    rows, has_next, has_previous = window
+    # The unique key (id) comes last, see KeysetPaginator.
+    objs = queryset.filter(pk__in=[row[-1] for row in rows])
+    objs = {obj.pk: obj async for obj in objs}
+    page = []
+    for row in rows:
+        obj = objs.get(row[-1])
+        if obj is not None:
+            for (name, _), value in zip(paginator.keys, row):
+                setattr(obj, name, value)
+            page.append(obj)
+    return KeysetPage(page, paginator, has_next=has_next, has_previous=has_previous)
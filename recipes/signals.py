@@ -0,0 +1,305 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cookingtime, jobs, search, summaries, thumbnails
+from .cache import bump_generation
+from .choices import generation_name
+from .models import (
+    Category,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    StoredImage,
+    Tag,
+)
+
+
+def touch_recipes(recipe_ids, using="default", **changes):
+    """
+    Bump updated_at (conditional GETs), and set the summary columns in
+    ``changes``, without another round of signals.
+    """
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        Recipe.objects.using(using).filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now(), **changes
+        )
+
+
+# {kind: {using: recipe ids}} of the writes waiting for the end of the
+# batched_recipe_writes() block: "index" (search), "tags" (tag_names) and
+# "lines" (touch and ingredient_count).
+_pending = ContextVar("recipes_pending_writes", default=None)
+
+
+@contextmanager
+def batched_recipe_writes():
+    """
+    Reindex, refresh the tag names of and touch each recipe once, after
+    the block, instead of once per save, tag change (a tags.set() is a
+    remove and an add) and ingredient line in it. Nested blocks join the
+    outer one.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {kind: defaultdict(set) for kind in ("index", "tags", "lines")}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    for using, recipe_ids in pending["index"].items():
+        search.index_recipes(recipe_ids, using=using)
+    for using, recipe_ids in pending["tags"].items():
+        summaries.refresh_tag_names(recipe_ids, using=using)
+    for using, recipe_ids in pending["lines"].items():
+        touch_recipes(recipe_ids, using, ingredient_count=summaries.ingredient_count())
+
+
+def _defer(kind, recipe_ids, using):
+    """Leave the write to the enclosing batch; False outside of one."""
+    pending = _pending.get()
+    if pending is None:
+        return False
+    pending[kind][using].update(recipe_ids)
+    return True
+
+
+def recount_lines(recipe_ids, using="default"):
+    """Touch and recount recipes whose lines were bulk written (no signals)."""
+    recipe_ids = list(recipe_ids)
+    if not _defer("lines", recipe_ids, using):
+        touch_recipes(recipe_ids, using, ingredient_count=summaries.ingredient_count())
+
+
+def _touch_line_recipe(line, using, recount):
+    if recount:
+        recount_lines([line.recipe_id], using)
+    elif not _defer("lines", [line.recipe_id], using):
+        touch_recipes([line.recipe_id], using=using)
+
+
+def _retagged(recipe_ids, using):
+    recipe_ids = list(recipe_ids)
+    if _defer("index", recipe_ids, using):
+        _defer("tags", recipe_ids, using)
+        return
+    search.index_recipes(recipe_ids, using=using)
+    summaries.refresh_tag_names(recipe_ids, using=using)
+
+
+# Full-text index maintenance (and, for tag changes, updated_at). Bulk
+# writes (QuerySet.update, bulk_create) bypass these receivers and must
+# call search.index_recipes() themselves.
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(sender, instance, using, **kwargs):
+    if not _defer("index", [instance.pk], using):
+        search.index_recipes([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_deleted_recipe(sender, instance, using, **kwargs):
+    search.unindex_recipes([instance.pk], using=using)
+
+
+@receiver(post_migrate)
+def recheck_fts_table(sender, using, **kwargs):
+    search.forget_fts_available(using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def index_retagged_recipes(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        if action != "pre_clear":
+            _retagged([instance.pk], using)
+        return
+    # tag.recipe_set.*(): pk_set holds recipe ids, except for clear where
+    # the affected recipes have to be captured before the rows go away.
+    if action == "pre_clear":
+        instance._fts_recipe_ids = list(
+            instance.recipe_set.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        _retagged(getattr(instance, "_fts_recipe_ids", []), using)
+    else:
+        _retagged(pk_set or [], using)
+
+
+@receiver(post_save, sender=Tag)
+def index_renamed_tag(sender, instance, created, using, **kwargs):
+    if not created:
+        _retagged(instance.recipe_set.values_list("pk", flat=True), using)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_recipes(sender, instance, **kwargs):
+    instance._fts_recipe_ids = list(instance.recipe_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def index_untagged_recipes(sender, instance, using, **kwargs):
+    _retagged(getattr(instance, "_fts_recipe_ids", []), using)
+
+
+# updated_at and the summary columns (summaries.py) of recipes whose pages
+# show what changed. QuerySet.update() and bulk writes skip these too
+# (BulkImporter sets both itself).
+@receiver(pre_save, sender=Recipe)
+def fill_summary_names(sender, instance, raw, using, update_fields, **kwargs):
+    # Saves of other columns (thumbnail widths) don't need a lookup.
+    if raw or (
+        update_fields is not None and not {"author", "category"} & update_fields
+    ):
+        return
+    summaries.fill_names(instance, using)
+
+
+@receiver(pre_save, sender=Recipe)
+def fill_cooking_minutes(sender, instance, **kwargs):
+    # No lookup, so fixtures (raw) and partial saves get it too.
+    instance.cooking_minutes = cookingtime.to_minutes(
+        instance.cooking_time, instance.cooking_time_unit
+    )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def touch_recipe_of_saved_line(sender, instance, created, using, **kwargs):
+    # Edited lines leave the count alone.
+    _touch_line_recipe(instance, using, recount=created)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def touch_recipe_of_deleted_line(sender, instance, using, **kwargs):
+    _touch_line_recipe(instance, using, recount=True)
+
+
+@receiver(post_save, sender=Category)
+def touch_recategorized_recipes(sender, instance, created, using, **kwargs):
+    if not created:
+        touch_recipes(
+            instance.recipe_set.values_list("pk", flat=True),
+            using,
+            category_name=instance.name,
+        )
+
+
+@receiver(pre_delete, sender=Category)
+def touch_uncategorized_recipes(sender, instance, using, **kwargs):
+    # SET_NULL is a plain UPDATE; bump the recipes before it runs.
+    touch_recipes(
+        instance.recipe_set.values_list("pk", flat=True), using, category_name=""
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_recipes_using_ingredient(sender, instance, created, using, **kwargs):
+    if not created:
+        touch_recipes(
+            RecipeIngredient.objects.using(using)
+            .filter(ingredient=instance)
+            .values_list("recipe_id", flat=True),
+            using,
+        )
+
+
+@receiver(post_save, sender=User)
+def touch_recipes_of_renamed_author(
+    sender, instance, created, update_fields, using, **kwargs
+):
+    # Skips the last_login update on every login.
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    touch_recipes(
+        instance.recipes.values_list("pk", flat=True),
+        using,
+        author_name=instance.username,
+    )
+
+
+# Choice snapshots (and the autocomplete indexes built on them) reload on
+# the next use after any change.
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_choices(sender, **kwargs):
+    bump_generation(generation_name(sender))
+
+
+# Thumbnails. A freshly uploaded file is still uncommitted in pre_save; the
+# field stores it before post_save, which queues the resizing (jobs.py).
+@receiver(pre_save, sender=Recipe)
+def note_new_image(sender, instance, raw, **kwargs):
+    image = instance.image
+    instance._new_image = bool(image) and not raw and not image._committed
+    if instance._new_image or not image:
+        instance.image_widths = []
+
+
+@receiver(post_save, sender=Recipe)
+def queue_thumbnails(sender, instance, using, **kwargs):
+    if getattr(instance, "_new_image", False):
+        instance._new_image = False
+        # A deduplicated upload may already have its copies.
+        if not thumbnails.reuse_derivatives(instance, using=using):
+            jobs.enqueue_thumbnails(instance, using=using)
+
+
+# Image reference counts (storage.py). Files are never deleted here; the
+# collect_orphaned_images command removes the ones nothing points at.
+@receiver(pre_save, sender=Recipe)
+def remember_old_image(sender, instance, raw, using, **kwargs):
+    # None: the stored name can't change (no new upload, not cleared).
+    instance._old_image = None
+    if raw:
+        return
+    if instance._state.adding:
+        instance._old_image = ""
+    elif instance._new_image or not instance.image:
+        old = Recipe.objects.using(using).filter(pk=instance.pk)
+        instance._old_image = old.values_list("image", flat=True).first() or ""
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, using, **kwargs):
+    old, new = getattr(instance, "_old_image", None), instance.image.name or ""
+    instance._old_image = None
+    if old is None or old == new:
+        return
+    images = StoredImage.objects.using(using)
+    if new:
+        images.get_or_create(name=new)
+        images.filter(name=new).update(refs=F("refs") + 1, updated_at=timezone.now())
+    if old:
+        _drop_reference(old, using)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, using, **kwargs):
+    if instance.image:
+        _drop_reference(instance.image.name, using)
+
+
+def _drop_reference(name, using):
+    StoredImage.objects.using(using).filter(name=name, refs__gt=0).update(
+        refs=F("refs") - 1, updated_at=timezone.now()
+    )
@@ -0,0 +1,65 @@
+"""
+Per-connection SQLite tuning.
+
+Every new SQLite connection runs DEFAULT_PRAGMAS, as changed by
+settings.SQLITE_PRAGMAS (a value replaces the default, None drops the
+PRAGMA): write-ahead logging, so readers never wait
+for the writer and the writer never waits for readers, NORMAL syncing
+(safe with WAL; a power cut can lose the last commits, never corrupt the
+file), a memory-mapped file and a larger page cache for reads, and a busy
+timeout so concurrent writers queue instead of failing with "database is
+locked".
+
+Under WSGI connections are reused across requests (CONN_MAX_AGE in
+settings), so this runs once per connection, not once per request.
+"""
+
+import re
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "mmap_size": 128 * 1024 * 1024,
+    # Negative: in KiB, i.e. 64 MiB per connection.
+    "cache_size": -64 * 1024,
+    "busy_timeout": 5000,
+}
+
+_WORD = re.compile(r"-?\w+\Z")
+
+
+def configured_pragmas():
+    pragmas = {**DEFAULT_PRAGMAS, **getattr(settings, "SQLITE_PRAGMAS", {})}
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def pragma(name, value=None):
+    """A PRAGMA statement (values can't be bound, so both are checked)."""
+    for part in (name, value):
+        if part is not None and not _WORD.match(str(part)):
+            raise ValueError(f"Invalid SQLite pragma: {name} = {value!r}")
+    return f"PRAGMA {name}" if value is None else f"PRAGMA {name} = {value}"
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in configured_pragmas().items():
+            cursor.execute(pragma(name, value))
+
+
+def current_pragmas(connection, names=None):
+    """{name: value} as the connection reports them."""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names or configured_pragmas():
+            cursor.execute(pragma(name))
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
@@ -0,0 +1,79 @@
+"""
+Content-addressed storage for Recipe.image.
+
+Uploads are named after the SHA-256 of their bytes and sharded two levels
+deep on its first hex digits, so no directory grows past a few hundred
+entries:
+
+    pie.jpg -> recipes/3a/7f/3a7fd2...c1.jpg
+
+Uploading the same bytes again finds the file already there and reuses it.
+StoredImage counts how many recipes point at each file; files whose count
+drops to zero are removed later by ``manage.py collect_orphaned_images``,
+not by the request that deleted or replaced the image. Older flat names
+(``recipes/<name>``) keep working and are counted the same way.
+"""
+
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models.fields.files import ImageField, ImageFieldFile
+
+# Hex digits per shard level, and how many levels.
+SHARD_WIDTH = 2
+SHARD_DEPTH = 2
+
+HASHED_NAME = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]+)?$")
+
+
+def content_hash(file):
+    h = hashlib.sha256()
+    for chunk in file.chunks():
+        h.update(chunk)
+    file.seek(0)
+    return h.hexdigest()
+
+
+def hashed_name(digest, filename):
+    """Sharded name for content with this digest, relative to upload_to."""
+    ext = os.path.splitext(filename)[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,10}", ext):
+        ext = ""
+    shards = [
+        digest[i * SHARD_WIDTH : (i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)
+    ]
+    return "/".join([*shards, digest + ext])
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.match(os.path.basename(name)))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that keeps an existing file instead of writing a
+    renamed copy when the name is a content hash: same name, same bytes.
+    Other names (the resized copies next to an original) behave as usual.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is not None and is_hashed(name) and self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+image_storage = ContentAddressedStorage()
+
+
+class HashedImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        # upload_to still applies: "recipes/" + "3a/7f/3a7fd2...c1.jpg".
+        super().save(hashed_name(content_hash(content), name), content, save)
+
+
+class HashedImageField(ImageField):
+    """ImageField whose uploads are named by content (see module docs)."""
+
+    attr_class = HashedImageFieldFile
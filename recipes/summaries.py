@@ -0,0 +1,110 @@
+"""
+Denormalized summary columns of Recipe: author_name, category_name,
+tag_names (sorted) and ingredient_count.
+
+List pages and the JSON API read them instead of joining users and
+categories and querying tags, so a recipe row is all they need. The
+columns are written in the same transaction as what they copy (the
+recipe form views and the admin save in one transaction):
+
+- Recipe.save() fills author_name and category_name (pre_save);
+- tag changes, ingredient lines, and renames of categories, tags and
+  users update them along with updated_at (signals.py);
+- BulkImporter, which skips the receivers, builds them itself.
+
+QuerySet.update() and other bulk writes bypass all of that; call
+refresh_summaries() for the recipes they touched, or run
+``manage.py backfill_summaries``.
+"""
+
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .exporting import tag_names
+from .importing import LOOKUP_SLICE, chunked
+from .models import Category, Recipe, RecipeIngredient
+
+SUMMARY_FIELDS = ("author_name", "category_name", "tag_names", "ingredient_count")
+
+
+def ingredient_count():
+    """Expression counting a recipe's lines, for QuerySet.update()."""
+    counts = (
+        RecipeIngredient.objects.filter(recipe=OuterRef("pk"))
+        .order_by()
+        .values("recipe")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def fill_names(recipe, using):
+    """Set author_name and category_name from the (possibly cached) relations."""
+    recipe.author_name = _name(recipe, "author", User, "username", using)
+    recipe.category_name = _name(recipe, "category", Category, "name", using) or ""
+
+
+def _name(recipe, relation, model, attribute, using):
+    field = Recipe._meta.get_field(relation)
+    if field.is_cached(recipe):
+        related = field.get_cached_value(recipe)
+        return getattr(related, attribute) if related else None
+    pk = getattr(recipe, field.attname)
+    if pk is None:
+        return None
+    manager = model._default_manager.using(using)
+    return manager.filter(pk=pk).values_list(attribute, flat=True).first()
+
+
+def refresh_tag_names(recipe_ids, using="default"):
+    """Re-read the tag names of these recipes, bumping their updated_at."""
+    recipe_ids = list(recipe_ids)
+    now = timezone.now()
+    for chunk in chunked(recipe_ids, LOOKUP_SLICE):
+        names = tag_names(chunk, using)
+        Recipe.objects.using(using).bulk_update(
+            [
+                Recipe(pk=pk, tag_names=tags, updated_at=now)
+                for pk, tags in names.items()
+            ],
+            ["tag_names", "updated_at"],
+        )
+
+
+def refresh_summaries(recipe_ids, using="default"):
+    """Recompute all summary columns of these recipes (updated_at unchanged)."""
+    recipe_ids = list(recipe_ids)
+    recipes = Recipe.objects.using(using)
+    for chunk in chunked(recipe_ids, LOOKUP_SLICE):
+        names = tag_names(chunk, using)
+        counts = Counter(
+            dict(
+                RecipeIngredient.objects.using(using)
+                .filter(recipe_id__in=chunk)
+                .order_by()
+                .values("recipe_id")
+                .annotate(n=Count("pk"))
+                .values_list("recipe_id", "n")
+            )
+        )
+        rows = recipes.filter(pk__in=chunk).values_list(
+            "pk", "author__username", "category__name"
+        )
+        recipes.bulk_update(
+            [
+                Recipe(
+                    pk=pk,
+                    author_name=author_name,
+                    category_name=category_name or "",
+                    tag_names=names[pk],
+                    ingredient_count=counts[pk],
+                )
+                for pk, author_name, category_name in rows
+            ],
+            SUMMARY_FIELDS,
+        )
@@ -0,0 +1,40 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from recipes.thumbnails import derivative_name, fallback_format
+
+register = template.Library()
+
+
+@register.simple_tag
+def recipe_image(recipe, sizes, **attrs):
+    """
+    Lazy-loaded <img> for recipe.image with srcset/sizes over its resized
+    copies (WebP first, via <picture>), or the plain original without any.
+
+        {% recipe_image recipe sizes="160px" class="recipe-thumb" %}
+    """
+    image = recipe.image
+    attrs = {"alt": recipe.title, "loading": "lazy", "decoding": "async", **attrs}
+    widths = recipe.image_widths or []
+    if not widths:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    url = image.storage.url
+    fmt = fallback_format(image.name)
+
+    def srcset(out_fmt):
+        return ", ".join(
+            f"{url(derivative_name(image.name, w, out_fmt))} {w}w" for w in widths
+        )
+
+    attrs.update(srcset=srcset(fmt), sizes=sizes)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}"{}></picture>',
+        srcset("webp"),
+        sizes,
+        url(derivative_name(image.name, widths[0], fmt)),
+        flatatt(attrs),
+    )
@@ -1,8 +1,61 @@
-from django.test import TestCase
+import base64
+import gzip
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 
-from .models import Recipe, Category, Ingredient, RecipeIngredient
+from . import (
+    choices,
+    cookingtime,
+    jobs,
+    jsonstream,
+    querybudget,
+    queryplan,
+    replicas,
+    search,
+    searchcache,
+    sqlite,
+    summaries,
+    thumbnails,
+)
+from .importing import BulkImporter, Checkpoint
+from .pagination import encode_cursor
+from .models import (
+    ImageJob,
+    Recipe,
+    Category,
+    Ingredient,
+    RecipeIngredient,
+    StoredImage,
+    Tag,
+)
 
 
 class RecipeViewsTests(TestCase):
@@ -46,6 +99,27 @@ class RecipeViewsTests(TestCase):
         self.assertTemplateUsed(resp, "recipes/profile.html")
         self.assertContains(resp, self.author.username)
 
+    async def test_read_views_run_async_when_logged_in(self):
+        # Templates must not query: that would raise SynchronousOnlyOperation.
+        await self.async_client.alogin(username="alice", password="pass1234")
+        urls = [
+            reverse("recipes:recipe_list") + "?q=test",
+            reverse("recipes:recipe_list") + "?page=1",
+            reverse("recipes:recipe_detail", args=[self.recipe.pk]),
+            reverse("recipes:profile", args=["alice"]) + "?page=1",
+            reverse("recipes:api_recipe_list") + "?q=test",
+            reverse("recipes:api_recipe_detail", args=[self.recipe.pk]),
+        ]
+        for url in urls:
+            resp = await self.async_client.get(url)
+            self.assertEqual(resp.status_code, 200, url)
+        self.assertContains(resp, "Test Recipe")
+        resp = await self.async_client.get(reverse("recipes:recipe_list"))
+        self.assertContains(resp, "Hello, alice")
+        self.assertContains(resp, ">Edit</a>")
+        resp = await self.async_client.get(reverse("recipes:profile", args=["x"]))
+        self.assertEqual(resp.status_code, 404)
+
     def test_create_requires_login(self):
         url = reverse("recipes:recipe_create")
         resp = self.client.get(url)
@@ -269,3 +343,2618 @@ class RecipeViewsTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertFalse(User.objects.filter(username="george").exists())
         self.assertContains(resp, "too similar")
+
+
+class BenchmarkHandlersTests(TransactionTestCase):
+    # Transaction-less: the WSGI threads use their own connections.
+    def test_benchmark_handlers_command(self):
+        out = StringIO()
+        with self.settings(ALLOWED_HOSTS=["localhost"]):
+            call_command(
+                "benchmark_handlers",
+                "/api/recipes/",
+                "--requests=4",
+                "--concurrency=2",
+                stdout=out,
+            )
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ["wsgi", "asgi"])
+        self.assertIn("req/s", lines[0])
+        self.assertNotIn("non-200", out.getvalue())
+
+
+class SqliteTuningTests(TestCase):
+    def pragmas_of_new_connection(self):
+        wrapper = connections.create_connection("default")
+        try:
+            wrapper.ensure_connection()
+            return sqlite.current_pragmas(wrapper, ["synchronous", "busy_timeout"])
+        finally:
+            wrapper.close()
+
+    def test_new_connections_get_the_configured_pragmas(self):
+        self.assertEqual(
+            self.pragmas_of_new_connection(), {"synchronous": 1, "busy_timeout": 5000}
+        )
+        with self.settings(SQLITE_PRAGMAS={"busy_timeout": 250}):
+            pragmas = self.pragmas_of_new_connection()
+        self.assertEqual(pragmas, {"synchronous": 1, "busy_timeout": 250})
+
+    def test_settings_override_the_defaults(self):
+        with self.settings(SQLITE_PRAGMAS={"mmap_size": None, "cache_size": -2000}):
+            pragmas = sqlite.configured_pragmas()
+        self.assertNotIn("mmap_size", pragmas)
+        self.assertEqual(pragmas["cache_size"], -2000)
+        self.assertEqual(pragmas["journal_mode"], "wal")
+
+    def test_asgi_keeps_no_connections(self):
+        script = (
+            "import {module}; from django.conf import settings; "
+            "print(settings.DATABASES['default']['CONN_MAX_AGE'])"
+        )
+        env = {k: v for k, v in os.environ.items() if k != "RECIPEBOOK_SERVER"}
+        for module, expected in [("recipebook.wsgi", "600"), ("recipebook.asgi", "0")]:
+            result = subprocess.run(
+                [sys.executable, "-c", script.format(module=module)],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            self.assertEqual(result.stdout.strip(), expected, module)
+
+    def test_pragmas_are_checked(self):
+        self.assertEqual(
+            sqlite.pragma("cache_size", -2000), "PRAGMA cache_size = -2000"
+        )
+        with self.assertRaises(ValueError):
+            sqlite.pragma("journal_mode", "wal; DROP TABLE recipes_recipe")
+
+    def test_benchmark_sqlite_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_sqlite",
+            "--readers=2",
+            "--writers=1",
+            "--seconds=0.2",
+            "--rows=50",
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn("writes/s", lines[0])
+        self.assertTrue(lines[1].startswith("SQLITE_PRAGMAS"))
+        self.assertNotIn("locked", lines[1])
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TestCase):
+    databases = {"default", "replica"}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.recipe = Recipe.objects.create(
+            title="Primary copy",
+            author=cls.author,
+            cooking_time=10,
+            instructions="Stir.",
+        )
+        # The replica has the same rows, replicated before the last edit.
+        cls.author.save(using="replica")
+        cls.recipe.title = "Replica copy"
+        cls.recipe.save(using="replica")
+
+    def setUp(self):
+        cache.clear()
+        searchcache.results.reset()
+
+    def test_read_views_read_from_the_replica(self):
+        detail = reverse("recipes:recipe_detail", args=[self.recipe.pk])
+        with CaptureQueriesContext(connections["default"]) as primary:
+            self.assertContains(self.client.get(detail), "Replica copy")
+            self.assertContains(
+                self.client.get(reverse("recipes:recipe_list")), "Replica copy"
+            )
+            resp = self.client.get(
+                reverse("recipes:api_recipe_detail", args=[self.recipe.pk])
+            )
+        self.assertEqual(resp.json()["title"], "Replica copy")
+        # Except for the list's sidebar counts, see the next test.
+        self.assertEqual(len(primary), 2)
+        for query in primary.captured_queries:
+            self.assertIn("COUNT(", query["sql"])
+
+    def test_cached_counts_are_taken_on_the_primary(self):
+        Recipe.objects.create(
+            title="Not replicated yet",
+            author=self.author,
+            cooking_time=90,
+            instructions="Wait.",
+        )
+        resp = self.client.get(reverse("recipes:recipe_list"))
+        self.assertNotContains(resp, "Not replicated yet")
+        self.assertEqual(resp.context["buckets"][0], (None, 2))
+        with CaptureQueriesContext(connections["default"]) as primary:
+            self.client.get(reverse("recipes:recipe_list"))
+        self.assertEqual(len(primary), 0)
+
+    def test_sessions_and_writes_use_the_primary(self):
+        self.client.force_login(self.author)
+        detail = reverse("recipes:recipe_detail", args=[self.recipe.pk])
+        resp = self.client.get(detail)
+        self.assertContains(resp, "Replica copy")
+        self.assertContains(resp, "alice")
+        self.assertNotIn(replicas.STICKY_COOKIE, resp.cookies)
+
+        resp = self.client.post(reverse("recipes:recipe_delete", args=[self.recipe.pk]))
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(Recipe.objects.filter(pk=self.recipe.pk).exists())
+        cookie = resp.cookies[replicas.STICKY_COOKIE]
+        self.assertEqual(cookie["max-age"], 10)
+        # Read your own writes: the primary no longer has it...
+        self.assertEqual(self.client.get(detail).status_code, 404)
+        # ...while the lagging replica still does.
+        del self.client.cookies[replicas.STICKY_COOKIE]
+        self.assertContains(self.client.get(detail), "Replica copy")
+
+    def test_router(self):
+        self.assertEqual(Recipe.objects.all().db, "default")
+        with replicas.reading_from("replica"):
+            self.assertEqual(Recipe.objects.all().db, "replica")
+            self.assertEqual(User.objects.all().db, "default")
+            replica_copy = Recipe.objects.get(pk=self.recipe.pk)
+        replica_copy.title = "Edited"
+        replica_copy.save()
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).title, "Edited")
+
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.client.force_login(self.author)
+        with self.settings(DATABASE_REPLICAS=[]):
+            detail = reverse("recipes:recipe_detail", args=[self.recipe.pk])
+            self.assertContains(self.client.get(detail), "Primary copy")
+            resp = self.client.post(
+                reverse("recipes:recipe_delete", args=[self.recipe.pk])
+            )
+        self.assertNotIn(replicas.STICKY_COOKIE, resp.cookies)
+
+
+class SyncReplicaTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def test_sync_replica_copies_the_primary(self):
+        author = User.objects.create_user(username="alice", password="pass1234")
+        Recipe.objects.create(
+            title="Fresh", author=author, cooking_time=1, instructions="x"
+        )
+        self.assertFalse(Recipe.objects.using("replica").exists())
+        out = StringIO()
+        call_command("sync_replica", stdout=out)
+        self.assertEqual(
+            list(Recipe.objects.using("replica").values_list("title", flat=True)),
+            ["Fresh"],
+        )
+        self.assertIn("Copied default to replica", out.getvalue())
+
+
+class RecipeSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.soup = Recipe.objects.create(
+            title="Csirkeleves",
+            author=cls.author,
+            story="Grandma's chicken soup",
+            cooking_time=60,
+            instructions="Simmer slowly.",
+        )
+        cls.stew = Recipe.objects.create(
+            title="Pörkölt",
+            author=cls.author,
+            story="Goes well with a soup starter",
+            cooking_time=2,
+            cooking_time_unit="hr",
+            instructions="Brown the onions.",
+        )
+        cls.vegan = Tag.objects.create(name="vegan")
+
+    def setUp(self):
+        # Rolled back writes of earlier tests never bumped the generation.
+        searchcache.results.reset()
+
+    def search(self, q):
+        resp = self.client.get(reverse("recipes:recipe_list"), {"q": q})
+        self.assertEqual(resp.status_code, 200)
+        return [r.pk for r in resp.context["recipes"]]
+
+    def test_prefix_and_case_insensitive_match(self):
+        self.assertEqual(self.search("CSIRKE"), [self.soup.pk])
+
+    def test_diacritics_are_folded(self):
+        self.assertEqual(self.search("porkolt"), [self.stew.pk])
+
+    def test_results_ranked_by_relevance(self):
+        # "soup" is in both stories, but the soup's story is shorter
+        self.assertEqual(self.search("soup"), [self.soup.pk, self.stew.pk])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search("soup onions"), [self.stew.pk])
+
+    def test_operators_in_query_are_literal(self):
+        self.assertEqual(self.search('soup" OR NOT'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.soup.title = "Húsleves"
+        self.soup.save()
+        self.assertEqual(self.search("husleves"), [self.soup.pk])
+        self.soup.delete()
+        self.assertEqual(self.search("husleves"), [])
+
+    def test_index_follows_tag_changes(self):
+        self.stew.tags.add(self.vegan)
+        self.assertEqual(self.search("vegan"), [self.stew.pk])
+        self.vegan.name = "plant"
+        self.vegan.save()
+        self.assertEqual(self.search("vegan"), [])
+        self.assertEqual(self.search("plant"), [self.stew.pk])
+        self.vegan.delete()
+        self.assertEqual(self.search("plant"), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(self.search("soup"), [])
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Indexed 2 recipes", out.getvalue())
+        self.assertEqual(self.search("soup"), [self.soup.pk, self.stew.pk])
+
+    def test_migration_builds_the_current_index(self):
+        # The migration keeps its own copy of the DDL; a change to the index
+        # definition needs a new migration, not an edit to 0004.
+        migration = importlib.import_module("recipes.migrations.0004_recipe_fts")
+        self.assertEqual(migration.CREATE_FTS_SQL, search.CREATE_FTS_SQL)
+        self.assertFalse(hasattr(migration, "search"))
+
+
+class SearchCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        for i in range(20):
+            Recipe.objects.create(
+                title=f"Soup {i}",
+                author=cls.author,
+                story="soup " * (i % 4),
+                cooking_time=1,
+                instructions="Simmer.",
+            )
+
+    def setUp(self):
+        # Rolled back writes of earlier tests never bumped the generation.
+        searchcache.results.reset()
+
+    def walk(self, q):
+        url, ids, params = reverse("recipes:recipe_list"), [], {"q": q}
+        while True:
+            page = self.client.get(url, params).context["recipes"]
+            ids += [r.pk for r in page]
+            if not page.has_next():
+                return ids
+            params["after"] = page.next_cursor
+
+    def test_cached_pages_match_the_database(self):
+        expected = list(
+            search.search_recipes(Recipe.objects.all(), "soup").values_list(
+                "pk", flat=True
+            )
+        )
+        self.assertEqual(self.walk("soup"), expected)
+        stats = searchcache.results.stats()
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 1))
+        self.assertEqual(self.walk("  SOUP "), expected)
+
+        url = reverse("recipes:recipe_list")
+        self.client.get(url, {"q": "soup"})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url, {"q": "soup"})
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn("MATCH", ctx.captured_queries[0]["sql"])
+
+    def test_bad_cursors_give_the_first_page(self):
+        url = reverse("recipes:recipe_list")
+        first = [r.pk for r in self.client.get(url, {"q": "soup"}).context["recipes"]]
+        for raw in ['["x",1]', '[1,"2"]', "[NaN,1]", "[1e999,1]", "[-1,1e30]", "[1]"]:
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+            for direction in ("after", "before"):
+                resp = self.client.get(url, {"q": "soup", direction: cursor})
+                self.assertEqual(resp.status_code, 200, raw)
+                page = resp.context["recipes"]
+                self.assertEqual([r.pk for r in page], first, (raw, direction))
+        # The same, with the ranking read from the database.
+        searchcache.results.reset()
+        with mock.patch.object(searchcache.Ranking, "window", return_value=None):
+            cursor = base64.urlsafe_b64encode(b'["x",1]').decode()
+            resp = self.client.get(url, {"q": "soup", "after": cursor})
+        self.assertEqual([r.pk for r in resp.context["recipes"]], first)
+
+    def test_writes_invalidate(self):
+        self.assertEqual(self.walk("lentil"), [])
+        lentil = Recipe.objects.create(
+            title="Lentil soup", author=self.author, cooking_time=1, instructions="x"
+        )
+        self.assertEqual(self.walk("lentil"), [lentil.pk])
+        lentil.tags.add(Tag.objects.create(name="hearty"))
+        self.assertEqual(self.walk("hearty"), [lentil.pk])
+        lentil.delete()
+        self.assertEqual(self.walk("lentil"), [])
+        self.assertEqual(searchcache.results.stats()["invalidations"], 3)
+
+    def test_lru_and_max_age(self):
+        results = searchcache.ResultCache(max_entries=2)
+        results.set("a", 1, "A")
+        results.set("b", 1, "B")
+        self.assertIsNone(results.get("a", 1))
+        results.set("a", 1, "A")
+        results.set("b", 1, "B")
+        self.assertEqual(results.get("a", 1), "A")
+        results.set("c", 1, "C")
+        self.assertIsNone(results.get("b", 1))
+        self.assertEqual(results.stats()["evictions"], 1)
+        self.assertIsNone(results.get("a", 2))
+
+        results = searchcache.ResultCache(max_age=-1)
+        results.get("a", 1)
+        results.set("a", 1, "A")
+        self.assertIsNone(results.get("a", 1))
+        self.assertEqual(results.stats()["expired"], 1)
+
+    def test_stats_endpoint(self):
+        self.walk("soup")
+        data = self.client.get(reverse("recipes:api_search_cache")).json()
+        self.assertEqual(data["misses"], 1)
+        self.assertEqual(data["hit_ratio"], 0.5)
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        Recipe.objects.bulk_create(
+            Recipe(
+                title=f"Recipe {i}",
+                author=cls.author,
+                story="s",
+                cooking_time=i,
+                instructions="do",
+            )
+            for i in range(30)
+        )
+        cls.ids = list(Recipe.objects.order_by("-id").values_list("pk", flat=True))
+        # bulk_create skips the receivers.
+        search.index_recipes(cls.ids)
+        summaries.refresh_summaries(cls.ids)
+
+    def page(self, url, **params):
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.context["recipes"]
+
+    def test_walk_forward_and_back_without_counting(self):
+        url = reverse("recipes:recipe_list")
+        # The sidebar's counts (time buckets, facets) aren't a page count;
+        # get them cached first.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.page(url)
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+        self.assertEqual([r.pk for r in first], self.ids[:12])
+        self.assertFalse(first.has_previous())
+
+        second = self.page(url, after=first.next_cursor)
+        third = self.page(url, after=second.next_cursor)
+        self.assertEqual([r.pk for r in third], self.ids[24:])
+        self.assertFalse(third.has_next())
+
+        back = self.page(url, before=third.previous_cursor)
+        self.assertEqual([r.pk for r in back], self.ids[12:24])
+        back = self.page(url, before=back.previous_cursor)
+        self.assertEqual([r.pk for r in back], self.ids[:12])
+        self.assertFalse(back.has_previous())
+
+    def test_links_rendered_with_query_preserved(self):
+        resp = self.client.get(reverse("recipes:recipe_list"), {"q": "recipe"})
+        cursor = resp.context["recipes"].next_cursor
+        self.assertContains(resp, f"?q=recipe&amp;after={cursor}")
+
+    def test_search_results_paginate_by_rank(self):
+        url = reverse("recipes:recipe_list")
+        first = self.page(url, q="recipe")
+        second = self.page(url, q="recipe", after=first.next_cursor)
+        seen = [r.pk for r in first] + [r.pk for r in second]
+        self.assertEqual(len(set(seen)), 24)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        page = self.page(reverse("recipes:recipe_list"), after="not-a-cursor")
+        self.assertEqual([r.pk for r in page], self.ids[:12])
+
+    def test_crafted_cursors_give_the_first_page(self):
+        url = reverse("recipes:recipe_list")
+        for raw, params in [
+            ("[1e999]", {}),
+            ("[NaN]", {}),
+            ('["x"]', {}),
+            ("[1.5]", {}),
+            ("[true]", {}),
+            ("[99999999999999999999999]", {}),
+            ("[99999999999999999999999,1]", {"sort": "time"}),
+            ("[5,1e999]", {"sort": "time"}),
+        ]:
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+            for direction in ("after", "before"):
+                page = self.page(url, **{direction: cursor}, **params)
+                self.assertFalse(page.has_previous(), (raw, direction))
+
+    def test_page_past_the_end_is_empty(self):
+        page = self.page(reverse("recipes:recipe_list"), after=encode_cursor([0]))
+        self.assertEqual(list(page), [])
+        self.assertIsNone(page.previous_cursor)
+        self.assertIsNone(page.next_cursor)
+
+    def test_page_number_fallback(self):
+        page = self.page(reverse("recipes:recipe_list"), page=3)
+        self.assertEqual([r.pk for r in page], self.ids[24:])
+        self.assertEqual(page.paginator.count, 30)
+
+    def test_profile_uses_cursor(self):
+        url = reverse("recipes:profile", args=["alice"])
+        first = self.page(url)
+        second = self.page(url, after=first.next_cursor)
+        self.assertEqual([r.pk for r in second], self.ids[12:24])
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.flour = Ingredient.objects.create(name="Flour")
+        cls.wheat = Ingredient.objects.create(name="Wheat flour")
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"Spice {i:03d}") for i in range(100)
+        )
+        cls.vegan = Tag.objects.create(name="vegan")
+        cls.recipe = Recipe.objects.create(
+            title="Bread",
+            author=cls.author,
+            story="s",
+            cooking_time=5,
+            instructions="bake",
+        )
+        cls.recipe.tags.add(cls.vegan)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.wheat, quantity=1, unit="kg"
+        )
+
+    def setUp(self):
+        # Snapshots built by other tests may hold rows that were rolled back.
+        choices._snapshots.clear()
+
+    def results(self, url_name, q):
+        resp = self.client.get(reverse(url_name), {"q": q})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()["results"]
+
+    def test_ingredient_prefix_matches_any_word(self):
+        results = self.results("recipes:ingredient_autocomplete", "FLO")
+        self.assertEqual(
+            results,
+            [
+                {"id": self.flour.pk, "text": "Flour"},
+                {"id": self.wheat.pk, "text": "Wheat flour"},
+            ],
+        )
+
+    def test_results_are_limited(self):
+        results = self.results("recipes:ingredient_autocomplete", "spice")
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0]["text"], "Spice 000")
+
+    def test_empty_query_returns_nothing(self):
+        self.assertEqual(self.results("recipes:tag_autocomplete", ""), [])
+
+    def test_index_refreshes_after_save(self):
+        self.assertEqual(
+            self.results("recipes:tag_autocomplete", "veg"),
+            [{"id": self.vegan.pk, "text": "vegan"}],
+        )
+        Tag.objects.create(name="vegetarian")
+        texts = [r["text"] for r in self.results("recipes:tag_autocomplete", "veg")]
+        self.assertEqual(texts, ["vegan", "vegetarian"])
+        self.vegan.delete()
+        texts = [r["text"] for r in self.results("recipes:tag_autocomplete", "veg")]
+        self.assertEqual(texts, ["vegetarian"])
+
+    def test_forms_only_render_selected_options(self):
+        self.client.login(username="alice", password="pass1234")
+        resp = self.client.get(reverse("recipes:recipe_create"))
+        self.assertNotContains(resp, "Spice 000")
+        self.assertContains(resp, 'data-autocomplete-url="/autocomplete/ingredients/"')
+
+        resp = self.client.get(reverse("recipes:recipe_update", args=[self.recipe.pk]))
+        self.assertContains(resp, f'<option value="{self.wheat.pk}" selected>')
+        self.assertContains(resp, f'<option value="{self.vegan.pk}" selected>')
+        self.assertNotContains(resp, "Spice 000")
+        self.assertNotContains(resp, ">Flour<")
+
+
+class ChoiceSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.category = Category.objects.create(name="Dinner")
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ingredient {i}") for i in range(10)
+        )
+        cls.small = cls.make_recipe("Small", lines=1)
+        cls.large = cls.make_recipe("Large", lines=10)
+
+    @classmethod
+    def make_recipe(cls, title, lines):
+        recipe = Recipe.objects.create(
+            title=title,
+            author=cls.author,
+            category=cls.category,
+            story="s",
+            cooking_time=5,
+            instructions="do",
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ing, quantity=1, unit="g")
+            for ing in cls.ingredients[:lines]
+        )
+        return recipe
+
+    def setUp(self):
+        choices._snapshots.clear()
+        self.client.login(username="alice", password="pass1234")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_update_page_queries_do_not_grow_with_rows(self):
+        # Warm the snapshots, then compare steady-state costs
+        self.count_queries(reverse("recipes:recipe_update", args=[self.small.pk]))
+        small = self.count_queries(
+            reverse("recipes:recipe_update", args=[self.small.pk])
+        )
+        large = self.count_queries(
+            reverse("recipes:recipe_update", args=[self.large.pk])
+        )
+        self.assertEqual(small, large)
+
+    def test_snapshot_is_reused_until_lookup_changes(self):
+        first = choices.get_snapshot(Category)
+        self.assertIs(choices.get_snapshot(Category), first)
+        Category.objects.create(name="Lunch")
+        second = choices.get_snapshot(Category)
+        self.assertIsNot(second, first)
+        self.assertIn("Lunch", second.labels.values())
+
+    def test_rendered_labels_come_from_snapshot(self):
+        resp = self.client.get(reverse("recipes:recipe_update", args=[self.large.pk]))
+        for ing in self.ingredients:
+            self.assertContains(resp, f">{ing.name}</option>")
+        self.assertContains(resp, f'<option value="{self.category.pk}" selected>')
+
+
+class ImportRecipesTests(TestCase):
+    ITEMS = [
+        {
+            "cím": "Gulyásleves",
+            "történet": "Classic",
+            "utasítások": "Cook it.",
+            "főzési_idő": 2,
+            "főzési_idő_egység": "óra",
+            "kategória": "Soup",
+            "címkék": ["hungarian", "beef"],
+            "hozzávalók": [
+                {"összetevő": "Beef", "mennyiség": "500", "egység": "g"},
+                {"összetevő": "Paprika", "mennyiség": 2, "egység": "tbsp"},
+            ],
+        },
+        {
+            "title": "Pancakes",
+            "story": "Sunday",
+            "instructions": "Fry.",
+            "cooking_time": 20,
+            "category": "Dessert",
+            "tags": ["hungarian"],
+            "ingredients": [{"ingredient": "Flour", "quantity": "bad", "unit": "g"}],
+        },
+        {"story": "no title"},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+
+    def write_json(self, data):
+        path = (
+            Path(self.tmpdir.name) / f"import{len(os.listdir(self.tmpdir.name))}.json"
+        )
+        path.write_text(json.dumps(data), encoding="utf-8")
+        return str(path)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def run_import(self, data, *args, username="alice"):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_recipes",
+            self.write_json(data),
+            f"--username={username}",
+            *args,
+            stdout=out,
+            stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def snapshot(self):
+        return sorted(
+            (
+                r.title,
+                r.story,
+                r.cooking_time,
+                r.cooking_time_unit,
+                r.category.name if r.category else None,
+                sorted(t.name for t in r.tags.all()),
+                sorted(
+                    (ri.ingredient.name, ri.quantity, ri.unit)
+                    for ri in r.recipe_ingredients.all()
+                ),
+            )
+            for r in Recipe.objects.all()
+        )
+
+    def test_bulk_import_creates_everything(self):
+        out, err = self.run_import({"receptek": self.ITEMS}, "--bulk")
+        self.assertIn("Created: 2, Updated: 0", out)
+        self.assertIn("Skipping item without title", err)
+        goulash = Recipe.objects.get(title="Gulyásleves")
+        self.assertEqual(goulash.cooking_time_unit, "hr")
+        self.assertEqual(goulash.category.name, "Soup")
+        self.assertEqual(
+            sorted(goulash.tags.values_list("name", flat=True)), ["beef", "hungarian"]
+        )
+        self.assertEqual(Tag.objects.filter(name="hungarian").count(), 1)
+        pancakes = Recipe.objects.get(title="Pancakes")
+        self.assertEqual(pancakes.recipe_ingredients.get().quantity, 0)
+        # bulk inserts are indexed for search too
+        resp = self.client.get(reverse("recipes:recipe_list"), {"q": "paprika"})
+        self.assertNotContains(resp, "Pancakes")
+        resp = self.client.get(reverse("recipes:recipe_list"), {"q": "gulyas"})
+        self.assertContains(resp, "Gulyásleves")
+
+    def test_bulk_matches_per_item_import(self):
+        self.run_import(self.ITEMS)
+        expected = self.snapshot()
+        Recipe.objects.all().delete()
+        self.run_import(self.ITEMS, "--bulk", "--batch-size=1")
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_rerun_without_update_leaves_recipes_alone(self):
+        self.run_import(self.ITEMS)
+        expected = self.snapshot()
+        lines = RecipeIngredient.objects.count()
+        changed = [dict(self.ITEMS[1], tags=["brunch"], story="Monday")]
+        out, _ = self.run_import(self.ITEMS[:2] + changed)
+        self.assertIn("Created: 0, Updated: 0, Skipped existing: 3", out)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(RecipeIngredient.objects.count(), lines)
+
+    def test_single_recipe_file(self):
+        out, _ = self.run_import(self.ITEMS[1])
+        self.assertIn("Created: 1", out)
+        self.assertTrue(Recipe.objects.filter(title="Pancakes").exists())
+
+    def test_update_skips_unchanged_recipes_without_bulk(self):
+        self.run_import(self.ITEMS, "--update")
+        lines = sorted(RecipeIngredient.objects.values_list("pk", flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            out, _ = self.run_import(self.ITEMS, "--update")
+        self.assertIn("Created: 0, Updated: 0, Unchanged: 2", out)
+        writes = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(
+            sorted(RecipeIngredient.objects.values_list("pk", flat=True)), lines
+        )
+
+    def test_feed_ids_are_per_author(self):
+        User.objects.create_user(username="bob", password="pass1234")
+        item = dict(self.ITEMS[1], id=42)
+        self.run_import([item], "--bulk", "--update")
+        out, _ = self.run_import(
+            [dict(item, title="Bob's pancakes")], "--bulk", "--update", username="bob"
+        )
+        self.assertIn("Created: 1, Updated: 0", out)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list("title", "author__username")),
+            [("Bob's pancakes", "bob"), ("Pancakes", "alice")],
+        )
+
+    def test_bulk_update_semantics(self):
+        self.run_import(self.ITEMS, "--bulk")
+        changed = [
+            {
+                "title": "Pancakes",
+                "story": "Monday",
+                "instructions": "Bake.",
+                "cooking_time": 30,
+                "ingredients": [{"ingredient": "Milk", "quantity": 1, "unit": "l"}],
+            }
+        ]
+        out, _ = self.run_import(changed, "--bulk")
+        self.assertIn("Skipped existing: 1", out)
+        self.assertEqual(Recipe.objects.get(title="Pancakes").story, "Sunday")
+
+        out, _ = self.run_import(changed, "--bulk", "--update")
+        self.assertIn("Created: 0, Updated: 1", out)
+        pancakes = Recipe.objects.get(title="Pancakes")
+        self.assertEqual(pancakes.story, "Monday")
+        self.assertIsNone(pancakes.category)
+        self.assertFalse(pancakes.tags.exists())
+        self.assertEqual(
+            [ri.ingredient.name for ri in pancakes.recipe_ingredients.all()], ["Milk"]
+        )
+        self.assertEqual(Recipe.objects.filter(title="Pancakes").count(), 1)
+
+    def test_parallel_workers_match_serial_import(self):
+        items = [
+            dict(self.ITEMS[0], **{"cím": f"Leves {i}"}) for i in range(450)
+        ] + self.ITEMS
+        self.run_import(items, "--bulk")
+        expected = self.snapshot()
+        Recipe.objects.all().delete()
+        out, _ = self.run_import(items, "--bulk", "--workers=2")
+        self.assertIn("Created: 452", out)
+        self.assertIn("Stage times: read", out)
+        self.assertIn("normalize", out)
+        self.assertIn("write", out)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_invalid_items_are_reported_and_skipped(self):
+        items = [
+            {"title": "Ok", "cooking_time": "15", "cooking_time_unit": "perc"},
+            {"title": "Bad time", "cooking_time": "soon"},
+            {"title": "Bad unit", "cooking_time": 1, "cooking_time_unit": "days"},
+            {"title": "x" * 101},
+            {"title": "Forever", "cooking_time": 1e12},
+            *(
+                {"title": f"Bad quantity {quantity}", "ingredients": [line]}
+                for quantity in (100000, 1.005, "NaN", float("inf"))
+                for line in [{"ingredient": "Salt", "quantity": quantity}]
+            ),
+        ]
+        for args in ((), ("--bulk",)):
+            Recipe.objects.all().delete()
+            out, err = self.run_import(items, *args)
+            self.assertIn("Created: 1", out)
+            self.assertIn("Invalid: 8", out)
+            self.assertIn("('Forever'): cooking_time: too large", err)
+            self.assertIn("('Bad quantity 100000'): ingredients: quantity out", err)
+            self.assertIn("('Bad quantity 1.005'): ingredients: quantity out", err)
+            self.assertIn("('Bad quantity NaN'): ingredients: quantity not a", err)
+            self.assertIn("('Bad quantity inf'): ingredients: quantity not a", err)
+            self.assertIn("Skipping item 2 ('Bad time'): cooking_time", err)
+            self.assertIn("cooking_time_unit: unknown unit 'days'", err)
+            self.assertIn("title: too long", err)
+            ok = Recipe.objects.get()
+            self.assertEqual((ok.cooking_time, ok.cooking_time_unit), (15, "min"))
+
+    def test_unchanged_reimport_writes_nothing(self):
+        self.run_import(self.ITEMS, "--bulk", "--update")
+        with CaptureQueriesContext(connection) as ctx:
+            out, _ = self.run_import(self.ITEMS, "--bulk", "--update")
+        self.assertIn("Created: 0, Updated: 0, Unchanged: 2", out)
+        writes = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        self.assertEqual(writes, [])
+
+    def test_changed_recipe_gets_diffed_lines(self):
+        self.run_import(self.ITEMS, "--bulk", "--update")
+        goulash = Recipe.objects.get(title="Gulyásleves")
+        beef_line = goulash.recipe_ingredients.get(ingredient__name="Beef")
+        changed = json.loads(json.dumps(self.ITEMS))
+        changed[0]["hozzávalók"][1]["mennyiség"] = 3
+        changed[0]["címkék"] = ["hungarian", "spicy"]
+
+        out, _ = self.run_import(changed, "--bulk", "--update")
+        self.assertIn("Created: 0, Updated: 1, Unchanged: 1", out)
+        lines = {ri.ingredient.name: ri for ri in goulash.recipe_ingredients.all()}
+        self.assertEqual(lines["Beef"].pk, beef_line.pk)
+        self.assertEqual(lines["Paprika"].quantity, 3)
+        self.assertEqual(
+            sorted(goulash.tags.values_list("name", flat=True)), ["hungarian", "spicy"]
+        )
+
+    def test_feed_id_survives_title_change(self):
+        item = dict(self.ITEMS[1], id=42)
+        self.run_import([item], "--bulk", "--update")
+        recipe = Recipe.objects.get(title="Pancakes")
+        out, _ = self.run_import([dict(item, title="Crêpes")], "--bulk", "--update")
+        self.assertIn("Created: 0, Updated: 1", out)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "Crêpes")
+        self.assertEqual(
+            recipe.import_record.source_key, f"user:{self.author.pk}:id:42"
+        )
+
+    def test_resume_continues_after_last_committed_batch(self):
+        items = [{"title": f"Soup {i}"} for i in range(5)]
+        path = self.write_json(items)
+        args = ("import_recipes", path, "--username=alice", "--bulk", "--batch-size=2")
+        original = BulkImporter.import_chunk
+        calls = []
+
+        def crash_on_second_batch(importer, chunk):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise RuntimeError("crash")
+            return original(importer, chunk)
+
+        with mock.patch.object(BulkImporter, "import_chunk", crash_on_second_batch):
+            with self.assertRaisesMessage(RuntimeError, "crash"):
+                call_command(*args, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Recipe.objects.count(), 2)
+        with open(f"{path}.checkpoint", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["offset"], 2)
+
+        out = StringIO()
+        call_command(*args, "--resume", stdout=out, stderr=StringIO())
+        self.assertIn("Resuming after item 2", out.getvalue())
+        self.assertIn("Created: 3", out.getvalue())
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_resume_refuses_checkpoint_of_another_file(self):
+        path = self.write_json(self.ITEMS)
+        Checkpoint(f"{path}.checkpoint", self.write_json([])).save(1)
+        with self.assertRaisesMessage(CommandError, "Cannot resume"):
+            call_command("import_recipes", path, "--username=alice", "--resume")
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_per_item_import_matches_oldest_duplicate_title(self):
+        first, _ = (
+            Recipe.objects.create(title="Pancakes", cooking_time=5, author=self.author)
+            for _ in range(2)
+        )
+        out, _ = self.run_import(self.ITEMS, "--update")
+        self.assertIn("Created: 1, Updated: 1", out)
+        first.refresh_from_db()
+        self.assertEqual(first.story, "Sunday")
+
+    def test_dry_run_reports_stats_without_writing(self):
+        items = self.ITEMS + [{"title": "Bad", "cooking_time": "soon"}]
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_recipes",
+            self.write_json(items),
+            "--dry-run",
+            "--stats",
+            stdout=out,
+            stderr=err,
+        )
+        out = out.getvalue()
+        self.assertIn("Dry run, nothing written. Valid: 2, Invalid: 1", out)
+        self.assertIn("Items: 4 in", out)
+        self.assertIn("items/s", out)
+        self.assertIn("  cooking_time: 1\n", out)
+        self.assertIn("  title: 1\n", out)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+
+    def test_ndjson_import(self):
+        path = Path(self.tmpdir.name) / "feed.ndjson"
+        path.write_text(
+            "\n".join(json.dumps(item) for item in self.ITEMS), encoding="utf-8"
+        )
+        out = StringIO()
+        call_command(
+            "import_recipes",
+            str(path),
+            "--username=alice",
+            "--bulk",
+            stdout=out,
+            stderr=StringIO(),
+        )
+        self.assertIn("Created: 2", out.getvalue())
+
+    def test_bad_json_is_reported(self):
+        path = Path(self.tmpdir.name) / "bad.json"
+        path.write_text('{"recipes": {"title": "x"}}', encoding="utf-8")
+        with self.assertRaisesMessage(CommandError, "JSON must be a list"):
+            call_command("import_recipes", str(path), "--username=alice")
+        path.write_text("[{", encoding="utf-8")
+        with self.assertRaisesMessage(CommandError, "Cannot read JSON"):
+            call_command("import_recipes", str(path), "--username=alice")
+
+
+class ExportRecipesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        soup = Category.objects.create(name="Soup")
+        hot = Tag.objects.create(name="hot")
+        beef = Ingredient.objects.create(name="Beef")
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                title=f"Gulyás {i}",
+                story="Classic",
+                instructions="Cook it.",
+                cooking_time=2,
+                cooking_time_unit="hr",
+                category=soup if i % 2 else None,
+                author=cls.author,
+            )
+            recipe.tags.add(hot)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=beef, quantity="1.50", unit="kg"
+            )
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def export(self, name, *args):
+        path = os.path.join(self.tmpdir.name, name)
+        call_command("export_recipes", path, *args, stderr=StringIO())
+        return path
+
+    def snapshot(self):
+        return sorted(
+            (
+                r.title,
+                r.story,
+                r.cooking_time_unit,
+                r.category.name if r.category else None,
+                [t.name for t in r.tags.all()],
+                [
+                    (ri.ingredient.name, ri.quantity)
+                    for ri in r.recipe_ingredients.all()
+                ],
+            )
+            for r in Recipe.objects.all()
+        )
+
+    def test_export_round_trips_through_import(self):
+        path = self.export("recipes.json")
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[1]["category"], "Soup")
+        self.assertNotIn("id", data[0])
+        self.assertEqual(
+            data[0]["ingredients"],
+            [{"ingredient": "Beef", "quantity": "1.50", "unit": "kg"}],
+        )
+        expected = self.snapshot()
+        Recipe.objects.all().delete()
+        call_command(
+            "import_recipes", path, "--username=alice", "--bulk", stdout=StringIO()
+        )
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_ids_on_request(self):
+        path = self.export("recipes.json", "--with-ids")
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(
+            [item["id"] for item in data],
+            list(Recipe.objects.order_by("pk").values_list("pk", flat=True)),
+        )
+
+    def test_gzipped_ndjson(self):
+        path = self.export("recipes.ndjson.gz")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            titles = [json.loads(line)["title"] for line in f]
+        self.assertEqual(titles, [f"Gulyás {i}" for i in range(5)])
+
+    def test_queries_per_chunk_not_per_recipe(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.export("recipes.json", "--chunk-size=2")
+        # One streamed recipe query plus tags and lines for each of 3 chunks.
+        self.assertEqual(len(ctx.captured_queries), 1 + 2 * 3)
+
+    def test_endpoint_streams_export(self):
+        url = reverse("recipes:recipe_export")
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 302)
+
+        self.client.login(username="alice", password="pass1234")
+        resp = self.client.get(url, {"format": "ndjson", "gzip": "1"})
+        self.assertTrue(resp.streaming)
+        self.assertFalse(resp.is_async)
+        self.assertEqual(resp["Content-Type"], "application/gzip")
+        self.assertIn("recipes.ndjson.gz", resp["Content-Disposition"])
+        lines = gzip.decompress(b"".join(resp.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 5)
+
+        resp = self.client.get(url)
+        data = json.loads(b"".join(resp.streaming_content))
+        self.assertEqual([r["title"] for r in data][:2], ["Gulyás 0", "Gulyás 1"])
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 400)
+
+    async def test_endpoint_streams_asynchronously_under_asgi(self):
+        await self.async_client.alogin(username="alice", password="pass1234")
+        resp = await self.async_client.get(
+            reverse("recipes:recipe_export"), {"format": "ndjson"}
+        )
+        self.assertTrue(resp.is_async)
+        pieces = aiter(resp.streaming_content)
+        first = await anext(pieces)
+        self.assertEqual(json.loads(first.splitlines()[0])["title"], "Gulyás 0")
+        rest = [piece async for piece in pieces]
+        lines = b"".join([first, *rest]).splitlines()
+        self.assertEqual(len(lines), 5)
+
+
+class RecipeAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.soup_cat = Category.objects.create(name="Soup")
+        cls.vegan = Tag.objects.create(name="vegan")
+        carrot = Ingredient.objects.create(name="Carrot")
+        cls.recipes = []
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                title=f"Leves {i}",
+                author=cls.author,
+                category=cls.soup_cat,
+                story="Grandma's soup" if i == 2 else "Weeknight dinner",
+                cooking_time=30,
+                instructions="Simmer.",
+            )
+            recipe.tags.add(cls.vegan)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=carrot, quantity="2.50", unit="unit"
+            )
+            cls.recipes.append(recipe)
+
+    def get(self, url, **params):
+        resp = self.client.get(url, params)
+        self.assertEqual(resp["Content-Type"], "application/json")
+        return resp
+
+    def test_list_newest_first_with_cursor_pages(self):
+        url = reverse("recipes:api_recipe_list")
+        with self.assertNumQueries(2):  # recipes, ingredient lines
+            data = self.get(url, limit=2).json()
+        self.assertEqual([r["title"] for r in data["results"]], ["Leves 4", "Leves 3"])
+        first = data["results"][0]
+        self.assertEqual(first["category"], "Soup")
+        self.assertEqual(first["author"], "alice")
+        self.assertEqual(first["tags"], ["vegan"])
+        self.assertEqual(
+            first["ingredients"],
+            [{"ingredient": "Carrot", "quantity": "2.50", "unit": "unit"}],
+        )
+        self.assertIsNone(first["image"])
+        self.assertIsNone(data["previous"])
+
+        data = self.get(url, limit=2, after=data["next"]).json()
+        self.assertEqual(
+            [r["id"] for r in data["results"]], [self.recipes[2].pk, self.recipes[1].pk]
+        )
+        self.assertIsNotNone(data["previous"])
+
+    def test_sparse_fields_skip_unneeded_queries(self):
+        url = reverse("recipes:api_recipe_list")
+        with self.assertNumQueries(1):
+            data = self.get(url, fields="title,category").json()
+        self.assertEqual(
+            data["results"][0],
+            {"id": self.recipes[-1].pk, "title": "Leves 4", "category": "Soup"},
+        )
+        resp = self.get(url, fields="title,secret")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("secret", resp.json()["error"])
+
+    def test_search_matches_recipe_list(self):
+        url = reverse("recipes:api_recipe_list")
+        data = self.get(url, q="grandma", fields="title").json()
+        self.assertEqual([r["title"] for r in data["results"]], ["Leves 2"])
+        html = self.client.get(reverse("recipes:recipe_list"), {"q": "grandma"})
+        self.assertEqual(
+            [r["id"] for r in data["results"]],
+            [r.pk for r in html.context["recipes"]],
+        )
+
+    def test_detail_and_missing_recipe(self):
+        recipe = self.recipes[0]
+        url = reverse("recipes:api_recipe_detail", args=[recipe.pk])
+        data = self.get(url, fields="title,tags").json()
+        self.assertEqual(data, {"id": recipe.pk, "title": "Leves 0", "tags": ["vegan"]})
+        missing = reverse("recipes:api_recipe_detail", args=[9999])
+        self.assertEqual(self.get(missing).status_code, 404)
+
+    def test_etag_revalidation(self):
+        url = reverse("recipes:api_recipe_detail", args=[self.recipes[0].pk])
+        resp = self.get(url)
+        etag = resp["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertIn("no-cache", resp["Cache-Control"])
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b"")
+
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(title="Changed")
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+
+class RecipeBatchAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.other = User.objects.create_user(username="bob", password="pass1234")
+
+    def setUp(self):
+        self.client.login(username="alice", password="pass1234")
+
+    def post(self, items, **params):
+        url = reverse("recipes:api_recipe_batch")
+        if params:
+            url += "?" + "&".join(f"{k}={v}" for k, v in params.items())
+        return self.client.post(url, json.dumps(items), content_type="application/json")
+
+    def item(self, i, **extra):
+        return {
+            "id": f"p-{i}",
+            "title": f"Partner {i}",
+            "instructions": "Mix.",
+            "cooking_time": 10,
+            "category": "Snack",
+            "tags": ["partner", f"t{i % 3}"],
+            "ingredients": [
+                {"ingredient": "Flour", "quantity": "100", "unit": "g"},
+                {"ingredient": f"Spice {i % 5}", "quantity": 1, "unit": "tsp"},
+            ],
+            **extra,
+        }
+
+    def test_creates_batch_with_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post([self.item(0)]).json()["created"], 1)
+        with CaptureQueriesContext(connection) as large:
+            resp = self.post([self.item(i) for i in range(1, 101)])
+        self.assertEqual(resp.json()["created"], 100)
+        # Bulk inserts: the query count doesn't grow with the batch.
+        self.assertLessEqual(len(large), len(small) + 3)
+        self.assertEqual(Recipe.objects.filter(author=self.author).count(), 101)
+        recipe = Recipe.objects.get(title="Partner 7")
+        self.assertEqual(
+            sorted(recipe.tags.values_list("name", flat=True)), ["partner", "t1"]
+        )
+        self.assertEqual(recipe.recipe_ingredients.count(), 2)
+        # Bulk writes still reach the full-text index.
+        found = search.search_recipes(Recipe.objects.all(), "t1 partner 7")
+        self.assertIn(recipe, found)
+
+    def test_invalid_items_are_reported_and_the_rest_written(self):
+        resp = self.post(
+            [
+                self.item(1),
+                self.item(2, cooking_time="soon"),
+                {"story": "no title"},
+                self.item(3),
+            ]
+        )
+        data = resp.json()
+        self.assertEqual((data["created"], data["invalid"]), (2, 2))
+        self.assertEqual(
+            [e["index"] for e in data["errors"]],
+            [1, 2],
+        )
+        self.assertEqual(
+            data["errors"][0]["errors"], ["cooking_time: not a non-negative integer"]
+        )
+        self.assertEqual(data["errors"][0]["title"], "Partner 2")
+
+    def test_malformed_batches_are_rejected_whole(self):
+        for body, error in [
+            ([self.item(1), "not an object"], "recipe 1 is not an object"),
+            ({"recipes": [self.item(1)], "update": True}, "unexpected keys: update"),
+            ({"items": []}, "unexpected keys: items"),
+            ({}, "expected a list of recipes"),
+        ]:
+            resp = self.post(body)
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(resp.json(), {"error": error})
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_programs_authenticate_with_basic_auth(self):
+        self.client.logout()
+        client = Client(enforce_csrf_checks=True)
+        url = reverse("recipes:api_recipe_batch")
+        body = json.dumps([self.item(1)])
+
+        resp = client.post(url, body, content_type="application/json")
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json(), {"error": "authentication required"})
+        self.assertIn("Basic", resp["WWW-Authenticate"])
+
+        def basic(credentials):
+            token = base64.b64encode(credentials.encode()).decode()
+            return {"HTTP_AUTHORIZATION": f"Basic {token}"}
+
+        for wrong in ("alice:nope", "alice", "nobody:pass1234"):
+            resp = client.post(
+                url, body, content_type="application/json", **basic(wrong)
+            )
+            self.assertEqual(resp.status_code, 401, wrong)
+        # No CSRF token needed: the credentials aren't sent by browsers.
+        resp = client.post(
+            url, body, content_type="application/json", **basic("alice:pass1234")
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Recipe.objects.get().author, self.author)
+
+    def test_sessions_need_the_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username="alice", password="pass1234")
+        url = reverse("recipes:api_recipe_batch")
+        body = json.dumps([self.item(1)])
+        resp = client.post(url, body, content_type="application/json")
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resp.json(), {"error": "CSRF token missing or incorrect"})
+
+        client.get(reverse("recipes:recipe_create"))
+        token = client.cookies["csrftoken"].value
+        resp = client.post(
+            url, body, content_type="application/json", HTTP_X_CSRFTOKEN=token
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["created"], 1)
+
+    def test_updates_meet_imports_of_the_command(self):
+        def run_command(*items):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = Path(tmpdir) / "feed.json"
+                path.write_text(json.dumps(items), encoding="utf-8")
+                call_command(
+                    "import_recipes",
+                    str(path),
+                    "--username=alice",
+                    "--bulk",
+                    "--update",
+                    stdout=StringIO(),
+                )
+
+        # Matched by title, with no feed id.
+        first, second = self.item(1, id=None), self.item(2, id=None)
+        run_command(first)
+        data = self.post([dict(first, story="From the API")], update=1).json()
+        self.assertEqual((data["created"], data["updated"]), (0, 1))
+        self.post([second])
+        run_command(dict(second, story="From the feed"))
+        self.assertEqual(
+            sorted(Recipe.objects.values_list("title", "story")),
+            [("Partner 1", "From the API"), ("Partner 2", "From the feed")],
+        )
+
+    def test_update_only_touches_own_recipes(self):
+        theirs = Recipe.objects.create(
+            title="Partner 1", author=self.other, cooking_time=5, instructions="Old."
+        )
+        self.post([self.item(1)])
+        self.assertEqual(Recipe.objects.filter(title="Partner 1").count(), 2)
+
+        data = self.post([self.item(1, instructions="New.")], update=1).json()
+        self.assertEqual((data["created"], data["updated"]), (0, 1))
+        mine = Recipe.objects.get(title="Partner 1", author=self.author)
+        self.assertEqual(mine.instructions, "New.")
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.instructions, "Old.")
+
+        data = self.post([self.item(1, instructions="New.")], update=1).json()
+        self.assertEqual(data["unchanged"], 1)
+        self.assertEqual(self.post([self.item(1)]).json()["skipped"], 1)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.post({"recipes": "nope"}).status_code, 400)
+        resp = self.client.post(
+            reverse("recipes:api_recipe_batch"), "{", content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 400)
+        with mock.patch("recipes.api.MAX_BATCH", 2):
+            self.assertEqual(
+                self.post([self.item(i) for i in range(3)]).status_code, 400
+            )
+        self.assertEqual(self.post({"recipes": [self.item(1)]}).status_code, 200)
+        self.assertEqual(
+            self.client.get(reverse("recipes:api_recipe_batch")).status_code, 405
+        )
+        self.client.logout()
+        self.assertEqual(self.post([self.item(2)]).status_code, 401)
+        self.assertFalse(Recipe.objects.filter(title="Partner 2").exists())
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(TestCase):
+    """The views stay within their query budgets at 1, 10 and 100 recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.category = Category.objects.create(name="Dinner")
+        cls.tags = [Tag.objects.create(name=name) for name in ("quick", "vegan")]
+        cls.flour = Ingredient.objects.create(name="Flour")
+        cls.salt = Ingredient.objects.create(name="Salt")
+
+    def add_recipes(self, count):
+        for _ in range(count):
+            recipe = Recipe.objects.create(
+                title="Bread",
+                author=self.author,
+                category=self.category,
+                cooking_time=30,
+                instructions="Bake.",
+            )
+            recipe.tags.set(self.tags)
+            for ingredient in (self.flour, self.salt):
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, quantity=1, unit="g"
+                )
+
+    def form_data(self, recipe=None, new_lines=0):
+        lines = list(recipe.recipe_ingredients.all()) if recipe else []
+        lines += [None] * (new_lines if lines or new_lines else 1)
+        data = {
+            "title": "Bread",
+            "story": "Bread",
+            "description": "",
+            "instructions": "Bake.",
+            "cooking_time": 30,
+            "cooking_time_unit": "min",
+            "category": self.category.pk,
+            "tags": [tag.pk for tag in self.tags],
+            "recipe_ingredients-TOTAL_FORMS": str(len(lines)),
+            "recipe_ingredients-INITIAL_FORMS": str(len(lines) - lines.count(None)),
+            "recipe_ingredients-MIN_NUM_FORMS": "1",
+            "recipe_ingredients-MAX_NUM_FORMS": "1000",
+        }
+        for i, line in enumerate(lines):
+            if line:
+                data[f"recipe_ingredients-{i}-id"] = str(line.pk)
+            data[f"recipe_ingredients-{i}-ingredient"] = str(self.flour.pk)
+            data[f"recipe_ingredients-{i}-quantity"] = "2"
+            data[f"recipe_ingredients-{i}-unit"] = "g"
+        return data
+
+    def query_counts(self):
+        """Queries per request, with cold caches, for every page."""
+        cache.clear()
+        choices._snapshots.clear()
+        searchcache.results.reset()
+        recipe = Recipe.objects.order_by("pk").first()
+        # So that the update below changes both lines every time.
+        recipe.recipe_ingredients.update(quantity=1)
+        detail = reverse("recipes:recipe_detail", args=[recipe.pk])
+        update = reverse("recipes:recipe_update", args=[recipe.pk])
+        requests = [
+            ("list", "get", reverse("recipes:recipe_list"), None),
+            ("search", "get", reverse("recipes:recipe_list") + "?q=bread", None),
+            ("detail", "get", detail, None),
+            ("profile", "get", reverse("recipes:profile", args=["alice"]), None),
+            ("create form", "get", reverse("recipes:recipe_create"), None),
+            ("create", "post", reverse("recipes:recipe_create"), self.form_data()),
+            ("update form", "get", update, None),
+            ("update", "post", update, self.form_data(recipe)),
+        ]
+        counts = {}
+        for name, method, url, data in requests:
+            with CaptureQueriesContext(connection) as ctx:
+                resp = getattr(self.client, method)(url, data)
+            self.assertEqual(resp.status_code, 302 if method == "post" else 200, name)
+            self.assertNotIn("X-Duplicate-Queries", resp, name)
+            counts[name] = len(ctx.captured_queries)
+        return counts
+
+    def test_query_counts_do_not_grow_with_the_data(self):
+        self.client.force_login(self.author)
+        self.add_recipes(1)
+        small = self.query_counts()
+        self.add_recipes(9)
+        self.assertEqual(self.query_counts(), small)
+        self.add_recipes(90)
+        self.assertEqual(self.query_counts(), small)
+
+    def test_form_budget_covers_many_ingredient_lines(self):
+        self.client.force_login(self.author)
+        self.add_recipes(1)
+        recipe = Recipe.objects.get()
+        cache.clear()
+        choices._snapshots.clear()
+        url = reverse("recipes:recipe_create")
+        resp = self.client.post(url, self.form_data(new_lines=10))
+        self.assertEqual(resp.status_code, 302)
+        # The lines' ingredients are validated with one query, not ten.
+        self.assertNotIn("X-Duplicate-Queries", resp)
+        url = reverse("recipes:recipe_update", args=[recipe.pk])
+        resp = self.client.post(url, self.form_data(recipe, new_lines=8))
+        self.assertEqual(resp.status_code, 302)
+        self.assertNotIn("X-Duplicate-Queries", resp)
+        self.assertEqual(recipe.recipe_ingredients.count(), 10)
+
+        # Changing every line of a long recipe: one write each, and one
+        # touch of the recipe for all of them.
+        resp = self.client.post(url, self.form_data(recipe, new_lines=10))
+        self.assertEqual(recipe.recipe_ingredients.count(), 20)
+        recipe.recipe_ingredients.update(quantity=1)
+        with self.assertNoLogs("recipes.querybudget", "WARNING"):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post(url, self.form_data(recipe))
+        self.assertEqual(resp.status_code, 302)
+        touches = [
+            q for q in ctx.captured_queries if 'UPDATE "recipes_recipe" ' in q["sql"]
+        ]
+        self.assertEqual(len(touches), 2)  # The recipe's save, then the touch.
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 20)
+
+    def test_form_budget_covers_real_edits(self):
+        """Category, tags and lines all changing, at 1, 10 and 100 lines."""
+        self.client.force_login(self.author)
+        lunch = Category.objects.create(name="Lunch")
+        spicy = Tag.objects.create(name="spicy")
+        counts = []
+        for lines in (1, 10, 100):
+            Recipe.objects.all().delete()
+            cache.clear()
+            choices._snapshots.clear()
+            create = reverse("recipes:recipe_create")
+            with self.assertNoLogs("recipes.querybudget", "WARNING"):
+                self.client.post(create, self.form_data(new_lines=lines))
+            recipe = Recipe.objects.get()
+            recipe.recipe_ingredients.update(quantity=1)
+            data = self.form_data(recipe, new_lines=2)
+            data.update(category=lunch.pk, tags=[self.tags[0].pk, spicy.pk])
+            data["recipe_ingredients-0-DELETE"] = "on"
+            cache.clear()
+            choices._snapshots.clear()
+            update = reverse("recipes:recipe_update", args=[recipe.pk])
+            with self.assertNoLogs("recipes.querybudget", "WARNING"):
+                with CaptureQueriesContext(connection) as ctx:
+                    resp = self.client.post(update, data)
+            self.assertEqual(resp.status_code, 302)
+            counts.append(len(ctx))
+            recipe.refresh_from_db()
+            self.assertEqual(
+                (recipe.category_name, recipe.tag_names, recipe.ingredient_count),
+                ("Lunch", ["quick", "spicy"], lines + 1),
+            )
+        # A single line is deleted and re-added, with no edited ones to write.
+        self.assertEqual(counts, [counts[0], counts[0] + 1, counts[0] + 1])
+
+    def test_budget_raises_or_logs(self):
+        with self.assertRaises(querybudget.QueryBudgetExceeded):
+            with querybudget.query_budget(1, name="two queries"):
+                list(User.objects.all())
+                list(Tag.objects.all())
+        with self.settings(QUERY_BUDGET_RAISE=False):
+            with self.assertLogs("recipes.querybudget", "WARNING") as logs:
+                with querybudget.query_budget(0, name="one query"):
+                    list(Tag.objects.all())
+        self.assertIn("one query ran 1 queries, budget 0", logs.output[0])
+        # Write views only log: their changes have committed by then.
+        with self.assertLogs("recipes.querybudget", "WARNING"):
+            with querybudget.query_budget(0, name="saved", raises=False):
+                list(Tag.objects.all())
+
+    def test_duplicate_query_middleware_flags_n_plus_one(self):
+        recipes = [
+            Recipe.objects.create(
+                title=f"R{i}", author=self.author, cooking_time=1, instructions="x"
+            )
+            for i in range(3)
+        ]
+
+        def n_plus_one(request):
+            for recipe in Recipe.objects.filter(pk__in=[r.pk for r in recipes]):
+                recipe.author.username
+            return HttpResponse()
+
+        middleware = querybudget.DuplicateQueryMiddleware(n_plus_one)
+        with self.assertLogs("recipes.querybudget", "WARNING") as logs:
+            resp = middleware(RequestFactory().get("/"))
+        self.assertEqual(resp["X-Duplicate-Queries"], "1")
+        self.assertIn("ran 3 times", logs.output[0])
+        self.assertIn("auth_user", logs.output[0])
+
+
+class QueryPlanTests(TestCase):
+    """No page's queries scan a large table without an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            User.objects.create_user(username=f"cook{i}", password="pass1234")
+            for i in range(4)
+        ]
+        cls.category = Category.objects.create(name="Dinner")
+        tag = Tag.objects.create(name="quick")
+        flour = Ingredient.objects.create(name="Flour")
+        for i in range(100):
+            recipe = Recipe.objects.create(
+                title=f"Bread {i}",
+                author=authors[i % 4],
+                category=cls.category,
+                cooking_time=30,
+                instructions="Bake.",
+            )
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=flour, quantity=1, unit="g"
+            )
+        cls.recipe = recipe
+        cls.author = recipe.author
+
+    def setUp(self):
+        cache.clear()
+        choices._snapshots.clear()
+        searchcache.results.reset()
+
+    def scans(self, url):
+        with queryplan.PlanCapture() as capture:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return capture, capture.full_scans(min_rows=50)
+
+    def test_pages_use_indexes(self):
+        self.client.force_login(self.author)
+        list_url = reverse("recipes:recipe_list")
+        for url in [
+            list_url,
+            list_url + "?q=bread",
+            list_url + "?max_minutes=30&sort=time",
+            list_url + "?q=bread&max_minutes=30&sort=time",
+            list_url + "?category=Dinner&tag=quick&tag=vegan",
+            reverse("recipes:recipe_detail", args=[self.recipe.pk]),
+            reverse("recipes:profile", args=["cook1"]),
+            reverse("recipes:recipe_update", args=[self.recipe.pk]),
+            reverse("recipes:api_recipe_list"),
+        ]:
+            _, scans = self.scans(url)
+            self.assertEqual(scans, [], url)
+
+    def test_profile_reads_the_author_index(self):
+        capture, _ = self.scans(reverse("recipes:profile", args=["cook1"]))
+        sql, params = capture.selects[0]
+        plan = " ".join(capture.explain(sql, params))
+        self.assertIn("recipes_recipe_author_id", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_import_lookups_read_the_title_index(self):
+        item = {
+            "title": "Bread 7",
+            "instructions": "Bake.",
+            "cooking_time": 30,
+            "ingredients": [{"ingredient": "Flour", "quantity": 1, "unit": "g"}],
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "import.json"
+            path.write_text(json.dumps([item]), encoding="utf-8")
+            for extra in ([], ["--bulk"]):
+                with queryplan.PlanCapture() as capture:
+                    call_command(
+                        "import_recipes",
+                        str(path),
+                        "--username=cook1",
+                        *extra,
+                        stdout=StringIO(),
+                    )
+                lookups = [
+                    (sql, params)
+                    for sql, params in capture.selects
+                    if '"recipes_recipe"."title" ' in sql and "WHERE" in sql
+                ]
+                self.assertTrue(lookups, extra)
+                for sql, params in lookups:
+                    plan = " ".join(capture.explain(sql, params))
+                    self.assertIn("recipes_rec_title_3771db_idx", plan, sql)
+
+    def test_flags_unindexed_filters(self):
+        with queryplan.PlanCapture() as capture:
+            list(Recipe.objects.filter(story="Bread 1"))
+            list(Recipe.objects.filter(story="Bread 1").filter(pk__in=[1, 2]))
+            list(Recipe.objects.order_by("-id")[:12])
+        scans = capture.full_scans(min_rows=50)
+        self.assertEqual([table for table, _, _ in scans], ["recipes_recipe"])
+        self.assertEqual(capture.full_scans(min_rows=1000), [])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.flour = Ingredient.objects.create(name="Flour")
+        cls.recipes = [
+            Recipe.objects.create(
+                title=f"Bread {i}", author=cls.author, cooking_time=5, instructions="x"
+            )
+            for i in range(3)
+        ]
+
+    def test_detail_answers_304_with_one_query(self):
+        recipe = self.recipes[0]
+        url = reverse("recipes:recipe_detail", args=[recipe.pk])
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("private", resp["Cache-Control"])
+        self.assertIn("Cookie", resp["Vary"])
+        self.assertEqual(self.revalidate(url, resp), 304)
+        not_modified = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"]
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+        recipe.tags.add(Tag.objects.create(name="rye"))
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+        resp = self.client.get(url)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.flour, quantity=1, unit="kg"
+        )
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+        resp = self.client.get(url)
+        self.flour.name = "Rye flour"
+        self.flour.save()
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+
+    def revalidate(self, url, resp, queries=1):
+        if queries is None:
+            return self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code
+        with self.assertNumQueries(queries):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        return again.status_code
+
+    def test_list_etag_follows_the_page_rows(self):
+        url = reverse("recipes:recipe_list")
+        resp = self.client.get(url)
+        self.assertEqual(self.revalidate(url, resp), 304)
+        self.assertEqual(self.revalidate(url + "?q=bread", resp, queries=None), 200)
+
+        self.recipes[1].delete()
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+        resp = self.client.get(url)
+        Recipe.objects.create(
+            title="New", author=self.author, cooking_time=1, instructions="x"
+        )
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+
+        search = self.client.get(url, {"q": "bread"})
+        self.assertEqual(
+            self.client.get(
+                url, {"q": "bread"}, HTTP_IF_NONE_MATCH=search["ETag"]
+            ).status_code,
+            304,
+        )
+
+    def test_profile_and_per_visitor_etags(self):
+        url = reverse("recipes:profile", args=["alice"])
+        resp = self.client.get(url)
+        self.assertEqual(self.revalidate(url, resp), 304)
+        self.author.username = "alicia"
+        self.author.save()
+        url = reverse("recipes:profile", args=["alicia"])
+        resp = self.client.get(url)
+        self.assertEqual(self.revalidate(url, resp), 304)
+
+        # Logging in changes the page (header, Edit links), so the ETag too.
+        self.client.login(username="alicia", password="pass1234")
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+        self.assertNotIn(
+            "ETag", self.client.get(reverse("recipes:profile", args=["nobody"]))
+        )
+
+    def test_pending_message_disables_304(self):
+        url = reverse("recipes:recipe_list")
+        resp = self.client.get(url)
+        self.client.cookies["messages"] = "pending"
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+
+    @override_settings(
+        MESSAGE_STORAGE="django.contrib.messages.storage.session.SessionStorage"
+    )
+    def test_message_in_the_session_disables_304(self):
+        self.client.login(username="alice", password="pass1234")
+        url = reverse("recipes:recipe_detail", args=[self.recipes[0].pk])
+        self.client.get(url)  # sets the CSRF cookie, which is in the ETag
+        resp = self.client.get(url)
+        self.assertEqual(self.revalidate(url, resp, queries=None), 304)
+        self.client.post(reverse("recipes:recipe_delete", args=[self.recipes[2].pk]))
+        flashed = self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(flashed.status_code, 200)
+        self.assertContains(flashed, "Recipe deleted.")
+        self.assertNotIn("ETag", flashed)
+        self.assertEqual(self.revalidate(url, resp, queries=None), 304)
+
+    def test_etag_follows_the_pager_links(self):
+        for i in range(10):
+            Recipe.objects.create(
+                title=f"Roll {i}", author=self.author, cooking_time=5, instructions="x"
+            )
+        url = reverse("recipes:profile", args=["alice"])
+        resp = self.client.get(url)
+        self.assertTrue(resp.context["recipes"].has_next())
+        self.assertEqual(self.revalidate(url, resp), 304)
+        # The oldest recipe is on the second page: the first keeps its rows
+        # but loses its "next" link.
+        self.recipes[0].delete()
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+
+    def test_batch_update_bumps_updated_at(self):
+        recipe = self.recipes[0]
+        url = reverse("recipes:recipe_detail", args=[recipe.pk])
+        resp = self.client.get(url)
+        self.client.login(username="alice", password="pass1234")
+        self.client.post(
+            reverse("recipes:api_recipe_batch") + "?update=1",
+            json.dumps([{"title": recipe.title, "instructions": "changed"}]),
+            content_type="application/json",
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.instructions, "changed")
+        self.client.logout()
+        self.assertEqual(self.revalidate(url, resp, queries=None), 200)
+
+
+class SummaryColumnsTests(TestCase):
+    """author_name, category_name, tag_names and ingredient_count stay current."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.category = Category.objects.create(name="Dinner")
+        cls.tags = [Tag.objects.create(name=name) for name in ("vegan", "quick")]
+        cls.flour = Ingredient.objects.create(name="Flour")
+
+    def summary(self, recipe):
+        return Recipe.objects.values(
+            "author_name", "category_name", "tag_names", "ingredient_count"
+        ).get(pk=recipe.pk)
+
+    def test_model_writes_keep_the_summary(self):
+        recipe = Recipe.objects.create(
+            title="Stew",
+            author=self.author,
+            category=self.category,
+            cooking_time=5,
+            instructions="x",
+        )
+        recipe.tags.set(self.tags)
+        line = RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.flour, quantity=1, unit="g"
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.flour, quantity=2, unit="g"
+        )
+        self.assertEqual(
+            self.summary(recipe),
+            {
+                "author_name": "alice",
+                "category_name": "Dinner",
+                "tag_names": ["quick", "vegan"],
+                "ingredient_count": 2,
+            },
+        )
+
+        line.quantity = 3
+        line.save()
+        line.delete()
+        self.tags[0].name = "plant-based"
+        self.tags[0].save()
+        self.tags[1].delete()
+        self.category.name = "Supper"
+        self.category.save()
+        self.author.username = "alicia"
+        self.author.save()
+        self.assertEqual(
+            self.summary(recipe),
+            {
+                "author_name": "alicia",
+                "category_name": "Supper",
+                "tag_names": ["plant-based"],
+                "ingredient_count": 1,
+            },
+        )
+        self.category.delete()
+        recipe.tags.clear()
+        self.assertEqual(self.summary(recipe)["category_name"], "")
+        self.assertEqual(self.summary(recipe)["tag_names"], [])
+
+    def test_form_and_import_writes_keep_the_summary(self):
+        self.client.force_login(self.author)
+        item = {
+            "id": "s-1",
+            "title": "Imported",
+            "instructions": "Mix.",
+            "cooking_time": 10,
+            "category": "Snack",
+            "tags": ["b", "a", "b"],
+            "ingredients": [
+                {"ingredient": "Flour", "quantity": "100", "unit": "g"},
+                {"ingredient": "Salt", "quantity": 1, "unit": "tsp"},
+            ],
+        }
+        url = reverse("recipes:api_recipe_batch")
+        self.client.post(url, json.dumps([item]), content_type="application/json")
+        recipe = Recipe.objects.get(title="Imported")
+        self.assertEqual(
+            self.summary(recipe),
+            {
+                "author_name": "alice",
+                "category_name": "Snack",
+                "tag_names": ["a", "b"],
+                "ingredient_count": 2,
+            },
+        )
+        # An update drops a line (deleting it) and adds another.
+        item.update(
+            category=None,
+            ingredients=[
+                {"ingredient": "Flour", "quantity": "100", "unit": "g"},
+                {"ingredient": "Sugar", "quantity": 1, "unit": "g"},
+                {"ingredient": "Egg", "quantity": 1, "unit": "unit"},
+            ],
+        )
+        self.client.post(
+            url + "?update=1", json.dumps([item]), content_type="application/json"
+        )
+        summary = self.summary(recipe)
+        self.assertEqual(summary["ingredient_count"], 3)
+        self.assertEqual(summary["category_name"], "")
+
+        update = reverse("recipes:recipe_update", args=[recipe.pk])
+        data = {
+            "title": "Edited",
+            "story": "s",
+            "instructions": "Mix.",
+            "cooking_time": 10,
+            "cooking_time_unit": "min",
+            "category": self.category.pk,
+            "tags": [self.tags[1].pk],
+            "recipe_ingredients-TOTAL_FORMS": "1",
+            "recipe_ingredients-INITIAL_FORMS": "0",
+            "recipe_ingredients-0-ingredient": self.flour.pk,
+            "recipe_ingredients-0-quantity": "1",
+            "recipe_ingredients-0-unit": "g",
+        }
+        self.assertEqual(self.client.post(update, data).status_code, 302)
+        self.assertEqual(
+            self.summary(recipe),
+            {
+                "author_name": "alice",
+                "category_name": "Dinner",
+                "tag_names": ["quick"],
+                "ingredient_count": 4,
+            },
+        )
+
+    def test_failed_form_save_changes_nothing(self):
+        self.client.force_login(self.author)
+        recipe = Recipe.objects.create(
+            title="Stew",
+            author=self.author,
+            category=self.category,
+            cooking_time=5,
+            instructions="x",
+        )
+        recipe.tags.set(self.tags[:1])
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.flour, quantity=1, unit="g"
+        )
+        before = self.summary(recipe)
+        data = {
+            "title": "Edited",
+            "story": "s",
+            "instructions": "x",
+            "cooking_time": 5,
+            "cooking_time_unit": "min",
+            "category": Category.objects.create(name="Lunch").pk,
+            "tags": [self.tags[1].pk],
+            "recipe_ingredients-TOTAL_FORMS": "1",
+            "recipe_ingredients-INITIAL_FORMS": "0",
+            "recipe_ingredients-0-ingredient": self.flour.pk,
+            "recipe_ingredients-0-quantity": "2",
+            "recipe_ingredients-0-unit": "g",
+        }
+        # The new lines are the last write.
+        failing = mock.patch.object(
+            QuerySet, "bulk_create", side_effect=DatabaseError("disk full")
+        )
+        for url in (
+            reverse("recipes:recipe_update", args=[recipe.pk]),
+            reverse("recipes:recipe_create"),
+        ):
+            with failing, self.assertRaises(DatabaseError):
+                self.client.post(url, data)
+        self.assertEqual(self.summary(recipe), before)
+        self.assertEqual(list(Recipe.objects.values_list("title", flat=True)), ["Stew"])
+        self.assertEqual(list(recipe.tags.all()), self.tags[:1])
+        self.assertEqual(recipe.recipe_ingredients.count(), 1)
+
+    def test_admin_writes_keep_the_summary(self):
+        admin = User.objects.create_superuser("root", "root@example.com", "pass1234")
+        self.client.force_login(admin)
+        data = {
+            "title": "Admin stew",
+            "author": self.author.pk,
+            "category": self.category.pk,
+            "story": "s",
+            "description": "",
+            "instructions": "x",
+            "cooking_time": 5,
+            "cooking_time_unit": "min",
+            "tags": [tag.pk for tag in self.tags],
+            "recipe_ingredients-TOTAL_FORMS": "2",
+            "recipe_ingredients-INITIAL_FORMS": "0",
+            "recipe_ingredients-0-ingredient": self.flour.pk,
+            "recipe_ingredients-0-quantity": "1",
+            "recipe_ingredients-0-unit": "g",
+            "recipe_ingredients-1-ingredient": self.flour.pk,
+            "recipe_ingredients-1-quantity": "2",
+            "recipe_ingredients-1-unit": "g",
+        }
+        resp = self.client.post(reverse("admin:recipes_recipe_add"), data)
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(
+            self.summary(Recipe.objects.get(title="Admin stew")),
+            {
+                "author_name": "alice",
+                "category_name": "Dinner",
+                "tag_names": ["quick", "vegan"],
+                "ingredient_count": 2,
+            },
+        )
+
+    def test_cards_render_from_the_recipe_table(self):
+        recipe = Recipe.objects.create(
+            title="Stew",
+            author=self.author,
+            category=self.category,
+            cooking_time=5,
+            instructions="x",
+        )
+        recipe.tags.set(self.tags)
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("recipes:recipe_list"))
+        # The time and facet counts, the page's rows, then the missing
+        # cards: no joins, no tag query.
+        self.assertEqual(len(ctx), 4)
+        self.assertNotIn("JOIN", ctx.captured_queries[-1]["sql"])
+        self.assertContains(resp, "Dinner")
+        self.assertContains(resp, '<span class="tag">quick</span>')
+        self.assertContains(resp, reverse("recipes:profile", args=["alice"]))
+
+    def test_backfill_command(self):
+        recipe = Recipe.objects.create(
+            title="Stew",
+            author=self.author,
+            category=self.category,
+            cooking_time=5,
+            instructions="x",
+        )
+        recipe.tags.set(self.tags)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.flour, quantity=1, unit="g"
+        )
+        expected = self.summary(recipe)
+        # As after the migration, before the backfill.
+        Recipe.objects.update(
+            author_name="", category_name="", tag_names=[], ingredient_count=0
+        )
+        out = StringIO()
+        call_command("backfill_summaries", "--batch-size=1", stdout=out)
+        self.assertEqual(self.summary(recipe), expected)
+        self.assertIn("1 recipes", out.getvalue())
+
+
+class CookingTimeTests(TestCase):
+    """cooking_minutes stays in sync and drives the list's time filter."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        # Three recipes each of 5, 10, ..., 50 minutes; even ones are soups.
+        for i in range(30):
+            Recipe.objects.create(
+                title=f"Soup {i}" if i % 2 == 0 else f"Salad {i}",
+                author=cls.author,
+                cooking_time=5 * (i % 10 + 1),
+                instructions="x",
+            )
+        Recipe.objects.create(
+            title="Soup roast",
+            author=cls.author,
+            cooking_time=1,
+            cooking_time_unit="hr",
+            instructions="x",
+        )
+
+    def setUp(self):
+        cache.clear()
+        searchcache.results.reset()
+
+    def minutes(self, title):
+        return Recipe.objects.values_list("cooking_minutes", flat=True).get(title=title)
+
+    def walk(self, **params):
+        url, ids = reverse("recipes:recipe_list"), []
+        while True:
+            page = self.client.get(url, params).context["recipes"]
+            ids += [r.pk for r in page]
+            if not page.has_next():
+                return ids
+            params["after"] = page.next_cursor
+
+    def test_writes_keep_the_minutes(self):
+        self.assertEqual(self.minutes("Soup roast"), 60)
+        recipe = Recipe.objects.get(title="Soup roast")
+        recipe.cooking_time = 2
+        recipe.save()
+        self.assertEqual(self.minutes("Soup roast"), 120)
+        stale = Recipe.objects.filter(pk=recipe.pk)
+        stale.update(cooking_time_unit="min")
+        stale.update(cooking_minutes=cookingtime.minutes_expression())
+        self.assertEqual(self.minutes("Soup roast"), 2)
+
+        self.client.force_login(self.author)
+        item = {
+            "id": "t-1",
+            "title": "Imported",
+            "instructions": "Mix.",
+            "cooking_time": 3,
+            "cooking_time_unit": "hr",
+            "ingredients": [{"ingredient": "Flour", "quantity": "1", "unit": "g"}],
+        }
+        url = reverse("recipes:api_recipe_batch")
+        self.client.post(url, json.dumps([item]), content_type="application/json")
+        self.assertEqual(self.minutes("Imported"), 180)
+        item.update(cooking_time=40, cooking_time_unit="min")
+        self.client.post(
+            url + "?update=1", json.dumps([item]), content_type="application/json"
+        )
+        self.assertEqual(self.minutes("Imported"), 40)
+
+    def test_filter_and_sort_combine_with_search_and_pagination(self):
+        recipes = Recipe.objects.order_by("cooking_minutes", "id")
+        quick = recipes.filter(cooking_minutes__lte=45)
+        expected = list(quick.values_list("pk", flat=True))
+        self.assertEqual(self.walk(max_minutes=45, sort="time"), expected)
+        everything = list(recipes.values_list("pk", flat=True))
+        self.assertEqual(self.walk(sort="time"), everything)
+
+        soups = list(
+            quick.filter(title__startswith="Soup").values_list("pk", flat=True)
+        )
+        self.assertEqual(len(soups), 15)
+        self.assertEqual(self.walk(q="soup", max_minutes=45, sort="time"), soups)
+        # Again, from the cached ranking.
+        self.assertEqual(self.walk(q="soup", max_minutes=45, sort="time"), soups)
+        self.assertEqual(sorted(self.walk(q="soup", max_minutes=45)), sorted(soups))
+        self.assertEqual(len(self.walk(q="soup")), 16)
+
+        newest = list(Recipe.objects.order_by("-id").values_list("pk", flat=True))
+        self.assertEqual(self.walk(max_minutes="soon", sort="fastest"), newest)
+
+    def test_bucket_counts_are_cached_until_a_write(self):
+        url = reverse("recipes:recipe_list")
+        resp = self.client.get(url)
+        self.assertEqual(
+            resp.context["buckets"],
+            [(None, 31), (15, 9), (30, 18), (60, 31), (120, 31)],
+        )
+        self.assertContains(resp, "Up to 30 min (18)")
+        self.assertContains(resp, "?max_minutes=30")
+        resp = self.client.get(url, {"q": "soup", "max_minutes": 15})
+        self.assertEqual(resp.context["buckets"][:2], [(None, 16), (15, 6)])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertNotIn("COUNT(", " ".join(q["sql"] for q in ctx.captured_queries))
+
+        Recipe.objects.create(
+            title="Roast",
+            author=self.author,
+            cooking_time=2,
+            cooking_time_unit="hr",
+            instructions="x",
+        )
+        self.assertEqual(
+            self.client.get(url).context["buckets"][-2:], [(60, 31), (120, 32)]
+        )
+
+    def test_time_filter_reads_the_index(self):
+        with queryplan.PlanCapture() as capture:
+            self.client.get(
+                reverse("recipes:recipe_list"), {"max_minutes": 30, "sort": "time"}
+            )
+        # The page's rows: an index range, already in order.
+        sql, params = next(s for s in capture.selects if "LIMIT" in s[0])
+        plan = " ".join(capture.explain(sql, params))
+        self.assertIn("recipes_rec_cooking_9e25f0_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class FacetTests(TestCase):
+    """Category and tag filters with counts from one grouped query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        dinner = Category.objects.create(name="Dinner")
+        lunch = Category.objects.create(name="Lunch")
+        vegan, quick, spicy = (
+            Tag.objects.create(name=name) for name in ("vegan", "quick", "spicy")
+        )
+        cls.recipes = {}
+        for title, category, tags in [
+            ("Bean stew", dinner, [vegan, quick]),
+            ("Lentil stew", dinner, [vegan]),
+            ("Omelette", lunch, [quick]),
+            ("Sandwich", lunch, []),
+            ("Chili", None, [spicy]),
+        ]:
+            recipe = Recipe.objects.create(
+                title=title,
+                author=cls.author,
+                category=category,
+                cooking_time=10,
+                instructions="x",
+            )
+            recipe.tags.set(tags)
+            cls.recipes[title] = recipe.pk
+
+    def setUp(self):
+        cache.clear()
+        searchcache.results.reset()
+
+    def get(self, **params):
+        resp = self.client.get(reverse("recipes:recipe_list"), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp
+
+    def titles(self, **params):
+        ids = {r.pk for r in self.get(**params).context["recipes"]}
+        return sorted(title for title, pk in self.recipes.items() if pk in ids)
+
+    def counts(self, resp):
+        return {
+            facet: {name: n for name, n, _, _ in values}
+            for facet, values in resp.context["facets"].items()
+        }
+
+    def test_counts_come_from_one_query_then_the_cache(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.get()
+        grouped = [q["sql"] for q in ctx.captured_queries if '"facet"' in q["sql"]]
+        self.assertEqual(len(grouped), 1)
+        self.assertIn("UNION ALL", grouped[0])
+        self.assertEqual(
+            self.counts(resp),
+            {
+                "category": {"Dinner": 2, "Lunch": 2},
+                "tag": {"quick": 2, "vegan": 2, "spicy": 1},
+            },
+        )
+        self.assertContains(resp, 'href="?category=Dinner"')
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.get()
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn('"facet"', sql)
+
+    def test_filters_select_any_within_a_facet_and_all_across(self):
+        self.assertEqual(self.titles(category="Dinner"), ["Bean stew", "Lentil stew"])
+        self.assertEqual(
+            self.titles(category=["Dinner", "Lunch"]),
+            ["Bean stew", "Lentil stew", "Omelette", "Sandwich"],
+        )
+        self.assertEqual(
+            self.titles(tag=["vegan", "quick"]),
+            ["Bean stew", "Lentil stew", "Omelette"],
+        )
+        self.assertEqual(self.titles(category="Lunch", tag="quick"), ["Omelette"])
+        self.assertEqual(self.titles(q="stew", tag="quick"), ["Bean stew"])
+        self.assertEqual(self.titles(category="Brunch"), [])
+        self.assertEqual(self.titles(tag=[" spicy ", ""]), ["Chili"])
+
+    def test_each_facet_counts_what_the_others_leave(self):
+        resp = self.get(category="Dinner")
+        self.assertEqual(
+            self.counts(resp),
+            {"category": {"Dinner": 2, "Lunch": 2}, "tag": {"vegan": 2, "quick": 1}},
+        )
+        # Toggling: add Lunch, or drop Dinner.
+        self.assertContains(resp, 'href="?category=Dinner&amp;category=Lunch"')
+        self.assertContains(resp, 'href="?" aria-current="true">Dinner (2)')
+
+        resp = self.get(q="stew", tag="spicy")
+        self.assertEqual(
+            self.counts(resp),
+            {"category": {}, "tag": {"vegan": 2, "quick": 1, "spicy": 0}},
+        )
+
+    def test_writes_invalidate_the_counts(self):
+        self.get()
+        Tag.objects.filter(name="spicy").get().recipe_set.clear()
+        self.assertNotIn("spicy", self.counts(self.get())["tag"])
+        Category.objects.get(name="Lunch").delete()
+        self.assertEqual(self.counts(self.get())["category"], {"Dinner": 2})
+        tag = Tag.objects.get(name="quick")
+        tag.name = "fast"
+        tag.save()
+        self.assertEqual(self.counts(self.get())["tag"], {"fast": 2, "vegan": 2})
+
+
+class RecipeCardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+        cls.category = Category.objects.create(name="Dinner")
+        cls.recipes = [
+            Recipe.objects.create(
+                title=f"Stew {i}",
+                author=cls.author,
+                category=cls.category,
+                cooking_time=5,
+                instructions="x",
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_list_page_is_one_query(self):
+        url = reverse("recipes:recipe_list")
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+        self.assertContains(resp, "Stew 2")
+        self.assertContains(resp, "by <a")
+        self.assertContains(resp, "Dinner")
+
+    def test_only_changed_cards_are_rendered_again(self):
+        url = reverse("recipes:recipe_list")
+        self.client.get(url)
+        stew = self.recipes[0]
+        stew.title = "Goulash"
+        stew.save()
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertContains(resp, "Goulash")
+        self.assertNotContains(resp, "Stew 0")
+        self.assertIn(f"IN ({stew.pk})", ctx.captured_queries[-1]["sql"])
+
+        stew.tags.add(Tag.objects.create(name="spicy"))
+        self.assertContains(self.client.get(url), "spicy")
+        self.category.name = "Supper"
+        self.category.save()
+        self.assertContains(self.client.get(url), "Supper")
+
+    def test_profile_cards_are_their_own_variant(self):
+        self.client.get(reverse("recipes:recipe_list"))
+        resp = self.client.get(reverse("recipes:profile", args=["alice"]))
+        self.assertContains(resp, "Stew 1")
+        self.assertNotContains(resp, "by <a")
+        self.client.login(username="alice", password="pass1234")
+        resp = self.client.get(reverse("recipes:profile", args=["alice"]))
+        self.assertContains(resp, ">Delete</a>", count=3)
+
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        media = self.settings(MEDIA_ROOT=tmpdir.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media_root = Path(tmpdir.name)
+
+    def upload(self, size=(800, 600), name="pie.jpg", fmt="JPEG", color="orange"):
+        buf = BytesIO()
+        Image.new("RGB", size, color).save(buf, fmt)
+        return SimpleUploadedFile(name, buf.getvalue())
+
+    def copy_path(self, recipe, width, fmt="jpeg"):
+        name = thumbnails.derivative_name(recipe.image.name, width, fmt)
+        return self.media_root / name
+
+    def create(self, run_jobs=True, **kwargs):
+        recipe = Recipe.objects.create(
+            title="Pie", cooking_time=5, author=self.author, **kwargs
+        )
+        if run_jobs:
+            jobs.run_pending()
+            recipe.refresh_from_db()
+        return recipe
+
+    def test_upload_generates_derivatives(self):
+        recipe = self.create(image=self.upload())
+        self.assertEqual(recipe.image_widths, [160, 320, 640])
+        self.assertTrue(self.copy_path(recipe, 160).exists())
+        self.assertTrue(self.copy_path(recipe, 640, "webp").exists())
+        with Image.open(self.copy_path(recipe, 320, "webp")) as img:
+            self.assertEqual(img.size, (320, 240))
+
+        resp = self.client.get(reverse("recipes:recipe_list"))
+        self.assertContains(resp, 'loading="lazy"')
+        self.assertContains(resp, 'sizes="160px"')
+        webp = thumbnails.derivative_name(recipe.image.name, 160, "webp")
+        self.assertContains(resp, f"/media/{webp} 160w")
+        self.assertNotContains(resp, f'src="{recipe.image.url}"')
+
+    def test_small_or_broken_images_fall_back_to_original(self):
+        small = self.create(image=self.upload(size=(100, 80), name="s.png", fmt="PNG"))
+        self.assertEqual(small.image_widths, [])
+        broken = self.create(image=SimpleUploadedFile("b.jpg", b"not an image"))
+        self.assertEqual(broken.image_widths, [])
+        job = broken.image_jobs.get()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 1))
+        self.assertIn("cannot identify image", job.last_error)
+        resp = self.client.get(reverse("recipes:recipe_list"))
+        self.assertContains(resp, f'src="{small.image.url}"')
+        self.assertContains(resp, f'src="{broken.image.url}"')
+
+    def test_upload_is_processed_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = self.create(run_jobs=False, image=self.upload())
+        self.assertEqual(len(callbacks), 1)
+        job = recipe.image_jobs.get()
+        self.assertEqual(job.status, ImageJob.PENDING)
+        # Until the job has run, pages serve the original.
+        resp = self.client.get(reverse("recipes:recipe_list"))
+        self.assertContains(resp, f'src="{recipe.image.url}"')
+
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.DONE)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_widths, [160, 320, 640])
+
+    def test_failed_jobs_are_retried_then_given_up(self):
+        recipe = self.create(run_jobs=False, image=self.upload())
+        job = recipe.image_jobs.get()
+        with mock.patch.object(
+            thumbnails, "generate_derivatives", side_effect=OSError("disk full")
+        ), self.assertLogs("recipes.jobs", "WARNING"):
+            for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+                self.assertEqual(jobs.run_pending(), 1)
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+                self.assertIn("disk full", job.last_error)
+                if attempt < jobs.MAX_ATTEMPTS:
+                    self.assertEqual(job.status, ImageJob.PENDING)
+                    # Not due again before the backoff has passed.
+                    self.assertGreater(job.run_after, timezone.now())
+                    self.assertEqual(jobs.run_pending(), 0)
+                    ImageJob.objects.update(run_after=timezone.now())
+        self.assertEqual(job.status, ImageJob.FAILED)
+        self.assertEqual(Recipe.objects.get().image_widths, [])
+
+    def test_stale_job_for_replaced_image_is_skipped(self):
+        recipe = self.create(run_jobs=False, image=self.upload())
+        stale = recipe.image_jobs.get()
+        ImageJob.objects.update(status=ImageJob.RUNNING)
+        old = Recipe(image=recipe.image.name)
+        recipe.image = self.upload(name="tart.jpg", color="red")
+        recipe.save()
+        ImageJob.objects.filter(pk=stale.pk).update(status=ImageJob.PENDING)
+        self.assertEqual(jobs.run_pending(), 2)
+        stale.refresh_from_db()
+        self.assertEqual(stale.last_error, "superseded by a newer image")
+        self.assertFalse(self.copy_path(old, 160).exists())
+        self.assertTrue(self.copy_path(recipe, 160).exists())
+
+    def test_job_deleted_once_claimed_is_passed_over(self):
+        gone = self.create(run_jobs=False, image=self.upload())
+        kept = self.create(run_jobs=False, image=self.upload(name="tart.jpg"))
+        update = QuerySet.update
+
+        def claim_then_delete(queryset, **kwargs):
+            count = update(queryset, **kwargs)
+            if queryset.model is ImageJob and kwargs.get("status") == ImageJob.RUNNING:
+                Recipe.objects.filter(pk=gone.pk).delete()
+            return count
+
+        with mock.patch.object(QuerySet, "update", claim_then_delete):
+            job = jobs.claim_next()
+        self.assertEqual(job.recipe, kept)
+        self.assertEqual(job.status, ImageJob.RUNNING)
+
+    def test_admin_shows_job_status(self):
+        User.objects.create_superuser("admin", password="pass1234")
+        self.client.login(username="admin", password="pass1234")
+        recipe = self.create(run_jobs=False, image=self.upload())
+        url = reverse("admin:recipes_recipe_change", args=[recipe.pk])
+        self.assertContains(self.client.get(url), "Pending (attempts: 0)")
+        jobs.run_pending()
+        self.assertContains(self.client.get(url), "Done (attempts: 1)")
+
+    def test_clearing_image_clears_widths(self):
+        recipe = self.create(image=self.upload())
+        recipe.image = None
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_widths, [])
+
+    def test_backfill_command(self):
+        recipe = self.create(image=self.upload(name="old.png", fmt="PNG"))
+        Recipe.objects.update(image_widths=[])
+        for width in thumbnails.THUMBNAIL_WIDTHS:
+            self.copy_path(recipe, width, "png").unlink()
+            self.copy_path(recipe, width, "webp").unlink()
+        out = StringIO()
+        call_command("generate_thumbnails", stdout=out)
+        self.assertIn("Generated thumbnails for 1 images", out.getvalue())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_widths, [160, 320, 640])
+        self.assertTrue(self.copy_path(recipe, 640, "png").exists())
+
+
+class ImageStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="alice", password="pass1234")
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        media = self.settings(MEDIA_ROOT=tmpdir.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media_root = Path(tmpdir.name)
+
+    def upload(self, color="orange", name="pie.jpg"):
+        buf = BytesIO()
+        Image.new("RGB", (400, 300), color).save(buf, "JPEG")
+        return SimpleUploadedFile(name, buf.getvalue())
+
+    def create(self, image):
+        recipe = Recipe.objects.create(
+            title="Pie", cooking_time=5, author=self.author, image=image
+        )
+        jobs.run_pending()
+        recipe.refresh_from_db()
+        return recipe
+
+    def refs(self, recipe):
+        return StoredImage.objects.get(name=recipe.image.name).refs
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command("collect_orphaned_images", "--min-age=0", *args, stdout=out)
+        return out.getvalue()
+
+    def test_identical_uploads_share_one_sharded_file(self):
+        first = self.create(self.upload())
+        second = self.create(self.upload(name="same-pie.JPG"))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^recipes/(..)/(..)/\1\2[0-9a-f]{60}\.jpg$")
+        self.assertEqual(len(list(self.media_root.rglob("*.jpg"))), 1 + 2)
+        self.assertEqual(self.refs(first), 2)
+        # The second recipe reused the copies instead of queueing a job.
+        self.assertEqual(second.image_widths, [160, 320])
+        self.assertFalse(second.image_jobs.exists())
+
+    def test_replaced_and_deleted_images_are_collected(self):
+        kept = self.create(self.upload())
+        shared = self.create(self.upload())
+        replaced = self.create(self.upload("red"))
+        old = replaced.image.name
+        replaced.image = self.upload("blue")
+        replaced.save()
+        self.assertEqual(StoredImage.objects.get(name=old).refs, 0)
+
+        shared.delete()
+        self.assertEqual(self.refs(kept), 1)
+        self.assertIn(
+            "Would delete 1 unused images (5 files)", self.collect("--dry-run")
+        )
+        self.assertTrue((self.media_root / old).exists())
+
+        self.assertIn("Deleted 1 unused images (5 files)", self.collect())
+        self.assertFalse((self.media_root / old).exists())
+        self.assertFalse(StoredImage.objects.filter(name=old).exists())
+        for recipe in (kept, replaced):
+            self.assertTrue((self.media_root / recipe.image.name).exists())
+        self.assertIn("Deleted 0 unused images", self.collect())
+
+    def test_collect_skips_recent_and_still_referenced_images(self):
+        recipe = self.create(self.upload())
+        # A write that bypassed the signals left a wrong count behind.
+        StoredImage.objects.update(refs=0)
+        self.assertIn(
+            "Deleted 0 unused images (0 files); 1 still in use", self.collect()
+        )
+        self.assertEqual(self.refs(recipe), 1)
+
+        Recipe.objects.update(image="")
+        StoredImage.objects.update(refs=0, updated_at=timezone.now())
+        out = StringIO()
+        call_command("collect_orphaned_images", stdout=out)
+        self.assertIn("Deleted 0 unused images", out.getvalue())
+        self.assertTrue(StoredImage.objects.exists())
+
+
+class JSONStreamTests(SimpleTestCase):
+    RECIPES = [
+        {"title": "A", "cooking_time": 12, "tags": ["x", "y"]},
+        {"title": "B ✓", "story": "line\nbreak", "cooking_time": 3.5e1},
+        {"title": "C", "ingredients": [{"ingredient": "Egg", "quantity": 2}]},
+    ]
+
+    def read(self, text, fmt="auto"):
+        # Tiny chunks so values straddle buffer refills.
+        return list(jsonstream.iter_recipe_items(StringIO(text), fmt, chunk_size=3))
+
+    def test_top_level_array(self):
+        self.assertEqual(self.read(json.dumps(self.RECIPES, indent=2)), self.RECIPES)
+
+    def test_wrapper_objects(self):
+        for key in ("recipes", "receptek"):
+            text = json.dumps({"source": {"site": "x"}, key: self.RECIPES, "n": 3})
+            self.assertEqual(self.read(text), self.RECIPES)
+
+    def test_ndjson(self):
+        text = "\n".join(json.dumps(r) for r in self.RECIPES) + "\n"
+        self.assertEqual(self.read(text), self.RECIPES)
+        self.assertEqual(self.read(text, fmt="ndjson"), self.RECIPES)
+
+    def test_items_are_yielded_lazily(self):
+        text = json.dumps(self.RECIPES)[:-1] + ", {broken"
+        items = jsonstream.iter_recipe_items(StringIO(text))
+        self.assertEqual(next(items), self.RECIPES[0])
+        with self.assertRaises(json.JSONDecodeError):
+            list(items)
+
+    def test_single_recipe_object(self):
+        # A one-line NDJSON file, perhaps named .json.
+        text = json.dumps(self.RECIPES[0]) + "\n"
+        self.assertEqual(self.read(text), self.RECIPES[:1])
+        self.assertEqual(self.read(text, fmt="ndjson"), self.RECIPES[:1])
+        with self.assertRaises(jsonstream.UnsupportedStructure):
+            self.read(text, fmt="json")
+
+    def test_unsupported_structures(self):
+        for text in ("{}", '{"recipes": "none", "n": 0}', "42", '"x"'):
+            with self.assertRaises(jsonstream.UnsupportedStructure):
+                self.read(text)
+        with self.assertRaises(json.JSONDecodeError):
+            self.read("[1] [2]")
+        with self.assertRaises(json.JSONDecodeError):
+            self.read("")
@@ -0,0 +1,132 @@
+"""
+Resized copies ("derivatives") of Recipe.image for responsive <img> tags.
+
+Every width in THUMBNAIL_WIDTHS narrower than the original gets a copy in
+the fallback format (PNG for PNG/GIF uploads, JPEG otherwise) and a WebP
+copy, stored next to the original under a name derived from it:
+
+    recipes/pie.jpg -> recipes/pie.320w.jpg, recipes/pie.320w.webp
+
+``Recipe.image_widths`` records which widths were written, so templates
+build srcset attributes without touching the storage.
+"""
+
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# 160px is the card thumbnail, 320px its 2x, 640px the detail page at 2x.
+THUMBNAIL_WIDTHS = (160, 320, 640)
+
+EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp"}
+SAVE_OPTIONS = {
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+    "png": {"optimize": True},
+    "webp": {"quality": 80, "method": 4},
+}
+
+
+def fallback_format(name):
+    """Format of the non-WebP derivatives for an original file name."""
+    ext = os.path.splitext(name)[1].lower()
+    return "png" if ext in (".png", ".gif") else "jpeg"
+
+
+def derivative_name(name, width, fmt):
+    base, _ = os.path.splitext(name)
+    return f"{base}.{width}w.{EXTENSIONS[fmt]}"
+
+
+def derivative_names(name, widths):
+    """Every file generate_derivatives() writes for these widths."""
+    fmt = fallback_format(name)
+    return [derivative_name(name, w, f) for w in widths for f in (fmt, "webp")]
+
+
+def _encode(img, fmt):
+    if fmt == "jpeg" and img.mode != "RGB":
+        img = img.convert("RGB")
+    buf = BytesIO()
+    img.save(buf, fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buf.getvalue()
+
+
+def generate_derivatives(field_file):
+    """
+    Write the derivatives of an image field's file, replacing old copies.
+    Returns the widths written; none if the original is already small.
+    """
+    storage, name = field_file.storage, field_file.name
+    with storage.open(name, "rb") as f:
+        img = Image.open(f)
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    if img.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    fmt = fallback_format(name)
+    widths = [w for w in THUMBNAIL_WIDTHS if w < img.width]
+    for width in widths:
+        height = max(1, round(img.height * width / img.width))
+        resized = img.resize((width, height), Image.LANCZOS)
+        for out_fmt in (fmt, "webp"):
+            target = derivative_name(name, width, out_fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            saved = storage.save(target, ContentFile(_encode(resized, out_fmt)))
+            if saved != target:
+                raise OSError(f"storage renamed {target} to {saved}")
+    return widths
+
+
+def reuse_derivatives(recipe, using="default"):
+    """
+    Copy image_widths from another recipe with the same (deduplicated)
+    image file, whose derivatives are already in storage. Returns them,
+    or [] when the image is new and still needs its copies made.
+    """
+    widths = (
+        Recipe.objects.using(using)
+        .filter(image=recipe.image.name)
+        .exclude(pk=recipe.pk)
+        .exclude(image_widths=[])
+        .values_list("image_widths", flat=True)
+        .first()
+    )
+    if not widths:
+        return []
+    Recipe.objects.using(using).filter(pk=recipe.pk).update(
+        image_widths=widths, updated_at=timezone.now()
+    )
+    recipe.image_widths = widths
+    return widths
+
+
+def refresh_recipe_image(recipe, using="default"):
+    """
+    (Re)generate a recipe's derivatives and record them. A file Pillow
+    can't read leaves no widths, so templates fall back to the original.
+    """
+    widths = []
+    if recipe.image:
+        try:
+            widths = generate_derivatives(recipe.image)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            logger.warning(
+                "Could not make thumbnails for %s", recipe.image.name, exc_info=True
+            )
+    # update() rather than save(): no signals, no second round of this.
+    Recipe.objects.using(using).filter(pk=recipe.pk).update(
+        image_widths=widths, updated_at=timezone.now()
+    )
+    recipe.image_widths = widths
+    return widths
@@ -29,4 +29,18 @@ urlpatterns = [
     # Profile
     path("profile/<str:username>/", views.profile, name="profile"),
     path("recipe/<int:pk>/delete/", views.recipe_delete, name="recipe_delete"),
+    # Autocomplete
+    path(
+        "autocomplete/ingredients/",
+        views.ingredient_autocomplete,
+        name="ingredient_autocomplete",
+    ),
+    path("autocomplete/tags/", views.tag_autocomplete, name="tag_autocomplete"),
+    # Export
+    path("export/", views.recipe_export, name="recipe_export"),
+    # JSON API
+    path("api/recipes/", views.api_recipe_list, name="api_recipe_list"),
+    path("api/recipes/batch/", views.api_recipe_batch, name="api_recipe_batch"),
+    path("api/recipes/<int:pk>/", views.api_recipe_detail, name="api_recipe_detail"),
+    path("api/search-cache/", views.api_search_cache_stats, name="api_search_cache"),
 ]
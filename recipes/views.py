@@ -1,55 +1,125 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import json
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.forms import inlineformset_factory
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Prefetch
 
-from .models import Recipe, RecipeIngredient
+from . import api, cards, conditional, cookingtime, facets, searchcache
+from .autocomplete import get_index
+from .exporting import EXPORT_FORMATS, aexport_stream, export_stream
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
+from .pagination import apaginate
+from .querybudget import query_budget
+from .replicas import replica_reads
+from .search import search_recipes
+from .signals import batched_recipe_writes
 from .forms import RecipeForm, RecipeIngredientInlineFormSet
 from .RecipeIngredientForm import RecipeIngredientForm
 
+# Query budgets (querybudget.py) are for cold caches: session, user, choice
+# snapshots and cards all loaded. The formset validates all ingredient lines
+# with one query and saves them in bulk, and the search index, tag names
+# and ingredient count are written once at the end (batched_recipe_writes),
+# so a form POST costs the same with 1 or 100 lines: 23 queries (BEGIN
+# included) for an edit changing the category, the tags and deleting,
+# editing and adding lines, 30 with a new image (its reference count and
+# thumbnail job). Tests run the transaction as a savepoint, two more.
+FORM_BUDGET = 32
+
+
+# The read-only pages are async: every query goes through the async ORM
+# and is finished before rendering, so templates never touch the database.
+# They answer conditional GETs first, see conditional.py; list cards come
+# from a per-recipe cache, see cards.py.
+async def arender(request, template_name, context):
+    # request.user is lazy and would load synchronously from the template
+    # (auth context processor); resolve it with the async API first.
+    request.user = await request.auser()
+    return render(request, template_name, context)
 
-# List (with search + pagination)
-def recipe_list(request):
+
+# List (with search, time and facet filters + pagination)
+@replica_reads
+@query_budget(7)
+async def recipe_list(request):
     q = (request.GET.get("q") or "").strip()
-    qs = (
-        Recipe.objects.select_related("author", "category")
-        .prefetch_related("tags", "recipe_ingredients__ingredient")
-        .order_by("-id")
+    max_minutes = cookingtime.parse_max_minutes(request.GET.get("max_minutes"))
+    sort = cookingtime.parse_sort(request.GET.get("sort"))
+    selected = facets.parse_facets(request.GET)
+    everything = Recipe.objects.all()
+    timed = everything
+    if max_minutes is not None:
+        timed = timed.filter(cooking_minutes__lte=max_minutes)
+    # Each sidebar counts what the other filters leave.
+    buckets = await cookingtime.abucket_counts(
+        facets.narrow(everything, selected), q, selected
     )
+    counts = await facets.afacet_counts(timed, q, selected, max_minutes)
+    qs = cards.card_rows(facets.narrow(timed, selected))
     if q:
-        qs = qs.filter(
-            Q(title__icontains=q)
-            | Q(description__icontains=q)
-            | Q(story__icontains=q)
-            | Q(instructions__icontains=q)
-            | Q(tags__name__icontains=q)
-        ).distinct()
-
-    paginator = Paginator(qs, 12)
-    page_number = request.GET.get("page")
-    recipes = paginator.get_page(page_number)
-    return render(request, "recipes/recipe_list.html", {"recipes": recipes, "q": q})
+        # Full-text index (ranked by relevance unless sorted by time) when
+        # available, with the ranking of popular searches cached per process.
+        ordering = cookingtime.SORTS[sort] if sort != "new" else None
+        variant = (max_minutes, *selected.items())
+        recipes = await searchcache.apaginate_search(
+            request, qs, q, ordering=ordering, variant=variant
+        )
+    else:
+        recipes = await apaginate(request, qs.order_by(*cookingtime.SORTS[sort]))
+    etag = await conditional.apage_etag_for(request, recipes, buckets, counts)
+    if response := conditional.not_modified(request, etag):
+        return response
+    await cards.attach_cards(recipes, "list")
+    context = {
+        "recipes": recipes,
+        "q": q,
+        "buckets": buckets,
+        "max_minutes": max_minutes,
+        "sort": sort,
+        "facets": facets.facet_links(counts, selected),
+    }
+    response = await arender(request, "recipes/recipe_list.html", context)
+    return conditional.set_validators(response, etag)
 
 
 # Detail
-def recipe_detail(request, pk):
-    recipe = get_object_or_404(
+@replica_reads
+@query_budget(6)
+async def recipe_detail(request, pk):
+    etag, last_modified = await conditional.detail_validators(request, pk)
+    if response := conditional.not_modified(request, etag, last_modified):
+        return response
+    lines = RecipeIngredient.objects.select_related("ingredient")
+    recipe = await aget_object_or_404(
         Recipe.objects.select_related("author", "category").prefetch_related(
-            "tags", "recipe_ingredients__ingredient"
+            "tags", Prefetch("recipe_ingredients", queryset=lines)
         ),
         pk=pk,
     )
-    return render(request, "recipes/recipe_detail.html", {"recipe": recipe})
+    response = await arender(request, "recipes/recipe_detail.html", {"recipe": recipe})
+    return conditional.set_validators(response, etag, last_modified)
 
 
 # Create
 @login_required
+@query_budget(FORM_BUDGET, raises=False)
 def recipe_create(request):
     RecipeIngredientFormSet = inlineformset_factory(
         Recipe,
@@ -73,13 +143,15 @@ def recipe_create(request):
         if form.is_valid() and formset.is_valid():
             recipe = form.save(commit=False)
             recipe.author = request.user
-            recipe.save()
-            form.save_m2m()
-            formset.instance = recipe
-            formset.save()
+            # One transaction, so the summary columns never disagree with
+            # the rows they copy.
+            with transaction.atomic(), batched_recipe_writes():
+                recipe.save()
+                form.save_m2m()
+                formset.instance = recipe
+                formset.save()
             messages.success(request, "Recipe created.")
             return redirect("recipes:recipe_list")
-        messages.error(request, "Please fix the errors below.")
     else:
         form = RecipeForm()
         formset = RecipeIngredientFormSet(prefix="recipe_ingredients")
@@ -103,30 +175,31 @@ def register(request):
 
 
 # Profile (with pagination)
-def profile(request, username):
-    profile_user = get_object_or_404(User, username=username)
-    qs = (
-        Recipe.objects.filter(author=profile_user)
-        .select_related("category")
-        .prefetch_related("tags")
-        .order_by("-id")
-    )
-    paginator = Paginator(qs, 12)
-    page_number = request.GET.get("page")
-    recipes = paginator.get_page(page_number)
+@replica_reads
+@query_budget(6)
+async def profile(request, username):
+    qs = Recipe.objects.filter(author__username=username).order_by("-id")
+    recipes = await apaginate(request, cards.card_rows(qs))
+    etag = await conditional.apage_etag_for(request, recipes)
+    if response := conditional.not_modified(request, etag):
+        return response
+    profile_user = await aget_object_or_404(User, username=username)
+    await cards.attach_cards(recipes, "profile")
 
-    return render(
+    response = await arender(
         request,
         "recipes/profile.html",
         {"profile_user": profile_user, "recipes": recipes},
     )
+    return conditional.set_validators(response, etag)
 
 
 # Update
 @login_required
+@query_budget(FORM_BUDGET, raises=False)
 def recipe_update(request, pk):
     recipe = get_object_or_404(Recipe, pk=pk)
-    if recipe.author != request.user:
+    if recipe.author_id != request.user.pk:
         return HttpResponseForbidden("Not allowed")
 
     RecipeIngredientFormSet = inlineformset_factory(
@@ -148,15 +221,15 @@ def recipe_update(request, pk):
         )
         if form.is_valid() and formset.is_valid():
             obj = form.save(commit=False)
-            if not obj.author_id:
-                obj.author = request.user
-            obj.save()
-            form.save_m2m()
-            formset.instance = obj
-            formset.save()
+            # Checked above; also saves looking the author up for author_name.
+            obj.author = request.user
+            with transaction.atomic(), batched_recipe_writes():
+                obj.save()
+                form.save_m2m()
+                formset.instance = obj
+                formset.save()
             messages.success(request, "Recipe updated.")
             return redirect("recipes:recipe_list")
-        messages.error(request, "Please fix the errors below.")
     else:
         form = RecipeForm(instance=recipe)
         formset = RecipeIngredientFormSet(instance=recipe, prefix="recipe_ingredients")
@@ -170,10 +243,123 @@ def recipe_update(request, pk):
 @login_required
 def recipe_delete(request, pk):
     recipe = get_object_or_404(Recipe, pk=pk)
-    if recipe.author != request.user:
+    if recipe.author_id != request.user.pk:
         return HttpResponseForbidden("Not allowed")
     if request.method == "POST":
         recipe.delete()
         messages.success(request, "Recipe deleted.")
         return redirect("recipes:recipe_list")
     return render(request, "recipes/recipe_confirm_delete.html", {"recipe": recipe})
+
+
+# Autocomplete (Select2 JSON format)
+def _autocomplete(request, model):
+    q = (request.GET.get("q") or "").strip()
+    results = get_index(model).search(q, limit=20) if q else []
+    return JsonResponse({"results": [{"id": pk, "text": name} for pk, name in results]})
+
+
+@require_GET
+def ingredient_autocomplete(request):
+    return _autocomplete(request, Ingredient)
+
+
+@require_GET
+def tag_autocomplete(request):
+    return _autocomplete(request, Tag)
+
+
+# Export (same JSON shape import_recipes reads)
+@login_required
+@require_GET
+def recipe_export(request):
+    fmt = request.GET.get("format", "json")
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("format must be json or ndjson")
+    compress = request.GET.get("gzip") == "1"
+    filename = f"recipes.{fmt}" + (".gz" if compress else "")
+    stream = aexport_stream if isinstance(request, ASGIRequest) else export_stream
+    response = StreamingHttpResponse(
+        stream(fmt=fmt, compress=compress),
+        content_type="application/gzip" if compress else EXPORT_FORMATS[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+# JSON API (read-only; same search and ordering as recipe_list)
+def _api_error(message, status=400):
+    return JsonResponse({"error": message}, status=status)
+
+
+@require_GET
+@replica_reads
+@query_budget(4)
+async def api_recipe_list(request):
+    try:
+        fields = api.parse_fields(request.GET.get("fields"))
+        limit = api.parse_limit(request.GET.get("limit"))
+    except ValueError as e:
+        return _api_error(str(e))
+    q = (request.GET.get("q") or "").strip()
+    qs = Recipe.objects.order_by("-id")
+    if q:
+        qs = await sync_to_async(search_recipes)(qs, q)
+    data = await api.arecipe_page(
+        qs,
+        fields,
+        limit,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
+    return api.json_response(request, data)
+
+
+@require_GET
+@replica_reads
+@query_budget(3)
+async def api_recipe_detail(request, pk):
+    try:
+        fields = api.parse_fields(request.GET.get("fields"))
+    except ValueError as e:
+        return _api_error(str(e))
+    queryset = Recipe.objects.filter(pk=pk)
+    rows = [row async for row in api.recipe_values(queryset, fields)]
+    if not rows:
+        return _api_error("Not found.", status=404)
+    items = await api.aserialize(rows, fields, queryset.db)
+    return api.json_response(request, items[0])
+
+
+@require_GET
+def api_search_cache_stats(request):
+    """Hit/miss counters of this process's search result cache."""
+    return JsonResponse(searchcache.results.stats())
+
+
+# Basic auth requests can't be forged by another site, so only session
+# requests are held to the CSRF check, answered in JSON like the rest.
+@csrf_exempt
+@require_POST
+def api_recipe_batch(request):
+    """Create/update many recipes (import_recipes JSON shape) in one request."""
+    sent, user = api.basic_auth_user(request)
+    if not sent and request.user.is_authenticated:
+        csrf = CsrfViewMiddleware(lambda request: None)
+        if csrf.process_view(request, None, (), {}) is not None:
+            return _api_error("CSRF token missing or incorrect", 403)
+        user = request.user
+    if user is None:
+        response = _api_error("authentication required", 401)
+        response["WWW-Authenticate"] = 'Basic realm="recipes"'
+        return response
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return _api_error("body must be JSON")
+    try:
+        raw_items = api.batch_items(payload)
+    except ValueError as e:
+        return _api_error(str(e))
+    result = api.write_batch(raw_items, user, update=request.GET.get("update") == "1")
+    return JsonResponse(result)
@@ -0,0 +1,66 @@
+from django import forms
+from django.urls import reverse
+
+
+class AutocompleteMixin:
+    """
+    Select widgets that only render the selected option(s).
+
+    The rest of the choices are fetched by the browser from a JSON
+    autocomplete endpoint (Select2 ``ajax`` mode, see base.html), so the
+    page size no longer grows with the size of the lookup table.
+    """
+
+    def __init__(self, url_name, attrs=None):
+        self.url_name = url_name
+        super().__init__(attrs)
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["attrs"]["data-autocomplete-url"] = reverse(self.url_name)
+        return context
+
+    def selected_choices(self, values):
+        # self.choices is the field's ModelChoiceIterator.
+        field = self.choices.field
+        snapshot = getattr(self.choices, "snapshot", None)
+        labels = snapshot.labels if snapshot is not None else {}
+        found = [(v, labels[v]) for v in values if v in labels]
+        missing = [v for v in values if v not in labels]
+        if missing:
+            objs = field.queryset.filter(pk__in=missing)
+            found += [(obj.pk, field.label_from_instance(obj)) for obj in objs]
+        return found
+
+    def optgroups(self, name, value, attrs=None):
+        values = [str(v) for v in value if v not in (None, "")]
+        options = []
+        empty_label = getattr(self.choices.field, "empty_label", None)
+        if not self.allow_multiple_selected and empty_label is not None:
+            options.append(("", empty_label))
+        if values:
+            options.extend(self.selected_choices(values))
+
+        groups = []
+        for index, (option_value, label) in enumerate(options):
+            selected = str(option_value) in values
+            groups.append(
+                (
+                    None,
+                    [
+                        self.create_option(
+                            name, option_value, label, selected, index, attrs=attrs
+                        )
+                    ],
+                    index,
+                )
+            )
+        return groups
+
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, forms.SelectMultiple):
+    pass